@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Индекс активных игроков в памяти для быстрого поиска.
+
+Пользователи разложены по корзинам по минуте последней активности. Отметка
+активности переносит пользователя в текущую корзину, устаревшие корзины
+выбрасываются целиком. Запрос «активные, кроме меня» обходит только живые
+корзины, то есть стоит O(k) от числа активных, и не трогает базу.
+"""
+import threading
+import time
+from datetime import datetime
+
+import storage
+
+
+class ActiveIndex:
+    """Кольцо минутных корзин: {номер корзины: set(user_id)}."""
+
+    def __init__(self, window_seconds=600, bucket_seconds=60):
+        self.window_seconds = window_seconds  # «Активен» = был в сети за это время
+        self.bucket_seconds = bucket_seconds
+        self._last = {}       # {user_id: время последней активности (epoch)}
+        self._bucket_of = {}  # {user_id: номер корзины}
+        self._buckets = {}    # {номер корзины: set(user_id)}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._last)
+
+    def touch(self, user_id, when=None):
+        """Отмечает активность пользователя (when — datetime или epoch)."""
+        ts = _to_epoch(when) if when is not None else time.time()
+        key = int(ts // self.bucket_seconds)
+        with self._lock:
+            if self._last.get(user_id, 0) > ts:
+                return  # Уже есть более свежая отметка
+            old_key = self._bucket_of.get(user_id)
+            if old_key != key:
+                if old_key is not None:
+                    self._buckets[old_key].discard(user_id)
+                self._buckets.setdefault(key, set()).add(user_id)
+                self._bucket_of[user_id] = key
+            self._last[user_id] = ts
+
+    def last_seen(self, user_id):
+        """Время последней активности (epoch) или None, если пользователя в индексе нет."""
+        with self._lock:
+            return self._last.get(user_id)
+
+    def remove(self, user_id):
+        """Убирает пользователя из индекса (например, после удаления анкеты)."""
+        with self._lock:
+            key = self._bucket_of.pop(user_id, None)
+            if key is not None:
+                self._buckets[key].discard(user_id)
+            self._last.pop(user_id, None)
+
+    def active_except(self, user_id, now=None):
+        """Активные пользователи, кроме user_id, начиная с самых свежих."""
+        now = now if now is not None else time.time()
+        threshold = now - self.window_seconds
+        with self._lock:
+            self._expire(threshold)
+            result = []
+            for key in sorted(self._buckets, reverse=True):
+                bucket = self._buckets[key]
+                if key * self.bucket_seconds >= threshold:
+                    result.extend(bucket)
+                else:
+                    # Крайняя корзина окна попадает в него частично
+                    result.extend(uid for uid in bucket if self._last[uid] >= threshold)
+                    break  # Дальше только еще более старые корзины
+        if user_id in self._bucket_of:
+            try:
+                result.remove(user_id)
+            except ValueError:
+                pass  # Сам пользователь уже вне окна
+        return result
+
+    def _expire(self, threshold):
+        """Выбрасывает корзины, целиком вышедшие из окна."""
+        oldest_live = int(threshold // self.bucket_seconds)
+        for key in [k for k in self._buckets if k < oldest_live]:
+            for uid in self._buckets.pop(key):
+                del self._bucket_of[uid]
+                del self._last[uid]
+
+    def rebuild(self):
+        """Заполняет индекс из таблицы profiles (при запуске бота)."""
+        threshold = datetime.fromtimestamp(time.time() - self.window_seconds)
+        rows = storage.fetchall("SELECT user_id, last_active FROM profiles WHERE last_active >= ?", (threshold,))
+        with self._lock:
+            self._last.clear()
+            self._bucket_of.clear()
+            self._buckets.clear()
+        for user_id, last_active in rows:
+            self.touch(user_id, last_active)
+        return len(rows)
+
+
+def _to_epoch(when):
+    """Приводит datetime, строку из SQLite или число к epoch."""
+    if isinstance(when, (int, float)):
+        return float(when)
+    if isinstance(when, str):
+        when = datetime.fromisoformat(when)
+    return when.timestamp()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Отложенная запись last_active.
+
+update_last_active вызывается почти на каждое сообщение, и раньше каждый вызов
+был отдельным UPDATE + commit. Теперь время активности копится в памяти
+(для каждого пользователя только последнее значение) и сбрасывается в базу
+одной транзакцией executemany: по таймеру, при переполнении буфера и при
+остановке бота.
+"""
+import threading
+from datetime import datetime
+
+import storage
+
+
+class ActivityBuffer:
+    """Буфер последней активности пользователей."""
+
+    def __init__(self, flush_interval=5.0, max_pending=500):
+        self.flush_interval = flush_interval  # Секунды между сбросами
+        self.max_pending = max_pending        # При таком размере сбрасываем досрочно
+        self._pending = {}                    # {user_id: datetime}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.stats = {'touches': 0, 'flushes': 0, 'rows_flushed': 0}
+
+    def touch(self, user_id, when=None):
+        """Запоминает активность пользователя, не трогая базу."""
+        when = when or datetime.now()
+        with self._lock:
+            self._pending[user_id] = when
+            self.stats['touches'] += 1
+            overflow = len(self._pending) >= self.max_pending
+        if overflow:
+            if self._thread is not None:
+                self._wakeup.set()  # Сбросит фоновый поток
+            else:
+                self.flush()
+
+    def last_seen(self, user_id):
+        """Время активности из буфера (None, если его там нет)."""
+        with self._lock:
+            return self._pending.get(user_id)
+
+    def active_since(self, threshold):
+        """Пользователи из буфера, активные не раньше threshold."""
+        with self._lock:
+            return [user_id for user_id, when in self._pending.items() if when >= threshold]
+
+    def flush(self):
+        """Записывает накопленное одной транзакцией. Возвращает число строк."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        try:
+            with storage.transaction():
+                # Не откатываем last_active назад, если save_profile успел записать более свежее
+                storage.executemany("UPDATE profiles SET last_active = ?1 WHERE user_id = ?2 AND (last_active IS NULL OR last_active < ?1)",
+                                    [(when, user_id) for user_id, when in batch.items()])
+        except Exception:
+            # Возвращаем записи в буфер, не затирая более свежие отметки
+            with self._lock:
+                for user_id, when in batch.items():
+                    if self._pending.get(user_id, when) <= when:
+                        self._pending[user_id] = when
+            raise
+        with self._lock:
+            self.stats['flushes'] += 1
+            self.stats['rows_flushed'] += len(batch)
+        return len(batch)
+
+    # --- ФОНОВЫЙ ПОТОК ---
+
+    def start(self):
+        """Запускает периодический сброс в фоновом потоке."""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='activity-flush', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает фоновый поток и делает финальный сброс."""
+        if self._thread is not None:
+            self._stopped.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Не удалось сохранить активность: {e}")
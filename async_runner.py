@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Асинхронный режим запуска: python main.py async
+
+Обновления получает AsyncTeleBot, а обрабатывают их те же обработчики из
+main.py, но конкурентно: каждое обновление выполняется в пуле потоков,
+поэтому медленный ответ Telegram одному пользователю не задерживает
+остальных. Обновления одного пользователя идут строго по очереди (своя
+asyncio.Queue на пользователя), так что шаги регистрации не гоняются друг
+с другом.
+
+Работа с базой при запуске и остановке (миграции, перестройка индексов,
+сохранение сессий) идет в отдельном однопоточном executor. Внутри
+обработчиков запросы остаются синхронными: большая их часть уже обслуживается
+индексами и кэшами в памяти, а запись last_active идет через ActivityBuffer.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.async_telebot import AsyncTeleBot
+
+HANDLER_THREADS = 16  # Сколько обновлений разных пользователей обрабатывается одновременно
+IDLE_SECONDS = 60     # Очередь пользователя закрывается после минуты тишины
+POLL_TIMEOUT = 20
+
+
+def update_user_id(update):
+    """Ключ упорядочивания: id пользователя, от которого пришло обновление."""
+    for event in (update.message, update.edited_message, update.callback_query):
+        if event is not None and event.from_user is not None:
+            return event.from_user.id
+    return ('update', update.update_id)  # Прочие обновления порядка не требуют
+
+
+class UserOrderedDispatcher:
+    """Конкурентная обработка со строгим порядком внутри одного пользователя."""
+
+    def __init__(self, process, executor, idle_seconds=IDLE_SECONDS):
+        self.process = process      # Синхронная функция обработки одного обновления
+        self.executor = executor
+        self.idle_seconds = idle_seconds
+        self._queues = {}           # {user_id: asyncio.Queue}
+        self.stats = {'received': 0, 'handled': 0, 'errors': 0, 'in_flight': 0, 'max_in_flight': 0,
+                      'latency_total': 0.0}
+
+    def submit(self, user_id, update):
+        """Ставит обновление в очередь пользователя (вызывается из event loop)."""
+        queue = self._queues.get(user_id)
+        if queue is None:
+            queue = self._queues[user_id] = asyncio.Queue()
+            asyncio.get_running_loop().create_task(self._drain(user_id, queue))
+        queue.put_nowait((time.monotonic(), update))
+        self.stats['received'] += 1
+
+    async def _drain(self, user_id, queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                received, update = await asyncio.wait_for(queue.get(), self.idle_seconds)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    del self._queues[user_id]
+                    return
+                continue
+            self.stats['in_flight'] += 1
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self.stats['in_flight'])
+            try:
+                await loop.run_in_executor(self.executor, self.process, update)
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"Ошибка обработки обновления {update.update_id}: {e}")
+            finally:
+                self.stats['in_flight'] -= 1
+                self.stats['handled'] += 1
+                self.stats['latency_total'] += time.monotonic() - received
+                queue.task_done()
+
+    async def join(self):
+        """Ждет, пока будут обработаны все принятые обновления."""
+        await asyncio.gather(*(queue.join() for queue in list(self._queues.values())))
+
+
+async def _poll(async_bot, dispatcher):
+    offset = None
+    while True:
+        try:
+            updates = await async_bot.get_updates(offset=offset, timeout=POLL_TIMEOUT)
+        except Exception as e:
+            print(f"Ошибка получения обновлений: {e}")
+            await asyncio.sleep(3)
+            continue
+        for update in updates:
+            offset = update.update_id + 1
+            dispatcher.submit(update_user_id(update), update)
+
+
+async def _main(app, handler_threads):
+    loop = asyncio.get_running_loop()
+    db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db')
+    handler_executor = ThreadPoolExecutor(max_workers=handler_threads, thread_name_prefix='handler')
+    await loop.run_in_executor(db_executor, app.startup)
+
+    app.bot.threaded = False  # Обработчики выполняются прямо в потоках handler_executor
+    dispatcher = UserOrderedDispatcher(lambda update: app.bot.process_new_updates([update]), handler_executor)
+    async_bot = AsyncTeleBot(app.TOKEN)
+    print(f"Бот запускается (async, потоков обработки: {handler_threads})...")
+    started = time.monotonic()
+    try:
+        await _poll(async_bot, dispatcher)
+    finally:
+        await dispatcher.join()
+        await async_bot.close_session()
+        handler_executor.shutdown()
+        await loop.run_in_executor(db_executor, app.shutdown)
+        db_executor.shutdown()
+        elapsed = time.monotonic() - started
+        stats = dispatcher.stats
+        average = stats['latency_total'] / stats['handled'] if stats['handled'] else 0.0
+        print(f"Обработано обновлений: {stats['handled']} за {elapsed:.0f} с "
+              f"({stats['handled'] / elapsed if elapsed else 0:.1f}/с), средняя задержка {average * 1000:.0f} мс, "
+              f"ошибок {stats['errors']}, максимум одновременно {stats['max_in_flight']}.")
+
+
+def run(app, handler_threads=HANDLER_THREADS):
+    """Запускает бота в асинхронном режиме. app — модуль main с обработчиками."""
+    try:
+        asyncio.run(_main(app, handler_threads))
+    except KeyboardInterrupt:
+        pass
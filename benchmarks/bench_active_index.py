@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Сравнение быстрого поиска: SQL-запрос по last_active против ActiveIndex.
+
+Запуск: python benchmarks/bench_active_index.py [--sizes 100000 1000000]
+База создается во временном файле и удаляется после прогона.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+import storage  # noqa: E402
+from active_index import ActiveIndex  # noqa: E402
+
+ACTIVE_SHARE = 0.02  # Доля профилей, активных за последние 10 минут
+
+
+def seed(n):
+    """Заполняет базу n профилями; ~2% из них активны в окне поиска."""
+    now = datetime.now()
+    rows = []
+    for user_id in range(1, n + 1):
+        if random.random() < ACTIVE_SHARE:
+            seen = now - timedelta(seconds=random.uniform(0, 590))
+        else:
+            seen = now - timedelta(minutes=random.uniform(11, 60 * 24 * 30))
+        rows.append((user_id, f"player{user_id}", seen))
+    with storage.transaction():
+        storage.executemany("INSERT INTO profiles (user_id, nickname, last_active) VALUES (?, ?, ?)", rows)
+
+
+def bench(label, fn, repeat):
+    fn()  # Прогрев
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<12} {elapsed * 1000:9.3f} мс/запрос  ({len(result)} найдено)")
+    return elapsed
+
+
+def run(n, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DB_PATH = os.path.join(tmp, 'bench.db')
+        storage.close_all()
+        migrations.migrate()
+        seed(n)
+        index = ActiveIndex(window_seconds=600)
+        start = time.perf_counter()
+        index.rebuild()
+        print(f"{n} профилей, индекс построен за {(time.perf_counter() - start) * 1000:.1f} мс")
+
+        def sql_query():
+            threshold = datetime.now() - timedelta(minutes=10)
+            rows = storage.fetchall("SELECT user_id FROM profiles WHERE user_id != ? AND last_active >= ?", (1, threshold))
+            return [row[0] for row in rows]
+
+        sql = bench("SQL", sql_query, repeat)
+        mem = bench("ActiveIndex", lambda: index.active_except(1), repeat)
+        print(f"  ускорение: x{sql / mem:.1f}")
+        storage.close_all()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    random.seed(42)
+    for size in args.sizes:
+        run(size, args.repeat)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Проверка Outbox против локального фейкового Bot API.
+
+Ставит в очередь всплеск сообщений в много чатов с разными приоритетами,
+фейковый API часть вызовов отклоняет с 429. Затем проверяется, что:
+- общий и початовый лимиты соблюдены;
+- порядок сообщений внутри каждого чата не нарушен;
+- все сообщения в итоге доставлены, а важные ждут в очереди меньше.
+
+Запуск: python benchmarks/bench_outbox.py [--messages 600 --chats 60]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telebot  # noqa: E402
+
+import outbox as outbox_module  # noqa: E402
+from fake_bot_api import FakeBotApi  # noqa: E402
+from outbox import Outbox, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW  # noqa: E402
+
+
+def max_in_window(times, window):
+    """Наибольшее число событий в любом окне длиной window секунд."""
+    best, start = 0, 0
+    for end in range(len(times)):
+        while times[end] - times[start] > window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=600)
+    parser.add_argument('--chats', type=int, default=60)
+    parser.add_argument('--global-rate', type=float, default=100.0)
+    parser.add_argument('--chat-rate', type=float, default=5.0)
+    parser.add_argument('--rate-limit-every', type=int, default=50, help='каждый N-й вызов получает 429')
+    args = parser.parse_args()
+
+    api = FakeBotApi(rate_limit_every=args.rate_limit_every, retry_after=1, latency=0.005).start().install()
+    bot = telebot.TeleBot('1:bench', threaded=False)
+    box = Outbox(bot, workers=8, global_rate=args.global_rate, chat_rate=args.chat_rate,
+                 chat_burst=outbox_module.CHAT_BURST).start()
+
+    random.seed(1)
+    priorities = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+    expected = defaultdict(list)
+    futures = []
+    started = time.monotonic()
+    for i in range(args.messages):
+        chat_id = 100 + random.randrange(args.chats)
+        expected[chat_id].append(f"m{i}")
+        # Приоритет задан по чату: у трети чатов только важные сообщения (мэтчи, карточки)
+        futures.append(box.send_message(chat_id, f"m{i}", priority=priorities[chat_id % 3]))
+    for future in futures:
+        future.result(timeout=120)
+    elapsed = time.monotonic() - started
+    box.stop()
+
+    delivered = [entry for entry in api.log if entry[1] == 'sendMessage']
+    times = [t for t, _, _ in delivered]
+    per_chat = defaultdict(list)
+    for t, _, chat_id in delivered:
+        per_chat[int(chat_id)].append(t)
+    global_peak = max_in_window(times, 1.0)
+    chat_peak = max(max_in_window(ts, 1.0) for ts in per_chat.values())
+    ordered = all(
+        [future.result().text for future in futures if future.result().chat.id == chat_id] == texts
+        for chat_id, texts in expected.items())
+
+    metrics = box.get_metrics()
+    print(f"Доставлено {len(delivered)}/{args.messages} за {elapsed:.1f} с, ответов 429: {api.rate_limited}")
+    print(f"Пик за 1 с: бот {global_peak} (лимит {args.global_rate:.0f} + всплеск {outbox_module.GLOBAL_BURST}), "
+          f"чат {chat_peak} (лимит {args.chat_rate:.0f} + всплеск {outbox_module.CHAT_BURST})")
+    print(f"Порядок внутри чатов {'сохранен' if ordered else 'НАРУШЕН'}")
+    print(f"Метрики Outbox: {metrics}")
+    api.stop()
+    ok = (len(delivered) == args.messages and ordered
+          and global_peak <= args.global_rate + outbox_module.GLOBAL_BURST and chat_peak <= args.chat_rate + outbox_module.CHAT_BURST)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Микробенчмарк ранжирования кандидатов и проверка паритета NumPy / Python.
+
+Запуск: python benchmarks/bench_ranking.py [--size 1000000] [--parity 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ranking  # noqa: E402
+from profile_fields import LINES, RANKS, MYTHIC_RANKS, GOALS, MYTHIC  # noqa: E402
+
+
+def random_profile(now):
+    rank = random.choice(RANKS)
+    return {
+        'line': random.choice(LINES),
+        'rank': rank,
+        'mythic_rank': random.choice(MYTHIC_RANKS) if rank == MYTHIC else None,
+        'goal': random.choice(GOALS),
+        'winrate': random.randint(30, 80),
+        'last_active': now - random.expovariate(1 / 3600),
+    }
+
+
+def fill(columns, profiles):
+    for user_id, profile in enumerate(profiles, start=1):
+        columns.add(user_id, profile)
+
+
+def timed(fn, repeat):
+    fn()  # Прогрев
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def check_parity(profiles, now):
+    """Сравнивает оценки и порядок NumPy и чистого Python на одних данных."""
+    fast = ranking.ProfileColumns(use_numpy=True)
+    slow = ranking.ProfileColumns(use_numpy=False)
+    fill(fast, profiles)
+    fill(slow, profiles)
+    ids = list(range(2, len(profiles) + 1))
+    _, fast_rows = fast.rows_for(ids)
+    _, slow_rows = slow.rows_for(ids)
+    fast_scores = fast.score_rows(1, fast_rows, now=now)
+    slow_scores = slow.score_rows(1, slow_rows, now=now)
+    max_diff = max(abs(float(a) - b) for a, b in zip(fast_scores, slow_scores))
+    top_fast = fast.rank(1, ids, now=now)[:100]
+    top_slow = slow.rank(1, ids, now=now)[:100]
+    # Порядок может отличаться только у кандидатов с (почти) равной оценкой
+    by_id = dict(zip(ids, slow_scores))
+    same = all(abs(by_id[a] - by_id[b]) < 1e-4 for a, b in zip(top_fast, top_slow))
+    print(f"Паритет на {len(ids)} кандидатах: макс. расхождение оценки {max_diff:.2e}, топ-100 {'совпадает' if same else 'РАЗЛИЧАЕТСЯ'}")
+    if max_diff > 1e-4 or not same:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=1_000_000)
+    parser.add_argument('--parity', type=int, default=20_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    if ranking.np is None:
+        sys.exit("NumPy не установлен: pip install numpy")
+
+    random.seed(7)
+    now = time.time()
+    check_parity([random_profile(now) for _ in range(args.parity)], now)
+
+    columns = ranking.ProfileColumns(capacity=args.size + 1)
+    fill(columns, [random_profile(now) for _ in range(args.size)])
+    ids = list(range(2, args.size + 1))
+    _, rows = columns.rows_for(ids)
+    print(f"{len(ids)} кандидатов:")
+    print(f"  оценка (векторный проход)     {timed(lambda: columns.score_rows(1, rows, now=now), args.repeat):8.1f} мс")
+    print(f"  оценка + сортировка           {timed(lambda: ranking.np.argsort(-columns.score_rows(1, rows, now=now)), args.repeat):8.1f} мс")
+    print(f"  rank() по списку user_id      {timed(lambda: columns.rank(1, ids, now=now), max(1, args.repeat // 4)):8.1f} мс")
+    slow = ranking.ProfileColumns(use_numpy=False)
+    sample = 100_000
+    fill(slow, [random_profile(now) for _ in range(sample)])
+    _, slow_rows = slow.rows_for(range(2, sample + 1))
+    per_million = timed(lambda: slow.score_rows(1, slow_rows, now=now), 1) * args.size / sample
+    print(f"  чистый Python (оценка)       ~{per_million:8.1f} мс (экстраполяция с {sample})")
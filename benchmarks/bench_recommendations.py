@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""Пакетный расчет рекомендаций на синтетическом графе лайков: время и память.
+
+Пользователи разбиты на сообщества и лайкают в основном анкеты своего
+сообщества (популярные — чаще). Сначала полный пересчет, затем добавляется
+небольшая доля новых лайков и запускается инкрементальный. Задача
+запускается отдельным процессом, как в работе (python recommendations.py),
+поэтому ее пиковая память меряется без данных самого бенчмарка. Качество
+проверяется долей рекомендаций из своего сообщества (у случайных — 1/число
+сообществ).
+
+Запуск: python benchmarks/bench_recommendations.py [--likes 1000000 --users 100000]
+База создается во временном файле и удаляется после прогона.
+"""
+import argparse
+import ast
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import migrations  # noqa: E402
+import recommendations  # noqa: E402
+import storage  # noqa: E402
+
+COMMUNITY = 1000      # Пользователей в сообществе
+OWN_SHARE = 0.8       # Доля лайков внутри своего сообщества
+
+
+def random_likes(count, users):
+    """count пар (кто, кого) без повторов и лайков самому себе."""
+    communities = max(1, users // COMMUNITY)
+    pairs = set()
+    while len(pairs) < count:
+        liker = random.randrange(users)
+        if random.random() < OWN_SHARE:
+            community = liker // COMMUNITY % communities
+        else:
+            community = random.randrange(communities)
+        # Внутри сообщества популярность по Парето: первые анкеты лайкают чаще
+        liked = community * COMMUNITY + min(COMMUNITY - 1, int(random.paretovariate(1.2)) - 1)
+        if liked != liker and liked < users:
+            pairs.add((liker, liked))
+    return list(pairs)
+
+
+def insert_likes(pairs):
+    with storage.transaction():
+        storage.executemany("INSERT OR IGNORE INTO likes (liker_id, liked_id) VALUES (?, ?)", pairs)
+
+
+# Запуск задачи как python recommendations.py с печатью пикового RSS в конце. VmHWM считается
+# с момента exec, а ru_maxrss дочернего процесса унаследовал бы память бенчмарка после fork.
+# Каталог скрипта добавляется в sys.path, как при обычном запуске: run_path этого не делает
+JOB = """
+import os, runpy, sys
+sys.argv = sys.argv[1:]
+sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[0])))
+runpy.run_path(sys.argv[0], run_name='__main__')
+print('VmHWM', [line.split()[1] for line in open('/proc/self/status') if line.startswith('VmHWM')][0])
+"""
+
+
+def run_job(*flags):
+    """Запускает задачу отдельным процессом: статистика, время, пиковый RSS (байты)."""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', JOB, os.path.join(ROOT, 'recommendations.py'), *flags],
+                            capture_output=True, text=True, env=dict(os.environ, DB_PATH=storage.DB_PATH))
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        sys.exit(f"Задача завершилась с ошибкой:\n{result.stdout}{result.stderr}")
+    stats = ast.literal_eval(result.stdout.split('Рекомендации: ', 1)[1].splitlines()[0])
+    peak_kb = int(result.stdout.rsplit('VmHWM ', 1)[1])
+    return stats, elapsed, peak_kb * 1024
+
+
+def community_share(users, top=10):
+    """Доля рекомендаций (первые top в очереди) из сообщества самого пользователя."""
+    communities = max(1, users // COMMUNITY)
+    hits = total = 0
+    for user_id, blob in storage.fetchall("SELECT user_id, candidates FROM recommendations LIMIT 5000"):
+        for candidate in recommendations.array('q', blob)[:top]:
+            hits += candidate // COMMUNITY % communities == user_id // COMMUNITY % communities
+            total += 1
+    return hits / total if total else 0.0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--likes', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--new-share', type=float, default=0.01, help='доля новых лайков для инкрементального прогона')
+    args = parser.parse_args()
+    if recommendations.np is None:
+        sys.exit("NumPy не установлен: pip install numpy")
+
+    random.seed(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DB_PATH = os.path.join(tmp, 'bench.db')
+        storage.close_all()
+        migrations.migrate()
+        pairs = random_likes(args.likes + int(args.likes * args.new_share), args.users)
+        insert_likes(pairs[:args.likes])
+        print(f"{args.likes} лайков, {args.users} пользователей")
+
+        storage.close_all()
+        stats, elapsed, peak = run_job('--full')
+        print(f"  полный пересчет:        {elapsed:7.2f} с (расчет {stats['seconds']} с), пиковый RSS {peak / 2**20:6.1f} МБ, "
+              f"матрица {stats['matrix_bytes'] / 2**20:.1f} МБ, очередей {stats['recomputed']}")
+
+        insert_likes(pairs[args.likes:])
+        storage.close_all()
+        stats, elapsed, peak = run_job()
+        print(f"  инкрементальный (+{len(pairs) - args.likes} лайков): {elapsed:5.2f} с (расчет {stats['seconds']} с), пиковый RSS {peak / 2**20:6.1f} МБ, "
+              f"очередей {stats['recomputed']}")
+
+        print(f"  рекомендаций из своего сообщества: {community_share(args.users):.0%} "
+              f"(у случайных ~{1 / max(1, args.users // COMMUNITY):.0%})")
+        storage.close_all()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""CPU на подготовку одного сообщения: клавиатура + подпись карточки, до и после кэширования.
+
+«До» — как было: новый ReplyKeyboardMarkup на каждое сообщение, его to_json()
+в telebot и format_profile на каждый показ. «После» — готовые клавиатуры
+(FrozenMarkup) и render_caption с кэшем подписей.
+
+Запуск: python benchmarks/bench_render.py [--repeat 100000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TOKEN', '1:bench')
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench_render.db')
+
+from telebot import apihelper, types  # noqa: E402
+
+import main  # noqa: E402
+
+PROFILE = {'user_id': 42, 'telegram_username': 'player42', 'nickname': 'Игрок 42', 'winrate': 61, 'line': 'Лес',
+           'rank': 'Мифический', 'mythic_rank': 'Мифическая слава', 'goal': 'Найти постоянную команду',
+           'about': 'Играю по вечерам, люблю танков', 'photo_id': 'photo-42', 'last_active': None}
+
+
+def old_search_keyboard():
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.add("❤️ Нравится", "👎 Следующий", "⏹️ Завершить поиск")
+    return markup
+
+
+def old_main_menu_keyboard():
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.row("🚀 Быстрый поиск", "⚙️ Поиск тиммейта")
+    markup.row("👤 Моя анкета", "❤️ Понравился")
+    return markup
+
+
+def per_call_us(fn, repeat):
+    fn()
+    return timeit.timeit(fn, number=repeat) / repeat * 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=100_000)
+    args = parser.parse_args()
+
+    cases = [
+        ("меню (ReplyKeyboardMarkup)",
+         lambda: apihelper._convert_markup(old_main_menu_keyboard()),
+         lambda: apihelper._convert_markup(main.create_main_menu_keyboard())),
+        ("карточка поиска: клавиатура + подпись",
+         lambda: (apihelper._convert_markup(old_search_keyboard()), main.format_profile(PROFILE)),
+         lambda: (apihelper._convert_markup(main.create_search_keyboard()), main.render_caption(PROFILE))),
+    ]
+    print(f"{'':40} {'до, мкс':>9} {'после, мкс':>11} {'ускорение':>10}")
+    for label, before, after in cases:
+        old, new = per_call_us(before, args.repeat), per_call_us(after, args.repeat)
+        print(f"{label:40} {old:9.2f} {new:11.2f} {old / new:9.1f}x")
+    sizes = (len(old_search_keyboard().to_json().encode()), len(main.create_search_keyboard().to_json().encode()))
+    print(f"JSON клавиатуры поиска: {sizes[0]} → {sizes[1]} байт (UTF-8 вместо \\uXXXX)")
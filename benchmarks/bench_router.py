@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Стоимость маршрутизации сообщения: цепочка лямбд telebot против Router.
+
+Для каждого числа кнопок собираются два бота без сети: в первом каждая кнопка —
+отдельный @message_handler(func=lambda ...), во втором — один обработчик
+Router. Сообщение с текстом последней кнопки (худший случай для цепочки)
+прогоняется через process_new_messages.
+
+Запуск: python benchmarks/bench_router.py [--buttons 15 50 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telebot  # noqa: E402
+from telebot import types  # noqa: E402
+
+from router import Router  # noqa: E402
+
+
+def make_message(text):
+    return types.Message.de_json({
+        'message_id': 1, 'date': 0, 'text': text,
+        'chat': {'id': 1, 'type': 'private'},
+        'from': {'id': 1, 'is_bot': False, 'first_name': 'u'},
+    })
+
+
+def linear_bot(texts, sink):
+    bot = telebot.TeleBot('1:bench', threaded=False)
+    for text in texts:
+        bot.register_message_handler(sink, func=lambda message, text=text: message.text == text)
+    bot.register_message_handler(sink, func=lambda message: True)
+    return bot
+
+
+def router_bot(texts, sink):
+    bot = telebot.TeleBot('1:bench', threaded=False)
+    router = Router().attach(bot)
+    router.text(*texts)(sink)
+    router.default(sink)
+    return bot, router
+
+
+def measure(bot, message, repeat):
+    for _ in range(100):  # Прогрев
+        bot.process_new_messages([message])
+    start = time.perf_counter()
+    for _ in range(repeat):
+        bot.process_new_messages([message])
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--buttons', type=int, nargs='+', default=[15, 50, 200])
+    parser.add_argument('--repeat', type=int, default=20_000)
+    args = parser.parse_args()
+
+    def sink(message):
+        pass
+
+    print(f"{'кнопок':>7} {'лямбды, мкс':>12} {'Router, мкс':>12}")
+    for n in args.buttons:
+        texts = [f"Кнопка {i}" for i in range(n)]
+        message = make_message(texts[-1])
+        linear = measure(linear_bot(texts, sink), message, args.repeat)
+        bot, router = router_bot(texts, sink)
+        routed = measure(bot, message, args.repeat)
+        print(f"{n:>7} {linear:>12.2f} {routed:>12.2f}")
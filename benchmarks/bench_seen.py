@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Фильтр просмотренных анкет: память на пользователя и доля ложных срабатываний.
+
+Пространство id — 1M анкет. Пользователь просматривает случайные анкеты,
+затем проверяются анкеты, которых он не видел: доля «уже видел» среди них —
+ложные срабатывания. Для сравнения — память множества Python и простой
+битовой карты на все 1M id.
+
+Запуск: python benchmarks/bench_seen.py [--profiles 1000000 --probes 200000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import seen  # noqa: E402
+
+
+def false_positive_rate(seen_filter, viewed, profiles, probes):
+    hits = checked = 0
+    while checked < probes:
+        candidate = random.randrange(1, profiles + 1)
+        if candidate in viewed:
+            continue
+        checked += 1
+        hits += candidate in seen_filter
+    return hits / probes
+
+
+def set_bytes(ids):
+    return sys.getsizeof(ids) + sum(sys.getsizeof(i) for i in ids)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', type=int, default=1_000_000)
+    parser.add_argument('--probes', type=int, default=200_000)
+    args = parser.parse_args()
+    random.seed(7)
+
+    print(f"CAPACITY={seen.CAPACITY}, ERROR_RATE={seen.ERROR_RATE}: {seen.BITS} бит ({seen.BITS // 8} байт) на поколение, "
+          f"{seen.HASHES} хешей; анкет в пространстве id: {args.profiles}")
+    print(f"{'просмотрено':>12} {'поколений':>10} {'байт в памяти':>14} {'байт в базе':>12} {'ложных':>8} {'set()':>10}")
+    for viewed_count in (100, 500, 1000, 1500, 2000):
+        seen_filter = seen.SeenFilter()
+        viewed = set()
+        while len(viewed) < viewed_count:
+            viewed.add(random.randrange(1, args.profiles + 1))
+        for profile_id in viewed:
+            seen_filter.add(profile_id)
+        generations = 1 + (seen_filter.previous is not None)
+        missed = sum(profile_id not in seen_filter for profile_id in viewed)
+        rate = false_positive_rate(seen_filter, viewed, args.profiles, args.probes)
+        # После смены поколения первые анкеты забываются — это ожидаемо, а не ложный пропуск
+        note = f"  (забыто при смене поколения: {missed})" if missed else ""
+        print(f"{viewed_count:>12} {generations:>10} {seen_filter.nbytes():>14} {len(seen_filter.to_bytes()):>12} "
+              f"{rate:>8.2%} {set_bytes(viewed):>10}{note}")
+    print(f"Битовая карта на все id: {args.profiles // 8} байт на пользователя")
+
+    seen_filter = seen.SeenFilter()
+    for _ in range(seen.CAPACITY - 1):
+        seen_filter.add(random.randrange(1, args.profiles + 1))
+    candidates = [random.randrange(1, args.profiles + 1) for _ in range(10_000)]
+    store = seen.SeenStore()
+    store._filters[1] = seen_filter
+    started = time.perf_counter()
+    fresh = store.exclude(1, candidates)
+    elapsed = time.perf_counter() - started
+    print(f"exclude() по {len(candidates)} кандидатам (заполненный фильтр): {elapsed * 1000:.1f} мс, "
+          f"отсеяно {len(candidates) - len(fresh)}")
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Листание анкет: исходящие вызовы Bot API и байты на свайп.
+
+Настоящие обработчики main.py листают одну и ту же выдачу быстрого поиска
+дважды: «до» — клавиатура поиска уходит с каждой карточкой, «после» — только с
+первой карточкой сессии (дальше пользователь нажимает кнопки этой же
+клавиатуры, и она остается на экране). Фейковый Bot API считает вызовы и байты.
+
+Запуск: python benchmarks/bench_swipe.py [--swipes 200 --photo-share 0.8]
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TOKEN', '1:bench')
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench_swipe.db')
+
+from telebot import types  # noqa: E402
+
+from fake_bot_api import FakeBotApi  # noqa: E402
+import main  # noqa: E402
+from profile_fields import LINES, RANKS, GOALS  # noqa: E402
+
+SEARCHER_ID = 1
+_update_ids = itertools.count(1)
+_show_next = main.show_next_profile_in_search
+
+
+def seed(count, photo_share):
+    random.seed(7)
+    for user_id in range(1000, 1000 + count + 1):
+        main.save_profile(user_id, {
+            'telegram_username': f'player{user_id}', 'nickname': f'Игрок {user_id}',
+            'winrate': random.randint(40, 70), 'line': random.choice(LINES), 'rank': random.choice(RANKS),
+            'goal': random.choice(GOALS), 'about': 'Играю по вечерам',
+            'photo_id': f'photo-{user_id}' if random.random() < photo_share else None,
+        })
+    main.save_profile(SEARCHER_ID, {'nickname': 'Ищущий', 'winrate': 55, 'line': LINES[0], 'rank': RANKS[3], 'goal': GOALS[0]})
+
+
+def send_text(text):
+    message = {'message_id': next(_update_ids), 'date': 0, 'chat': {'id': SEARCHER_ID, 'type': 'private'},
+               'from': {'id': SEARCHER_ID, 'is_bot': False, 'first_name': 'bench'}, 'text': text}
+    main.bot.process_new_updates([types.Update.de_json({'update_id': next(_update_ids), 'message': message})])
+
+
+def keyboard_every_card(user_id, is_liked_by_flow=False, keyboard_shown=False):
+    """Прежнее поведение: клавиатура с каждой карточкой."""
+    return _show_next(user_id, is_liked_by_flow)
+
+
+def run(api, keyboard_each_time, swipes):
+    main.show_next_profile_in_search = keyboard_every_card if keyboard_each_time else _show_next
+    main.search_sessions.pop(SEARCHER_ID, None)
+    main.seen_profiles.forget(SEARCHER_ID)  # Иначе второй прогон не найдет анкет: все уже просмотрены первым
+    send_text("🚀 Быстрый поиск")
+    api.reset()  # Считаем только свайпы, без первой карточки
+    for i in range(swipes):
+        send_text("❤️ Нравится" if i % 4 == 0 else "👎 Следующий")  # Каждая четвертая анкета — лайк
+    main.show_next_profile_in_search = _show_next
+    return api.summary()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--swipes', type=int, default=200)
+    parser.add_argument('--photo-share', type=float, default=0.8, help='доля анкет с фото')
+    args = parser.parse_args()
+
+    api = FakeBotApi().start().install()
+    main.bot.threaded = False
+    main.init_db()
+    seed(args.swipes + 10, args.photo_share)
+
+    results = {}
+    for label, keyboard_each_time in (('до', True), ('после', False)):
+        results[label] = result = run(api, keyboard_each_time, args.swipes)
+        print(f"{label:>6}: вызовов {result['total_calls']:5d} ({result['total_calls'] / args.swipes:.2f} на свайп), "
+              f"байт {result['bytes_in']:8d} ({result['bytes_in'] / args.swipes:.0f} на свайп), "
+              f"по методам {result['calls']}")
+    print(f"Байт на свайп после/до: {results['после']['bytes_in'] / results['до']['bytes_in']:.2f}")
+    api.stop()
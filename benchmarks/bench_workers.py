@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Масштабирование режима workers: пропускная способность на 1..N процессах.
+
+Одна и та же заранее сгенерированная последовательность обновлений (поиск,
+свайпы, лайки, «❤️ Понравился», своя анкета, регистрация новичков) подается в
+Supervisor с 1, 2, ..., N рабочими процессами. Каждый прогон начинается с
+копии одной и той же засеянной базы. Время — от первого обновления до
+остановки всех процессов (очереди разобраны, исходящие отправлены).
+
+В каждом процессе свой фейковый Bot API (benchmarks/fake_bot_api.py), чтобы
+общий HTTP-сервер не стал узким местом, а лимиты Outbox сняты: синтетические
+пользователи пишут намного чаще раза в секунду.
+
+Ускорение ограничено числом ядер: на машине с одним ядром процессы только
+делят его между собой.
+
+Запуск: python benchmarks/bench_workers.py [--max-workers 4 --profiles 10000 --likes 50000 --users 400 --updates 8000]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+os.environ.setdefault('TOKEN', '1:bench')
+os.environ['STORAGE_BACKEND'] = 'sqlite'  # Процессы делят одну базу — нужен файл
+os.environ['RETENTION_INTERVAL'] = '0'
+os.environ.pop('METRICS_PORT', None)
+
+ACTIONS = {'next': 0.45, 'like': 0.25, 'search': 0.12, 'liked_by': 0.06, 'profile': 0.06, 'stop': 0.06}
+TEXTS = {'next': "👎 Следующий", 'like': "❤️ Нравится", 'search': "🚀 Быстрый поиск", 'liked_by': "❤️ Понравился",
+         'profile': "👤 Моя анкета", 'stop': "⏹️ Завершить поиск"}
+NEW_USERS_SHARE = 0.1
+ACTIVE_SHARE = 0.3
+
+
+def init_worker(app):
+    """Выполняется в каждом рабочем процессе до startup(): свой фейковый Bot API и Outbox без лимитов."""
+    from fake_bot_api import FakeBotApi
+    from outbox import Outbox
+
+    app.fake_api = FakeBotApi().start().install()
+    app.outbox = Outbox(app.bot, global_rate=1e9, chat_rate=1e9, chat_burst=10 ** 9)
+
+
+# --- ДАННЫЕ ---
+
+def seed(path, profiles, like_count):
+    import likes
+    import main
+    import migrations
+    import storage
+    from profile_fields import LINES, RANKS, MYTHIC_RANKS, GOALS, MYTHIC
+
+    storage.DB_PATH = path
+    migrations.migrate()
+    now = datetime.now()
+    rows = []
+    for user_id in range(1, profiles + 1):
+        rank = random.choice(RANKS)
+        seen_at = now - (timedelta(seconds=random.uniform(0, 300)) if random.random() < ACTIVE_SHARE
+                         else timedelta(hours=random.uniform(1, 24 * 14)))
+        rows.append((user_id, f'player{user_id}', f'Игрок {user_id}', random.randint(35, 75), random.choice(LINES), rank,
+                     random.choice(MYTHIC_RANKS) if rank == MYTHIC else None, random.choice(GOALS), 'Играю по вечерам',
+                     f'photo-{user_id}' if random.random() < 0.7 else None, seen_at))
+    with storage.transaction():
+        storage.executemany(f"INSERT INTO profiles ({main._PROFILE_COLUMNS}) VALUES ({', '.join('?' * len(main.PROFILE_KEYS))})", rows)
+    pairs = set()
+    while len(pairs) < like_count:
+        liker, liked = random.randint(1, profiles), random.randint(1, profiles)
+        if liker != liked:
+            pairs.add((liker, liked))
+    for liker, liked in pairs:
+        likes.record_like(liker, liked)
+    storage.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    storage.close_all()
+
+
+def registration(user_id):
+    from profile_fields import LINES, RANKS, MYTHIC_RANKS, GOALS, MYTHIC
+
+    rank = random.choice(RANKS)
+    texts = ['/start', '🔥 Начать', f'Новичок {user_id}', str(random.randint(35, 75)), random.choice(LINES), rank]
+    if rank == MYTHIC:
+        texts.append(random.choice(MYTHIC_RANKS))
+    return texts + [random.choice(GOALS), '➡️ Далее', '➡️ Завершить']
+
+
+def make_stream(profiles, users, updates):
+    """Поток обновлений: порядок внутри пользователя задан, пользователи перемешаны."""
+    registered = int(users * (1 - NEW_USERS_SHARE))
+    scripts = {user_id: [TEXTS['search']] for user_id in range(1, registered + 1)}
+    scripts.update({profiles + i: registration(profiles + i) + [TEXTS['search']]
+                    for i in range(1, users - registered + 1)})
+    user_ids = list(scripts)
+    stream = []
+    update_id = 0
+    while len(stream) < updates:
+        user_id = random.choice(user_ids)
+        script = scripts[user_id]
+        text = script.pop(0) if script else TEXTS[random.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]]
+        update_id += 1
+        message = {'message_id': update_id, 'date': int(time.time()), 'chat': {'id': user_id, 'type': 'private'},
+                   'from': {'id': user_id, 'is_bot': False, 'first_name': 'bench'}, 'text': text}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+        stream.append({'update_id': update_id, 'message': message})
+    return stream
+
+
+# --- ПРОГОН ---
+
+def run_once(workers, template, stream):
+    import storage
+    from supervisor import Supervisor
+
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'bench.db')
+    shutil.copy(template, path)
+    os.environ['DB_PATH'] = path  # Для рабочих процессов
+    storage.DB_PATH = path
+    supervisor = Supervisor(workers, initializer=init_worker).start()
+    started = time.perf_counter()
+    for data in stream:
+        supervisor.route(data)
+    result = supervisor.stop()
+    elapsed = time.perf_counter() - started
+    shutil.rmtree(tmp, ignore_errors=True)
+    handled = sum(stats['handled'] for stats in result['workers'].values())
+    errors = sum(stats['errors'] for stats in result['workers'].values())
+    return elapsed, handled, errors, result['replicated_events']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--max-workers', type=int, default=max(2, os.cpu_count() or 1))
+    parser.add_argument('--profiles', type=int, default=10_000)
+    parser.add_argument('--likes', type=int, default=50_000)
+    parser.add_argument('--users', type=int, default=400)
+    parser.add_argument('--updates', type=int, default=8000)
+    args = parser.parse_args()
+    random.seed(7)
+
+    template_dir = tempfile.mkdtemp()
+    template = os.path.join(template_dir, 'template.db')
+    started = time.perf_counter()
+    seed(template, args.profiles, args.likes)
+    stream = make_stream(args.profiles, args.users, args.updates)
+    print(f"База: {args.profiles} анкет, {args.likes} лайков за {time.perf_counter() - started:.1f} с; "
+          f"обновлений: {len(stream)}, пользователей: {args.users}; ядер: {os.cpu_count()}")
+    print(f"{'процессов':>10} {'секунд':>8} {'обн./с':>8} {'ускорение':>10} {'эффект.':>8} {'ошибок':>7} {'репликаций':>11}")
+    baseline = None
+    workers = 1
+    while workers <= args.max_workers:
+        elapsed, handled, errors, replicated = run_once(workers, template, stream)
+        throughput = handled / elapsed
+        baseline = baseline or throughput
+        print(f"{workers:>10} {elapsed:>8.2f} {throughput:>8.1f} {throughput / baseline:>9.2f}x "
+              f"{throughput / baseline / workers:>7.0%} {errors:>7} {replicated:>11}")
+        workers *= 2
+    shutil.rmtree(template_dir, ignore_errors=True)
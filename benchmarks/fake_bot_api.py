@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Локальный фейковый Telegram Bot API для бенчмарков и ручных проверок.
+
+Отвечает на любые методы /bot<token>/<method> правдоподобным JSON, считает
+вызовы и байты по методам и умеет имитировать лимиты Telegram: каждый
+rate_limit_every-й вызов получает 429 с retry_after. Подключение telebot:
+
+    server = FakeBotApi().start()
+    server.install()   # telebot.apihelper.API_URL -> этот сервер
+"""
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class FakeBotApi:
+    """HTTP-сервер, изображающий api.telegram.org."""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, rate_limit_every=0, retry_after=1):
+        self.latency = latency                    # Искусственная задержка ответа, секунды
+        self.rate_limit_every = rate_limit_every  # 0 — без 429
+        self.retry_after = retry_after
+        self.calls = Counter()       # {метод: число вызовов}
+        self.bytes_in = Counter()    # {метод: байт в запросах}
+        self.rate_limited = 0
+        self.log = []                # (время, метод, chat_id) — для проверки лимитов и порядка
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self.httpd = _HTTPServer((host, port), self._make_handler())
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def install(self):
+        """Перенаправляет telebot (синхронный и асинхронный) на этот сервер."""
+        import telebot.apihelper
+        import telebot.asyncio_helper
+        telebot.apihelper.API_URL = self.url + "/bot{0}/{1}"
+        telebot.asyncio_helper.API_URL = self.url + "/bot{0}/{1}"
+        return self
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name='fake-bot-api', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.bytes_in.clear()
+            self.rate_limited = 0
+            self.log.clear()
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, как у настоящего API
+            disable_nagle_algorithm = True  # Заголовки и тело уходят двумя send: без этого +40 мс (delayed ACK)
+
+            def do_GET(self):
+                self.do_POST()
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                method = self.path.rsplit('/', 1)[-1].split('?', 1)[0]
+                params = _parse_params(self.headers.get('Content-Type', ''), body, self.path)
+                status, payload = api._respond(method, params, len(body) + len(self.path))
+                if api.latency:
+                    time.sleep(api.latency)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _respond(self, method, params, size):
+        chat_id = params.get('chat_id')
+        with self._lock:
+            self.calls[method] += 1
+            self.bytes_in[method] += size
+            total = sum(self.calls.values())
+            if self.rate_limit_every and total % self.rate_limit_every == 0 and method != 'getUpdates':
+                self.rate_limited += 1
+                return 429, {'ok': False, 'error_code': 429,
+                             'description': f'Too Many Requests: retry after {self.retry_after}',
+                             'parameters': {'retry_after': self.retry_after}}
+            self.log.append((time.monotonic(), method, chat_id))
+            self._message_id += 1
+            message_id = self._message_id
+        if method == 'getUpdates':
+            time.sleep(min(float(params.get('timeout') or 0), 0.5))
+            return 200, {'ok': True, 'result': []}
+        if method in ('sendMessage', 'sendPhoto', 'editMessageText', 'editMessageMedia', 'editMessageCaption'):
+            message = {'message_id': int(params.get('message_id') or message_id), 'date': int(time.time()),
+                       'chat': {'id': int(chat_id or 0), 'type': 'private'}}
+            if method in ('sendPhoto', 'editMessageMedia'):
+                message['photo'] = [{'file_id': 'fake', 'file_unique_id': 'fake', 'width': 1, 'height': 1}]
+                message['caption'] = params.get('caption', '')
+            else:
+                message['text'] = params.get('text', '')
+            return 200, {'ok': True, 'result': message}
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'fake', 'username': 'fake_bot'}}
+        return 200, {'ok': True, 'result': True}
+
+    def summary(self):
+        with self._lock:
+            return {'calls': dict(self.calls), 'total_calls': sum(self.calls.values()),
+                    'bytes_in': sum(self.bytes_in.values()), 'rate_limited': self.rate_limited}
+
+
+def _parse_params(content_type, body, path):
+    """Параметры запроса: form-urlencoded, multipart (только текстовые поля) или query string."""
+    params = {}
+    if '?' in path:
+        params.update(parse_qsl(path.split('?', 1)[1]))
+    if content_type.startswith('application/x-www-form-urlencoded'):
+        params.update(parse_qsl(body.decode('utf-8', 'replace')))
+    elif content_type.startswith('application/json') and body:
+        params.update(json.loads(body))
+    elif content_type.startswith('multipart/form-data') and 'boundary=' in content_type:
+        boundary = content_type.split('boundary=', 1)[1].encode()
+        for part in body.split(b'--' + boundary):
+            head, _, value = part.partition(b'\r\n\r\n')
+            if b'name="' in head and b'filename=' not in head:
+                name = head.split(b'name="', 1)[1].split(b'"', 1)[0].decode()
+                params[name] = value.rstrip(b'\r\n').decode('utf-8', 'replace')
+    return params
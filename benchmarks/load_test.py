@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""Нагрузочный тест: настоящие обработчики main.py на синтетическом потоке обновлений.
+
+1. База заполняется N анкетами и M лайками (по умолчанию во временном файле;
+   --db mlbb_finder.db — в рабочей базе, осторожно).
+2. Симулируемые пользователи шлют обновления в пропорциях живого бота:
+   регистрация новичков, быстрый поиск и свайпы, лайки и мэтчи, «❤️ Понравился»,
+   своя анкета и детальный поиск (ACTIONS).
+3. Исходящие вызовы уходят во фейковый Bot API в этом же процессе.
+
+Обновления обрабатывают --workers потоков; обновления одного пользователя
+идут строго по порядку (пользователь закреплен за потоком), как в режимах
+async и webhook. Результат: пропускная способность, p50/p95/p99 задержки
+обработчика (всего и по действиям), SQL-запросов и вызовов Bot API на
+обновление, пиковый RSS. JSON сохраняется в benchmarks/results/, --compare
+сравнивает с прошлым прогоном.
+
+Запуск: python benchmarks/load_test.py [--profiles 10000 --likes 50000 --users 300 --updates 6000]
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+sys.path.insert(0, ROOT)
+
+# Доли действий зарегистрированного пользователя на каждом шаге
+ACTIONS = {
+    'next': 0.45,       # «👎 Следующий»
+    'like': 0.25,       # «❤️ Нравится»
+    'search': 0.10,     # «🚀 Быстрый поиск»
+    'liked_by': 0.06,   # «❤️ Понравился»
+    'profile': 0.06,    # «👤 Моя анкета»
+    'detailed': 0.05,   # Детальный поиск целиком (5–6 обновлений)
+    'stop': 0.03,       # «⏹️ Завершить поиск»
+}
+NEW_USERS_SHARE = 0.1   # Доля симулируемых пользователей без анкеты: сначала регистрация
+ACTIVE_SHARE = 0.3      # Доля засеянных анкет, активных в окне быстрого поиска
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', type=int, default=10_000)
+    parser.add_argument('--likes', type=int, default=50_000)
+    parser.add_argument('--users', type=int, default=300, help='симулируемых пользователей')
+    parser.add_argument('--updates', type=int, default=6000, help='примерно столько обновлений отправить')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--api-latency', type=float, default=0.0, help='задержка ответа фейкового Bot API, с')
+    parser.add_argument('--db', help='путь к базе (по умолчанию — временный файл)')
+    parser.add_argument('--metrics', action='store_true', help='включить замеры metrics.py (проверить их накладные расходы)')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='куда сохранить JSON (по умолчанию benchmarks/results/load_test-<время>.json)')
+    parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ.setdefault('TOKEN', '1:loadtest')
+os.environ['DB_PATH'] = args.db or os.path.join(tempfile.mkdtemp(), 'load_test.db')
+
+from telebot import types  # noqa: E402
+
+import likes  # noqa: E402
+import main  # noqa: E402
+import metrics  # noqa: E402
+import storage  # noqa: E402
+from fake_bot_api import FakeBotApi  # noqa: E402
+from profile_fields import LINES, RANKS, MYTHIC_RANKS, GOALS, MYTHIC  # noqa: E402
+
+
+# --- ПОДГОТОВКА БАЗЫ ---
+
+def random_profile(user_id):
+    rank = random.choice(RANKS)
+    return {'user_id': user_id, 'telegram_username': f'player{user_id}', 'nickname': f'Игрок {user_id}',
+            'winrate': random.randint(35, 75), 'line': random.choice(LINES), 'rank': rank,
+            'mythic_rank': random.choice(MYTHIC_RANKS) if rank == MYTHIC else None, 'goal': random.choice(GOALS),
+            'about': 'Играю по вечерам', 'photo_id': f'photo-{user_id}' if random.random() < 0.7 else None}
+
+
+def seed(profiles, like_count):
+    """Анкеты 1..profiles и like_count случайных лайков между ними."""
+    now = datetime.now()
+    rows = []
+    for user_id in range(1, profiles + 1):
+        profile = random_profile(user_id)
+        seen_at = now - (timedelta(seconds=random.uniform(0, 500)) if random.random() < ACTIVE_SHARE
+                         else timedelta(hours=random.uniform(1, 24 * 14)))
+        rows.append(tuple(profile[key] for key in main.PROFILE_KEYS[:-1]) + (seen_at,))
+    with storage.transaction():
+        storage.executemany(f"INSERT OR REPLACE INTO profiles ({main._PROFILE_COLUMNS}) VALUES ({', '.join('?' * len(main.PROFILE_KEYS))})", rows)
+    pairs = set()
+    while len(pairs) < like_count:
+        liker, liked = random.randint(1, profiles), random.randint(1, profiles)
+        if liker != liked:
+            pairs.add((liker, liked))
+    for liker, liked in pairs:
+        likes.record_like(liker, liked)
+    main.active_players.rebuild()
+    main.profile_filters.rebuild()
+    main.profile_ranker.rebuild()
+
+
+# --- СИМУЛЯЦИЯ ПОЛЬЗОВАТЕЛЕЙ ---
+
+_ids = itertools.count(1)
+
+
+def text_update(user_id, text):
+    message = {'message_id': next(_ids), 'date': int(time.time()), 'chat': {'id': user_id, 'type': 'private'},
+               'from': {'id': user_id, 'is_bot': False, 'first_name': 'load'}, 'text': text}
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return {'update_id': next(_ids), 'message': message}
+
+
+def registration_script(user_id):
+    profile = random_profile(user_id)
+    texts = ['/start', '🔥 Начать', profile['nickname'], str(profile['winrate']), profile['line'], profile['rank']]
+    if profile['rank'] == MYTHIC:
+        texts.append(profile['mythic_rank'])
+    texts += [profile['goal'], profile['about'], '➡️ Завершить']
+    return [('register', text) for text in texts]
+
+
+def detailed_script():
+    texts = ['⚙️ Поиск тиммейта', random.choice(LINES[:-1]), main.ANY_CHOICE, main.ANY_CHOICE, str(random.choice((40, 50, 55)))]
+    return [('detailed', text) for text in texts]
+
+
+SIMPLE_TEXTS = {'search': '🚀 Быстрый поиск', 'liked_by': '❤️ Понравился', 'profile': '👤 Моя анкета',
+                'stop': '⏹️ Завершить поиск'}
+
+
+class SimulatedUser:
+    """Очередь шагов одного пользователя: обновление строится прямо перед отправкой."""
+
+    def __init__(self, user_id, registered):
+        self.user_id = user_id
+        self.pending = [] if registered else registration_script(user_id)
+
+    def next_step(self):
+        if not self.pending:
+            action = random.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+            if action == 'detailed':
+                self.pending = detailed_script()
+            else:
+                self.pending = [(action, None)]
+        return self.pending.pop(0)
+
+    def build(self, action, text):
+        if action in ('next', 'like'):
+            session = main.search_sessions.get(self.user_id)
+            if session is None:  # Свайпать нечего: сначала поиск
+                return text_update(self.user_id, SIMPLE_TEXTS['search'])
+            return text_update(self.user_id, "❤️ Нравится" if action == 'like' else "👎 Следующий")
+        return text_update(self.user_id, text or SIMPLE_TEXTS[action])
+
+
+# --- ПРОГОН ---
+
+def run_worker(users, budget, samples, lock):
+    rng_state = random.Random(hash(users[0].user_id))
+    while True:
+        with lock:
+            if budget[0] <= 0:
+                return
+            budget[0] -= 1
+        user = rng_state.choice(users)
+        action, text = user.next_step()
+        update = user.build(action, text)
+        parsed = types.Update.de_json(update)
+        started = time.perf_counter()
+        main.bot.process_new_updates([parsed])
+        elapsed = time.perf_counter() - started
+        with lock:
+            samples[action].append(elapsed)
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {'count': 0}
+    pick = lambda share: round(values[min(len(values) - 1, int(share * len(values)))] * 1000, 3)  # noqa: E731
+    return {'count': len(values), 'p50_ms': pick(0.5), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99),
+            'max_ms': round(values[-1] * 1000, 3)}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(result, previous_path):
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f)
+    print(f"Сравнение с {previous_path} ({previous.get('revision')}, {previous.get('started_at')}):")
+    for key in ('throughput_per_s', 'sql_per_update', 'api_calls_per_update', 'peak_rss_mb'):
+        old, new = previous['results'].get(key), result['results'][key]
+        change = f"{(new - old) / old:+.1%}" if old else "—"
+        print(f"  {key:24} {old!s:>10} → {new!s:>10}  {change}")
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        old, new = previous['results']['latency'].get(key), result['results']['latency'][key]
+        change = f"{(new - old) / old:+.1%}" if old else "—"
+        print(f"  latency {key:16} {old!s:>10} → {new!s:>10}  {change}")
+
+
+def main_run():
+    random.seed(args.seed)
+    api = FakeBotApi(latency=args.api_latency).start().install()
+    main.bot.threaded = False  # Обработчики выполняются в потоках нагрузочного теста
+    main.init_db()
+
+    started = time.perf_counter()
+    seed(args.profiles, args.likes)
+    print(f"База: {args.profiles} анкет, {args.likes} лайков за {time.perf_counter() - started:.1f} с ({os.environ['DB_PATH']})")
+    main.activity.start()
+    if args.metrics:
+        metrics.reset()
+        metrics.enable()
+
+    registered = int(args.users * (1 - NEW_USERS_SHARE))
+    users = [SimulatedUser(user_id, True) for user_id in range(1, registered + 1)]
+    users += [SimulatedUser(args.profiles + i, False) for i in range(1, args.users - registered + 1)]
+    # Пользователь закреплен за одним потоком — его обновления идут по порядку
+    groups = [users[i::args.workers] for i in range(args.workers) if users[i::args.workers]]
+
+    api.reset()
+    sql_before = storage.get_stats()['statements_executed']
+    samples = defaultdict(list)
+    lock = threading.Lock()
+    budget = [args.updates]
+    started = time.perf_counter()
+    threads = [threading.Thread(target=run_worker, args=(group, budget, samples, lock)) for group in groups]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    main.activity.stop()
+    main.seen_profiles.flush()
+
+    all_samples = [value for values in samples.values() for value in values]
+    updates = len(all_samples)
+    api_summary = api.summary()
+    result = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'results': {
+            'updates': updates,
+            'seconds': round(elapsed, 3),
+            'throughput_per_s': round(updates / elapsed, 1),
+            'latency': percentiles(all_samples),
+            'latency_by_action': {action: percentiles(values) for action, values in sorted(samples.items())},
+            'sql_per_update': round((storage.get_stats()['statements_executed'] - sql_before) / updates, 2),
+            'api_calls_per_update': round(api_summary['total_calls'] / updates, 2),
+            'api_calls': api_summary['calls'],
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'router': dict(main.router.stats),
+            'profile_cache': main.profile_cache.get_stats(),
+            'slow_queries': metrics.slow_queries['count'] if args.metrics else None,
+        },
+    }
+    api.stop()
+
+    r = result['results']
+    print(f"Обновлений: {updates} за {elapsed:.2f} с — {r['throughput_per_s']}/с, потоков {args.workers}")
+    print(f"Задержка обработчика: p50 {r['latency']['p50_ms']} мс, p95 {r['latency']['p95_ms']} мс, p99 {r['latency']['p99_ms']} мс")
+    for action, stats in r['latency_by_action'].items():
+        print(f"  {action:10} {stats['count']:6d}  p50 {stats['p50_ms']:8.3f}  p95 {stats['p95_ms']:8.3f}  p99 {stats['p99_ms']:8.3f} мс")
+    print(f"SQL-запросов на обновление: {r['sql_per_update']}, вызовов Bot API на обновление: {r['api_calls_per_update']}")
+    print(f"Пиковый RSS: {r['peak_rss_mb']} МБ")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load_test-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"Результат сохранен: {output}")
+    if args.compare:
+        compare(result, args.compare)
+    storage.close_all()
+
+
+if __name__ == '__main__':
+    main_run()
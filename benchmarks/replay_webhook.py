@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Прогон записанных обновлений через webhook-сервер на localhost.
+
+Без --url поднимает WebhookServer в этом же процессе с обработчиком-заглушкой,
+который «работает» --work-ms миллисекунд, и показывает, как очередь
+держит нагрузку. С --url отправляет обновления на уже запущенный бот
+(python main.py webhook), например с записанными реальными обновлениями.
+
+Запуск: python benchmarks/replay_webhook.py [--file updates.jsonl] [--count 2000]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webhook import SECRET_HEADER, WebhookServer  # noqa: E402
+
+BUTTONS = ["🚀 Быстрый поиск", "👎 Следующий", "❤️ Нравится", "❤️ Понравился", "👤 Моя анкета"]
+
+
+def synthetic_updates(count, users):
+    for i in range(count):
+        user_id = 1000 + i % users
+        yield {'update_id': i + 1, 'message': {
+            'message_id': i + 1, 'date': int(time.time()), 'text': BUTTONS[i % len(BUTTONS)],
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'bench'}}}
+
+
+def post(url, update, secret):
+    request = urllib.request.Request(url, data=json.dumps(update).encode(), method='POST',
+                                     headers={'Content-Type': 'application/json', SECRET_HEADER: secret or ''})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError as e:
+        return type(e).__name__
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='адрес webhook запущенного бота')
+    parser.add_argument('--secret', default='bench-secret')
+    parser.add_argument('--file', help='JSONL с записанными обновлениями')
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=16, help='параллельных отправителей')
+    parser.add_argument('--work-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding='utf-8') as f:
+            updates = [json.loads(line) for line in f if line.strip()]
+    else:
+        updates = list(synthetic_updates(args.count, args.users))
+
+    server = None
+    url = args.url
+    if url is None:
+        server = WebhookServer(lambda data: time.sleep(args.work_ms / 1000), port=0, secret=args.secret).start()
+        url = server.address
+
+    statuses = Counter()
+    lock = threading.Lock()
+    chunks = [updates[i::args.clients] for i in range(args.clients)]
+
+    def client(chunk):
+        for update in chunk:
+            status = post(url, update, args.secret)
+            with lock:
+                statuses[status] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(chunk,)) for chunk in chunks]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ingest = time.perf_counter() - started
+    print(f"Отправлено {len(updates)} обновлений за {ingest:.2f} с ({len(updates) / ingest:.0f}/с), ответы: {dict(statuses)}")
+    print(f"Неверный секрет -> {post(url, updates[0], 'wrong')}")
+    if server is not None:
+        server.stop()
+        print(f"Статистика сервера: {server.get_stats()}")
+    else:
+        with urllib.request.urlopen(url.rsplit('/', 1)[0] + '/stats') as response:
+            print(f"Статистика сервера: {json.load(response)}")
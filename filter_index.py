@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""Индекс фильтров для детального поиска тиммейта.
+
+Для каждого перечислимого поля анкеты (линия, ранг, уровень мифа, цель)
+хранится инвертированный индекс {значение: set(user_id)}, а winrate разложен
+по массиву из 101 корзины (0..100%). Любая комбинация фильтров решается
+пересечением множеств, начиная с самого маленького, без обхода таблицы.
+Индекс обновляется из save_profile/delete_profile и строится из базы при запуске.
+"""
+import threading
+
+import storage
+
+FIELDS = ('line', 'rank', 'mythic_rank', 'goal')
+
+
+class FilterIndex:
+    """Инвертированный индекс анкет по полям фильтра."""
+
+    def __init__(self):
+        self._by_value = {field: {} for field in FIELDS}  # {поле: {значение: set(user_id)}}
+        self._winrate = [set() for _ in range(101)]      # Корзина на каждый процент
+        self._docs = {}                                   # {user_id: (значения FIELDS..., winrate)}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, user_id, profile):
+        """Добавляет или переиндексирует анкету (profile — словарь полей)."""
+        values = tuple(profile.get(field) for field in FIELDS)
+        winrate = profile.get('winrate')
+        winrate = min(max(int(winrate), 0), 100) if winrate is not None else None
+        with self._lock:
+            self._remove_locked(user_id)
+            for field, value in zip(FIELDS, values):
+                if value is not None:
+                    self._by_value[field].setdefault(value, set()).add(user_id)
+            if winrate is not None:
+                self._winrate[winrate].add(user_id)
+            self._docs[user_id] = values + (winrate,)
+
+    def remove(self, user_id):
+        with self._lock:
+            self._remove_locked(user_id)
+
+    def _remove_locked(self, user_id):
+        doc = self._docs.pop(user_id, None)
+        if doc is None:
+            return
+        *values, winrate = doc
+        for field, value in zip(FIELDS, values):
+            if value is not None:
+                self._by_value[field][value].discard(user_id)
+        if winrate is not None:
+            self._winrate[winrate].discard(user_id)
+
+    def search(self, exclude=None, winrate_min=None, winrate_max=None, **filters):
+        """Возвращает user_id анкет, подходящих под все фильтры.
+
+        filters: line=..., rank=..., mythic_rank=..., goal=... — одно значение
+        или набор допустимых значений. None означает «любое».
+        """
+        with self._lock:
+            candidates = []
+            for field, wanted in filters.items():
+                if wanted is None:
+                    continue
+                index = self._by_value[field]
+                if isinstance(wanted, str):
+                    candidates.append(index.get(wanted, set()))
+                else:
+                    candidates.append(set().union(*(index.get(value, set()) for value in wanted)))
+            if winrate_min is not None or winrate_max is not None:
+                lo = max(winrate_min or 0, 0)
+                hi = min(winrate_max if winrate_max is not None else 100, 100)
+                candidates.append(set().union(*self._winrate[lo:hi + 1]))
+            if not candidates:
+                result = set(self._docs)
+            else:
+                candidates.sort(key=len)
+                result = candidates[0].intersection(*candidates[1:])
+        result.discard(exclude)
+        return list(result)
+
+    def rebuild(self):
+        """Заполняет индекс из таблицы profiles."""
+        rows = storage.fetchall("SELECT user_id, line, rank, mythic_rank, goal, winrate FROM profiles")
+        with self._lock:
+            self._by_value = {field: {} for field in FIELDS}
+            self._winrate = [set() for _ in range(101)]
+            self._docs = {}
+        for user_id, line, rank, mythic_rank, goal, winrate in rows:
+            self.add(user_id, {'line': line, 'rank': rank, 'mythic_rank': mythic_rank, 'goal': goal, 'winrate': winrate})
+        return len(rows)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Клавиатуры, сериализованные один раз.
+
+telebot превращает reply_markup в JSON при каждой отправке (to_json), а
+create_*_keyboard каждый раз заново строили объекты кнопок. Статические
+клавиатуры теперь строятся при импорте, их JSON считается один раз, и все
+сообщения получают один и тот же неизменяемый объект FrozenMarkup.
+"""
+import json
+from functools import wraps
+
+from telebot import types
+
+
+class FrozenMarkup(types.JsonSerializable):
+    """Готовая клавиатура: telebot берет заранее посчитанный JSON."""
+    __slots__ = ('_json',)
+
+    def __init__(self, markup):
+        # Кириллица и эмодзи без \\uXXXX: запрос короче, Telegram принимает UTF-8
+        self._json = markup if isinstance(markup, str) else json.dumps(json.loads(markup.to_json()), ensure_ascii=False)
+
+    def to_json(self):
+        return self._json
+
+    def __setattr__(self, name, value):
+        if hasattr(self, '_json'):
+            raise AttributeError("FrozenMarkup нельзя изменить: это общий объект для всех сообщений")
+        object.__setattr__(self, name, value)
+
+
+def static_keyboard(build):
+    """Декоратор для create_*_keyboard без аргументов: строит клавиатуру сразу и дальше отдает ее же."""
+    frozen = FrozenMarkup(build())
+
+    @wraps(build)
+    def get():
+        return frozen
+    return get
+
+
+def keyboard_cache(build):
+    """Декоратор для клавиатур с аргументами (их немного вариантов): по одной на набор аргументов."""
+    cache = {}
+
+    @wraps(build)
+    def get(*args):
+        frozen = cache.get(args)
+        if frozen is None:
+            frozen = cache[args] = FrozenMarkup(build(*args))
+        return frozen
+    return get
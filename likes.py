@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Запись лайков с определением мэтча за одну транзакцию.
+
+Кроме самих лайков (таблица likes) поддерживаются материализованные данные,
+которые иначе пришлось бы вычислять на каждый запрос:
+- matches — взаимные лайки, одна строка на пару (user_a < user_b);
+- likes_inbox — входящие лайки без ответа: список «❤️ Понравился» читается
+  по первичному ключу вместо подзапроса NOT EXISTS по всей таблице likes;
+- like_counters — счетчики на пользователя: сколько лайков получено, сколько
+  ждет ответа и сколько мэтчей.
+
+Инвариант: строка (A, B) есть в likes_inbox тогда и только тогда, когда B
+лайкнул A, а A B — еще нет. Поэтому ответный лайк — это удаление строки из
+входящих лайкающего: если удаление что-то вернуло, случился мэтч.
+"""
+from collections import Counter
+
+import storage
+
+PRUNE_CHUNK = 1000  # Строк на одну транзакцию в prune_user
+
+
+def record_like(liker_id, liked_id):
+    """Записывает лайк. Возвращает True, если этот лайк создал мэтч.
+
+    Повторный лайк той же анкеты ничего не меняет и возвращает False.
+    """
+    with storage.transaction():
+        inserted = storage.fetchall('''
+        INSERT INTO likes (liker_id, liked_id) VALUES (?, ?)
+        ON CONFLICT (liker_id, liked_id) DO NOTHING RETURNING id
+        ''', (liker_id, liked_id))
+        if not inserted:
+            return False
+        storage.execute('''
+        INSERT INTO like_counters (user_id, likes_received) VALUES (?, 1)
+        ON CONFLICT (user_id) DO UPDATE SET likes_received = likes_received + 1
+        ''', (liked_id,))
+        # Лайк в ответ: liked_id уже ждет во входящих у liker_id
+        answered = storage.fetchall('''
+        DELETE FROM likes_inbox WHERE user_id = ? AND liker_id = ? RETURNING liker_id
+        ''', (liker_id, liked_id))
+        if not answered:
+            storage.execute("INSERT INTO likes_inbox (user_id, liker_id) VALUES (?, ?) ON CONFLICT DO NOTHING",
+                            (liked_id, liker_id))
+            storage.execute('''
+            UPDATE like_counters SET inbox_count = inbox_count + 1 WHERE user_id = ?
+            ''', (liked_id,))
+            return False
+        storage.execute("INSERT INTO matches (user_a, user_b) VALUES (?, ?) ON CONFLICT DO NOTHING",
+                        (min(liker_id, liked_id), max(liker_id, liked_id)))
+        storage.execute('''
+        INSERT INTO like_counters (user_id, matches_count) VALUES (?, 1)
+        ON CONFLICT (user_id) DO UPDATE SET matches_count = matches_count + 1
+        ''', (liked_id,))
+        storage.execute('''
+        INSERT INTO like_counters (user_id, matches_count) VALUES (?, 1)
+        ON CONFLICT (user_id) DO UPDATE SET matches_count = matches_count + 1, inbox_count = MAX(inbox_count - 1, 0)
+        ''', (liker_id,))
+        return True
+
+def liked_by(user_id):
+    """Кто лайкнул пользователя и ждет ответа (новые первыми)."""
+    rows = storage.fetchall('''
+    SELECT liker_id FROM likes_inbox WHERE user_id = ? ORDER BY created_at DESC
+    ''', (user_id,))
+    return [row[0] for row in rows]
+
+def get_counters(user_id):
+    """Счетчики пользователя: likes_received, inbox_count, matches_count."""
+    row = storage.fetchone('''
+    SELECT likes_received, inbox_count, matches_count FROM like_counters WHERE user_id = ?
+    ''', (user_id,))
+    return dict(zip(('likes_received', 'inbox_count', 'matches_count'), row or (0, 0, 0)))
+
+def delete_user(user_id):
+    """Удаляет лайки, мэтчи и входящие пользователя и поправляет счетчики остальных."""
+    with storage.transaction():
+        storage.execute('''
+        UPDATE like_counters SET likes_received = likes_received - 1
+        WHERE user_id IN (SELECT liked_id FROM likes WHERE liker_id = ?)
+        ''', (user_id,))
+        storage.execute('''
+        UPDATE like_counters SET inbox_count = inbox_count - 1
+        WHERE user_id IN (SELECT user_id FROM likes_inbox WHERE liker_id = ?)
+        ''', (user_id,))
+        storage.execute('''
+        UPDATE like_counters SET matches_count = matches_count - 1
+        WHERE user_id IN (SELECT user_b FROM matches WHERE user_a = ?1 UNION SELECT user_a FROM matches WHERE user_b = ?1)
+        ''', (user_id,))
+        storage.execute("DELETE FROM likes_inbox WHERE user_id = ?1 OR liker_id = ?1", (user_id,))
+        storage.execute("DELETE FROM matches WHERE user_a = ?1 OR user_b = ?1", (user_id,))
+        storage.execute("DELETE FROM like_counters WHERE user_id = ?", (user_id,))
+        storage.execute("DELETE FROM likes WHERE liker_id = ?1 OR liked_id = ?1", (user_id,))
+
+# (удаление порции строк пользователя ?1 с RETURNING пары, правка счетчика другой стороны, чья это сторона)
+_PRUNE_STEPS = (
+    ('''DELETE FROM likes_inbox WHERE (user_id, liker_id) IN (
+        SELECT user_id, liker_id FROM likes_inbox WHERE user_id = ?1 OR liker_id = ?1 LIMIT ?2
+    ) RETURNING user_id, liker_id''',
+     "UPDATE like_counters SET inbox_count = inbox_count - ? WHERE user_id = ?",
+     lambda user_id, owner, liker: owner if liker == user_id else None),
+    ('''DELETE FROM matches WHERE (user_a, user_b) IN (
+        SELECT user_a, user_b FROM matches WHERE user_a = ?1 OR user_b = ?1 LIMIT ?2
+    ) RETURNING user_a, user_b''',
+     "UPDATE like_counters SET matches_count = matches_count - ? WHERE user_id = ?",
+     lambda user_id, user_a, user_b: user_b if user_a == user_id else user_a),
+    ('''DELETE FROM likes WHERE id IN (
+        SELECT id FROM likes WHERE liker_id = ?1 OR liked_id = ?1 LIMIT ?2
+    ) RETURNING liker_id, liked_id''',
+     "UPDATE like_counters SET likes_received = likes_received - ? WHERE user_id = ?",
+     lambda user_id, liker, liked: liked if liker == user_id else None),
+)
+
+def prune_user(user_id, chunk=PRUNE_CHUNK, still=None):
+    """То же, что delete_user, но порциями по chunk строк, каждая в своей транзакции.
+
+    У давно зарегистрированных игроков лайков бывают тысячи; так писатели
+    ждут блокировку не дольше одной порции. Счетчики правятся вместе с каждой
+    порцией, поэтому между транзакциями данные согласованы. still() вызывается
+    в начале каждой транзакции: False — чистка прекращается (например, анкету
+    успели вернуть из архива, и ее новые лайки трогать нельзя). Возвращает
+    число удаленных строк.
+    """
+    removed = 0
+    for delete_sql, update_sql, other_side in _PRUNE_STEPS:
+        while True:
+            with storage.transaction():
+                if still is not None and not still():
+                    return removed
+                rows = storage.fetchall(delete_sql, (user_id, chunk))
+                others = Counter(other_side(user_id, *row) for row in rows)
+                others.pop(None, None)
+                if others:
+                    storage.executemany(update_sql, [(count, other) for other, count in others.items()])
+            removed += len(rows)
+            if len(rows) < chunk:
+                break
+    with storage.transaction():
+        if still is None or still():
+            storage.execute("DELETE FROM like_counters WHERE user_id = ?", (user_id,))
+    return removed
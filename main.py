@@ -3,9 +3,27 @@
 # --- БИБЛИОТЕКИ ---
 import telebot
 from telebot import types
-import sqlite3
 import os  # <-- Важно для работы с токеном
-from datetime import datetime, timedelta
+import sys
+from datetime import datetime
+
+import storage  # Постоянные соединения с SQLite (WAL, кэш запросов, счетчики)
+import metrics  # Замеры обработчиков, SQL и Bot API; /metrics для Prometheus
+import migrations
+import likes
+import recommendations
+import retention
+from activity import ActivityBuffer
+from active_index import ActiveIndex
+from filter_index import FilterIndex
+from ranking import ProfileColumns
+from profile_cache import ProfileCache
+from seen import SeenStore
+from router import Router
+from keyboards import static_keyboard, keyboard_cache
+from outbox import Outbox, PRIORITY_HIGH, PRIORITY_LOW, GLOBAL_RATE
+from sessions import SessionStore, SearchSession, RegistrationDraft, save_search_sessions, load_search_sessions
+from profile_fields import LINES, RANKS, MYTHIC_RANKS, GOALS, ANY_LINE, MYTHIC
 
 # --- НАСТРОЙКИ И БЕЗОПАСНОСТЬ ---
 # Правильный способ получить токен из секретов Replit.
@@ -20,114 +38,206 @@ except KeyError:
     print("2. Создайте новый секрет: ключ (key) должен быть 'TOKEN', а значение (value) - ваш токен от @BotFather.")
     exit()
 
+# Режим workers (supervisor.py): номер этого процесса и сколько их всего.
+# Обновления пользователя всегда обрабатывает процесс user_id % WORKER_COUNT.
+WORKER_INDEX = int(os.environ.get('BOT_WORKER_INDEX', '0'))
+WORKER_COUNT = int(os.environ.get('BOT_WORKER_COUNT', '1'))
 
 # --- ИНИЦИАЛИЗАЦИЯ БОТА И ДАННЫХ ---
 bot = telebot.TeleBot(TOKEN)
-# Словарь для временного хранения данных при регистрации анкеты
-user_data = {}
+# Все сообщения идут через один обработчик: кнопки ищутся в словаре, шаги сценариев — в таблице
+router = Router().attach(bot)
+# Исходящие сообщения идут через очередь с лимитами Telegram и приоритетами
+outbox = Outbox(bot, global_rate=GLOBAL_RATE / WORKER_COUNT)  # Общий лимит бота делят все процессы
+# Черновики анкет при регистрации; брошенные вытесняются через час простоя
+user_data = SessionStore(ttl=3600, maxsize=50_000)
+# Буфер last_active: пишем в базу пачками, а не на каждое сообщение
+activity = ActivityBuffer()
+# Индекс активных за последние 10 минут: быстрый поиск не ходит в базу
+active_players = ActiveIndex(window_seconds=600)
+# Инвертированный индекс по линии/рангу/цели/winrate для детального поиска
+profile_filters = FilterIndex()
+# Колонки полей анкет для ранжирования кандидатов по совместимости (NumPy)
+profile_ranker = ProfileColumns()
+# LRU-кэш анкет: свайпы и мэтчи не ходят в базу за каждой анкетой
+profile_cache = ProfileCache(maxsize=5000)
+# Готовые подписи карточек: {user_id: (версия анкеты, текст)}
+caption_cache = ProfileCache(maxsize=5000)
+# Фильтры Блума уже показанных в поиске анкет: поиск не предлагает их повторно
+seen_profiles = SeenStore()
+# Готовые счетчики модулей — в /metrics рядом с гистограммами
+metrics.register_collector('storage', storage.get_stats)
+metrics.register_collector('outbox', outbox.get_metrics)
+metrics.register_collector('router', lambda: dict(router.stats))
+metrics.register_collector('profile_cache', profile_cache.get_stats)
+metrics.register_collector('seen', seen_profiles.memory_report)
+metrics_server = None
+# В режиме workers — функция (вид, user_id, данные), рассылающая изменения индексов остальным процессам
+replicate = None
+# Архивация анкет, неактивных дольше RETENTION_DAYS; у недавно активных отметка может быть еще не в базе — их не трогаем
+retention_worker = retention.RetentionWorker(skip=lambda user_id: recently_active(user_id),
+                                             on_archived=lambda user_ids: archive_profiles(user_ids))
 
 
 # --- РАБОТА С БАЗОЙ ДАННЫХ (SQLite) ---
 
 def init_db():
-    """Инициализирует базу данных и создает таблицы, если их нет."""
-    conn = sqlite3.connect('mlbb_finder.db')
-    cursor = conn.cursor()
-    # Таблица для анкет пользователей
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS profiles (
-        user_id INTEGER PRIMARY KEY,
-        telegram_username TEXT,
-        nickname TEXT,
-        winrate INTEGER,
-        line TEXT,
-        rank TEXT,
-        mythic_rank TEXT,
-        goal TEXT,
-        about TEXT,
-        photo_id TEXT,
-        last_active TIMESTAMP
-    )''')
-    # Таблица для лайков
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS likes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        liker_id INTEGER,
-        liked_id INTEGER,
-        FOREIGN KEY (liker_id) REFERENCES profiles(user_id),
-        FOREIGN KEY (liked_id) REFERENCES profiles(user_id)
-    )''')
-    conn.commit()
-    conn.close()
+    """Инициализирует базу данных и применяет миграции схемы."""
+    migrations.migrate()
 
 def user_exists(user_id):
     """Проверяет, есть ли анкета пользователя в базе."""
-    conn = sqlite3.connect('mlbb_finder.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM profiles WHERE user_id = ?", (user_id,))
-    exists = cursor.fetchone() is not None
-    conn.close()
-    return exists
+    if user_id in profile_cache:
+        return True
+    return storage.fetchone("SELECT 1 FROM profiles WHERE user_id = ?", (user_id,)) is not None
 
 def update_last_active(user_id):
-    """Обновляет время последней активности пользователя."""
-    conn = sqlite3.connect('mlbb_finder.db')
-    cursor = conn.cursor()
-    cursor.execute("UPDATE profiles SET last_active = ? WHERE user_id = ?", (datetime.now(), user_id))
-    conn.commit()
-    conn.close()
+    """Обновляет время последней активности пользователя (через буфер)."""
+    now = datetime.now()
+    activity.touch(user_id, now)
+    active_players.touch(user_id, now)
+    profile_ranker.touch(user_id, now)
+    if replicate:
+        replicate('touch', user_id, now)
+
+def recently_active(user_id):
+    """Есть ли свежая активность, которая может быть еще не записана в базу.
+
+    Кроме своего буфера смотрим индекс активных: в режиме workers туда же приходят
+    отметки других процессов, а их буферы отсюда не видны.
+    """
+    return activity.last_seen(user_id) is not None or active_players.last_seen(user_id) is not None
 
 def save_profile(user_id, data):
     """Сохраняет или обновляет профиль пользователя в базе данных."""
-    conn = sqlite3.connect('mlbb_finder.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM profiles WHERE user_id = ?", (user_id,))
-    exists = cursor.fetchone()
-    if exists:
-        cursor.execute('''
-        UPDATE profiles SET telegram_username = ?, nickname = ?, winrate = ?, line = ?, rank = ?, mythic_rank = ?, goal = ?, about = ?, photo_id = ?, last_active = ? WHERE user_id = ?
-        ''', (data.get('telegram_username'), data.get('nickname'), data.get('winrate'), data.get('line'), data.get('rank'), data.get('mythic_rank'), data.get('goal'), data.get('about'), data.get('photo_id'), datetime.now(), user_id))
-    else:
-        cursor.execute('''
-        INSERT INTO profiles (user_id, telegram_username, nickname, winrate, line, rank, mythic_rank, goal, about, photo_id, last_active) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, data.get('telegram_username'), data.get('nickname'), data.get('winrate'), data.get('line'), data.get('rank'), data.get('mythic_rank'), data.get('goal'), data.get('about'), data.get('photo_id'), datetime.now()))
-    conn.commit()
-    conn.close()
+    with storage.transaction():
+        exists = storage.fetchone("SELECT 1 FROM profiles WHERE user_id = ?", (user_id,))
+        if exists:
+            storage.execute('''
+            UPDATE profiles SET telegram_username = ?, nickname = ?, winrate = ?, line = ?, rank = ?, mythic_rank = ?, goal = ?, about = ?, photo_id = ?, last_active = ? WHERE user_id = ?
+            ''', (data.get('telegram_username'), data.get('nickname'), data.get('winrate'), data.get('line'), data.get('rank'), data.get('mythic_rank'), data.get('goal'), data.get('about'), data.get('photo_id'), datetime.now(), user_id))
+        else:
+            storage.execute('''
+            INSERT INTO profiles (user_id, telegram_username, nickname, winrate, line, rank, mythic_rank, goal, about, photo_id, last_active) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, data.get('telegram_username'), data.get('nickname'), data.get('winrate'), data.get('line'), data.get('rank'), data.get('mythic_rank'), data.get('goal'), data.get('about'), data.get('photo_id'), datetime.now()))
+    index_profile(user_id, data, datetime.now())
+
+def index_profile(user_id, data, when, local=True):
+    """Обновляет кэши и индексы в памяти после записи анкеты.
+
+    local=False — изменение пришло от другого процесса, дальше его не рассылаем.
+    """
+    profile_cache.invalidate(user_id)
+    caption_cache.invalidate(user_id)
+    active_players.touch(user_id, when)
+    profile_filters.add(user_id, data)
+    profile_ranker.add(user_id, data, last_active=when)
+    if local and replicate:
+        replicate('save', user_id, ({key: data.get(key) for key in PROFILE_KEYS}, when))
+
+PROFILE_KEYS = ["user_id", "telegram_username", "nickname", "winrate", "line", "rank", "mythic_rank", "goal", "about", "photo_id", "last_active"]
+_PROFILE_COLUMNS = ", ".join(PROFILE_KEYS)
+PREFETCH_PAGE = 20  # Сколько анкет поиска подгружать одним запросом
 
 def get_profile(user_id):
     """Возвращает данные анкеты пользователя в виде словаря."""
-    conn = sqlite3.connect('mlbb_finder.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM profiles WHERE user_id = ?", (user_id,))
-    profile_data = cursor.fetchone()
-    conn.close()
+    profile = profile_cache.get(user_id)
+    if profile is not None:
+        return profile
+    profile_data = storage.fetchone(f"SELECT {_PROFILE_COLUMNS} FROM profiles WHERE user_id = ?", (user_id,))
     if profile_data:
-        keys = ["user_id", "telegram_username", "nickname", "winrate", "line", "rank", "mythic_rank", "goal", "about", "photo_id", "last_active"]
-        return dict(zip(keys, profile_data))
+        profile = dict(zip(PROFILE_KEYS, profile_data))
+        profile_cache.put(user_id, profile)
+        return profile
     return None
 
+def get_profiles(user_ids):
+    """Возвращает {user_id: анкета} для нескольких анкет одним запросом (недостающие берутся из базы)."""
+    result = {}
+    missing = []
+    for user_id in user_ids:
+        profile = profile_cache.get(user_id)
+        if profile is not None:
+            result[user_id] = profile
+        else:
+            missing.append(user_id)
+    for i in range(0, len(missing), 500):  # Не упираемся в лимит параметров SQLite
+        chunk = missing[i:i + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        for row in storage.fetchall(f"SELECT {_PROFILE_COLUMNS} FROM profiles WHERE user_id IN ({placeholders})", chunk):
+            profile = dict(zip(PROFILE_KEYS, row))
+            profile_cache.put(profile['user_id'], profile)
+            result[profile['user_id']] = profile
+    return result
+
 def delete_profile(user_id):
-    """Удаляет анкету пользователя и все связанные лайки."""
-    conn = sqlite3.connect('mlbb_finder.db')
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM profiles WHERE user_id = ?", (user_id,))
-    cursor.execute("DELETE FROM likes WHERE liker_id = ? OR liked_id = ?", (user_id, user_id))
-    conn.commit()
-    conn.close()
+    """Удаляет анкету пользователя и все связанные лайки и мэтчи."""
+    with storage.transaction():
+        storage.execute("DELETE FROM profiles WHERE user_id = ?", (user_id,))
+        likes.delete_user(user_id)
+    forget_profile(user_id)
+
+def forget_profile(user_id):
+    """Убирает анкету из кэшей и индексов в памяти (после удаления или архивации)."""
+    seen_profiles.forget(user_id)
+    unindex_profile(user_id)
+    if replicate:
+        replicate('forget', user_id, None)
+
+def unindex_profile(user_id):
+    profile_cache.invalidate(user_id)
+    caption_cache.invalidate(user_id)
+    active_players.remove(user_id)
+    profile_filters.remove(user_id)
+    profile_ranker.remove(user_id)
+
+def restore_profile(user_id):
+    """Возвращает анкету из архива неактивных. True — анкета была в архиве."""
+    profile = retention.restore(user_id)
+    if profile is None:
+        return False
+    index_profile(user_id, profile, profile['last_active'])
+    return True
+
+def apply_replicated(events):
+    """Применяет изменения индексов, сделанные другими процессами (режим workers)."""
+    for kind, user_id, payload in events:
+        if kind == 'touch':
+            active_players.touch(user_id, payload)
+            profile_ranker.touch(user_id, payload)
+        elif kind == 'save':
+            data, when = payload
+            index_profile(user_id, data, when, local=False)
+        elif kind == 'forget':
+            unindex_profile(user_id)
+            if user_id % WORKER_COUNT == WORKER_INDEX:
+                # Фильтр просмотренного есть только у процесса пользователя: без этого он
+                # вернул бы в базу удаленный процессом-отправителем (архивация идет в процессе 0)
+                seen_profiles.forget(user_id)
+
+def archive_profiles(user_ids):
+    """Вызывается задачей архивации после каждой порции перенесенных в архив анкет."""
+    for user_id in user_ids:
+        forget_profile(user_id)
+        search_sessions.pop(user_id, None)
 
 
 # --- КЛАВИАТУРЫ (ReplyKeyboardMarkup) ---
+# Статические клавиатуры строятся и сериализуются один раз при запуске (@static_keyboard)
 
+@static_keyboard
 def create_start_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     markup.add(types.KeyboardButton("🔥 Начать"), types.KeyboardButton("ℹ️ О нас"))
     return markup
 
+@static_keyboard
 def create_fill_profile_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     markup.add(types.KeyboardButton("📝 Заполнить анкету"))
     return markup
 
+@static_keyboard
 def create_line_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     markup.row("Gold Line", "Rome", "Средняя линия")
@@ -135,6 +245,7 @@ def create_line_keyboard():
     markup.add(types.KeyboardButton("⬅️ Назад"))
     return markup
 
+@static_keyboard
 def create_rank_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     markup.row("Воин", "Элита", "Мастер")
@@ -143,6 +254,7 @@ def create_rank_keyboard():
     markup.add(types.KeyboardButton("⬅️ Назад"))
     return markup
 
+@static_keyboard
 def create_mythic_rank_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     markup.row("Миф", "Мифическая честь")
@@ -150,49 +262,69 @@ def create_mythic_rank_keyboard():
     markup.add(types.KeyboardButton("⬅️ Назад"))
     return markup
     
+@static_keyboard
 def create_goal_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     markup.add("Поднять ранг", "Поиграть для удовольствия", "Найти постоянную команду")
     markup.add(types.KeyboardButton("⬅️ Назад"))
     return markup
 
+@static_keyboard
 def create_photo_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     markup.add(types.KeyboardButton("📷 Добавить фото"), types.KeyboardButton("➡️ Завершить"))
     return markup
 
+@static_keyboard
 def create_skip_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     markup.add(types.KeyboardButton("➡️ Далее"))
     return markup
 
+@static_keyboard
 def create_main_menu_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     markup.row("🚀 Быстрый поиск", "⚙️ Поиск тиммейта")
     markup.row("👤 Моя анкета", "❤️ Понравился")
     return markup
 
+@static_keyboard
 def create_my_profile_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     markup.add(types.KeyboardButton("✏️ Редактировать анкету"), types.KeyboardButton("🗑️ Удалить анкету"))
     markup.add(types.KeyboardButton("⬅️ В меню"))
     return markup
 
+@static_keyboard
 def create_confirm_delete_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     markup.add(types.KeyboardButton("Да, удалить"), types.KeyboardButton("Нет, отмена"))
     return markup
 
+@static_keyboard
 def create_search_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     markup.add("❤️ Нравится", "👎 Следующий", "⏹️ Завершить поиск")
     return markup
 
+@static_keyboard
 def create_liked_by_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     markup.add("❤️ Нравится в ответ", "👎 Пропустить", "⏹️ Вернуться в меню")
     return markup
 
+ANY_CHOICE = "🔘 Любой"
+
+@keyboard_cache
+def create_filter_keyboard(options):
+    """Клавиатура фильтра детального поиска: варианты + «Любой» + «Назад». options — кортеж."""
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    for i in range(0, len(options), 3):
+        markup.row(*options[i:i + 3])
+    markup.add(types.KeyboardButton(ANY_CHOICE))
+    markup.add(types.KeyboardButton("⬅️ Назад"))
+    return markup
+
 
 # --- ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ---
 
@@ -209,19 +341,37 @@ def format_profile(profile_data):
     return text
 
 
+def render_caption(profile_data):
+    """format_profile с кэшем по user_id и версии анкеты.
+
+    Версия — сам словарь анкеты: save_profile сбрасывает его из profile_cache, и после
+    сохранения анкета загружается новым объектом. Подпись, собранная по старому словарю
+    параллельно с сохранением, к новому не подойдет.
+    """
+    user_id = profile_data['user_id']
+    cached = caption_cache.get(user_id)
+    if cached is not None and cached[0] is profile_data:
+        return cached[1]
+    caption = format_profile(profile_data)
+    caption_cache.put(user_id, (profile_data, caption))
+    return caption
+
+
 # --- ОСНОВНЫЕ ОБРАБОТЧИКИ КОМАНД И СООБЩЕНИЙ ---
 
-@bot.message_handler(commands=['start'])
+@router.command('start')
 def send_welcome(message):
     """Обработчик команды /start."""
     user_id = message.from_user.id
     if user_exists(user_id):
         update_last_active(user_id)
-        bot.send_message(user_id, "С возвращением! Добро пожаловать в главное меню.", reply_markup=create_main_menu_keyboard())
+        outbox.send_message(user_id, "С возвращением! Добро пожаловать в главное меню.", reply_markup=create_main_menu_keyboard())
+    elif restore_profile(user_id):
+        outbox.send_message(user_id, "С возвращением! Ваша анкета снова в поиске.", reply_markup=create_main_menu_keyboard())
     else:
-        bot.send_message(message.chat.id, "👋 Привет! Хочешь найти тиммейтов для Mobile Legends?", reply_markup=create_start_keyboard())
+        outbox.send_message(message.chat.id, "👋 Привет! Хочешь найти тиммейтов для Mobile Legends?", reply_markup=create_start_keyboard())
 
-@bot.message_handler(func=lambda message: message.text == "⬅️ Назад")
+@router.text("⬅️ Назад")
 def back_to_start(message):
     """Обработчик кнопки 'Назад' для отмены регистрации."""
     user_data.pop(message.from_user.id, None) 
@@ -230,306 +380,492 @@ def back_to_start(message):
 
 # --- СЦЕНАРИЙ РЕГИСТРАЦИИ АНКЕТЫ ---
 
-@bot.message_handler(func=lambda message: message.text in ["🔥 Начать", "ℹ️ О нас", "📝 Заполнить анкету"])
+@router.text("🔥 Начать", "ℹ️ О нас", "📝 Заполнить анкету")
 def handle_start_options(message):
     """Обрабатывает первые шаги пользователя."""
     user_id = message.from_user.id
     if message.text == "ℹ️ О нас":
-        bot.send_message(user_id, "Этот раздел в разработке. Здесь будет информация о проекте.", reply_markup=create_fill_profile_keyboard())
+        outbox.send_message(user_id, "Этот раздел в разработке. Здесь будет информация о проекте.", reply_markup=create_fill_profile_keyboard(), priority=PRIORITY_LOW)
         return
-    bot.send_message(user_id, "✍️ Отлично, давайте создадим анкету и будем двигаться дальше.", reply_markup=types.ReplyKeyboardRemove())
-    msg = bot.send_message(user_id, "Введите ваш игровой ник:")
-    bot.register_next_step_handler(msg, process_nickname_step)
+    outbox.send_message(user_id, "✍️ Отлично, давайте создадим анкету и будем двигаться дальше.", reply_markup=types.ReplyKeyboardRemove())
+    outbox.send_message(user_id, "Введите ваш игровой ник:")
+    router.set_step(user_id, process_nickname_step)
 
 def process_nickname_step(message):
     """Шаг 1: Получение ника."""
     user_id = message.from_user.id
     if message.text == "⬅️ Назад": return back_to_start(message)
-    user_data[user_id] = {'nickname': message.text}
-    msg = bot.send_message(user_id, "Укажите ваш winrate в процентах (например, 58):")
-    bot.register_next_step_handler(msg, process_winrate_step)
+    user_data[user_id] = RegistrationDraft(nickname=message.text)
+    outbox.send_message(user_id, "Укажите ваш winrate в процентах (например, 58):")
+    router.set_step(user_id, process_winrate_step)
 
 def process_winrate_step(message):
     """Шаг 2: Получение и проверка winrate."""
     user_id = message.from_user.id
     if message.text == "⬅️ Назад": return back_to_start(message)
+    if user_id not in user_data: return registration_expired(user_id)
     try:
         winrate = int(message.text)
         if not (0 <= winrate <= 100): raise ValueError()
-        user_data[user_id]['winrate'] = winrate
-        msg = bot.send_message(user_id, "На какой линии вы играете?", reply_markup=create_line_keyboard())
-        bot.register_next_step_handler(msg, process_line_step)
+        user_data[user_id].winrate = winrate
+        outbox.send_message(user_id, "На какой линии вы играете?", reply_markup=create_line_keyboard())
+        router.set_step(user_id, process_line_step)
     except (ValueError, TypeError):
-        msg = bot.send_message(user_id, "Пожалуйста, введите ваш winrate цифрами (от 0 до 100).")
-        bot.register_next_step_handler(msg, process_winrate_step)
+        outbox.send_message(user_id, "Пожалуйста, введите ваш winrate цифрами (от 0 до 100).")
+        router.set_step(user_id, process_winrate_step)
 
 def process_line_step(message):
     """Шаг 3: Получение линии."""
     user_id = message.from_user.id
     if message.text == "⬅️ Назад": return back_to_start(message)
-    if message.text not in ["Gold Line", "Rome", "Средняя линия", "Лес", "XP Line", "Везде"]:
-        msg = bot.send_message(user_id, "Пожалуйста, выберите линию с помощью кнопок.", reply_markup=create_line_keyboard())
-        bot.register_next_step_handler(msg, process_line_step)
+    if message.text not in LINES:
+        outbox.send_message(user_id, "Пожалуйста, выберите линию с помощью кнопок.", reply_markup=create_line_keyboard())
+        router.set_step(user_id, process_line_step)
         return
-    user_data[user_id]['line'] = message.text
-    msg = bot.send_message(user_id, "Выберите ваш текущий ранг:", reply_markup=create_rank_keyboard())
-    bot.register_next_step_handler(msg, process_rank_step)
+    if user_id not in user_data: return registration_expired(user_id)
+    user_data[user_id].line = message.text
+    outbox.send_message(user_id, "Выберите ваш текущий ранг:", reply_markup=create_rank_keyboard())
+    router.set_step(user_id, process_rank_step)
 
 def process_rank_step(message):
     """Шаг 4: Получение ранга."""
     user_id = message.from_user.id
     if message.text == "⬅️ Назад": return back_to_start(message)
-    if message.text not in ["Воин", "Элита", "Мастер", "Грандмастер", "Эпик", "Легенда", "Мифический"]:
-        msg = bot.send_message(user_id, "Пожалуйста, выберите ранг с помощью кнопок.", reply_markup=create_rank_keyboard())
-        bot.register_next_step_handler(msg, process_rank_step)
+    if message.text not in RANKS:
+        outbox.send_message(user_id, "Пожалуйста, выберите ранг с помощью кнопок.", reply_markup=create_rank_keyboard())
+        router.set_step(user_id, process_rank_step)
         return
-    user_data[user_id]['rank'] = message.text
-    if message.text == "Мифический":
-        msg = bot.send_message(user_id, "Выберите свой уровень мифического ранга:", reply_markup=create_mythic_rank_keyboard())
-        bot.register_next_step_handler(msg, process_mythic_rank_step)
+    if user_id not in user_data: return registration_expired(user_id)
+    user_data[user_id].rank = message.text
+    if message.text == MYTHIC:
+        outbox.send_message(user_id, "Выберите свой уровень мифического ранга:", reply_markup=create_mythic_rank_keyboard())
+        router.set_step(user_id, process_mythic_rank_step)
     else:
-        user_data[user_id]['mythic_rank'] = None
+        user_data[user_id].mythic_rank = None
         ask_goal_step(user_id)
 
 def process_mythic_rank_step(message):
     """Шаг 4.1: Уточнение мифического ранга."""
     user_id = message.from_user.id
     if message.text == "⬅️ Назад": return back_to_start(message)
-    if message.text not in ["Миф", "Мифическая честь", "Мифическая слава", "Мифический бессмертный"]:
-        msg = bot.send_message(user_id, "Пожалуйста, выберите уровень с помощью кнопок.", reply_markup=create_mythic_rank_keyboard())
-        bot.register_next_step_handler(msg, process_mythic_rank_step)
+    if message.text not in MYTHIC_RANKS:
+        outbox.send_message(user_id, "Пожалуйста, выберите уровень с помощью кнопок.", reply_markup=create_mythic_rank_keyboard())
+        router.set_step(user_id, process_mythic_rank_step)
         return
-    user_data[user_id]['mythic_rank'] = message.text
+    if user_id not in user_data: return registration_expired(user_id)
+    user_data[user_id].mythic_rank = message.text
     ask_goal_step(user_id)
 
 def ask_goal_step(user_id):
     """Шаг 5: Запрос цели игры."""
-    msg = bot.send_message(user_id, "Какая ваша основная цель в игре? Это поможет найти людей со схожими целями.", reply_markup=create_goal_keyboard())
-    bot.register_next_step_handler(msg, process_goal_step)
+    outbox.send_message(user_id, "Какая ваша основная цель в игре? Это поможет найти людей со схожими целями.", reply_markup=create_goal_keyboard())
+    router.set_step(user_id, process_goal_step)
 
 def process_goal_step(message):
     """Шаг 5: Обработка цели игры."""
     user_id = message.from_user.id
     if message.text == "⬅️ Назад": return back_to_start(message)
-    if message.text not in ["Поднять ранг", "Поиграть для удовольствия", "Найти постоянную команду"]:
-        msg = bot.send_message(user_id, "Пожалуйста, выберите цель с помощью кнопок.", reply_markup=create_goal_keyboard())
-        bot.register_next_step_handler(msg, process_goal_step)
+    if message.text not in GOALS:
+        outbox.send_message(user_id, "Пожалуйста, выберите цель с помощью кнопок.", reply_markup=create_goal_keyboard())
+        router.set_step(user_id, process_goal_step)
         return
-    user_data[user_id]['goal'] = message.text
-    msg = bot.send_message(user_id, "Расскажите немного о себе (например, ваш стиль игры, любимые герои). Это необязательно.", reply_markup=create_skip_keyboard())
-    bot.register_next_step_handler(msg, process_about_step)
+    if user_id not in user_data: return registration_expired(user_id)
+    user_data[user_id].goal = message.text
+    outbox.send_message(user_id, "Расскажите немного о себе (например, ваш стиль игры, любимые герои). Это необязательно.", reply_markup=create_skip_keyboard())
+    router.set_step(user_id, process_about_step)
 
 def process_about_step(message):
     """Шаг 6: Получение информации о себе."""
     user_id = message.from_user.id
-    user_data[user_id]['about'] = None if message.text == "➡️ Далее" else message.text
-    msg = bot.send_message(user_id, "И последний штрих! Хотите добавить фото, чтобы повысить доверие других игроков?", reply_markup=create_photo_keyboard())
-    bot.register_next_step_handler(msg, process_photo_step)
+    if user_id not in user_data: return registration_expired(user_id)
+    user_data[user_id].about = None if message.text == "➡️ Далее" else message.text
+    outbox.send_message(user_id, "И последний штрих! Хотите добавить фото, чтобы повысить доверие других игроков?", reply_markup=create_photo_keyboard())
+    router.set_step(user_id, process_photo_step)
 
 def process_photo_step(message):
     """Шаг 7: Обработка фото или завершение."""
     user_id = message.from_user.id
+    if user_id not in user_data: return registration_expired(user_id)
     if message.text == "📷 Добавить фото":
-        msg = bot.send_message(user_id, "Отправьте мне фото, которое будет в вашей анкете.", reply_markup=types.ReplyKeyboardRemove())
-        bot.register_next_step_handler(msg, process_final_photo_upload)
+        outbox.send_message(user_id, "Отправьте мне фото, которое будет в вашей анкете.", reply_markup=types.ReplyKeyboardRemove())
+        router.set_step(user_id, process_final_photo_upload)
     elif message.text == "➡️ Завершить":
-        user_data[user_id]['photo_id'] = None
+        user_data[user_id].photo_id = None
         finalize_profile(user_id, message.from_user.username)
     else:
-        msg = bot.send_message(user_id, "Пожалуйста, используйте кнопки.", reply_markup=create_photo_keyboard())
-        bot.register_next_step_handler(msg, process_photo_step)
+        outbox.send_message(user_id, "Пожалуйста, используйте кнопки.", reply_markup=create_photo_keyboard())
+        router.set_step(user_id, process_photo_step)
 
-@bot.message_handler(content_types=['photo'])
+@router.content_type('photo')
 def process_final_photo_upload(message):
     """Обрабатывает загруженное фото и завершает регистрацию."""
     if message.from_user.id in user_data:
         user_id = message.from_user.id
-        user_data[user_id]['photo_id'] = message.photo[-1].file_id
+        user_data[user_id].photo_id = message.photo[-1].file_id
         finalize_profile(user_id, message.from_user.username)
     else:
-        bot.send_message(message.from_user.id, "Вы можете добавить фото при редактировании анкеты.")
+        outbox.send_message(message.from_user.id, "Вы можете добавить фото при редактировании анкеты.")
+
+def registration_expired(user_id):
+    """Черновик анкеты вытеснен по простою — предлагаем начать заново."""
+    outbox.send_message(user_id, "⌛ Заполнение анкеты заняло слишком много времени. Давайте начнем заново.", reply_markup=create_fill_profile_keyboard())
 
 def finalize_profile(user_id, username):
     """Сохраняет анкету в БД, очищает временные данные и показывает главное меню."""
-    user_data[user_id]['telegram_username'] = username
-    save_profile(user_id, user_data[user_id])
-    user_data.pop(user_id, None)
-    bot.send_message(user_id, "🎉 Поздравляем! Ваша анкета создана. Добро пожаловать в главное меню!", reply_markup=create_main_menu_keyboard())
+    draft = user_data.pop(user_id)
+    draft.telegram_username = username
+    save_profile(user_id, draft)
+    outbox.send_message(user_id, "🎉 Поздравляем! Ваша анкета создана. Добро пожаловать в главное меню!", reply_markup=create_main_menu_keyboard())
 
 
 # --- ОБРАБОТЧИКИ ГЛАВНОГО МЕНЮ ---
 
-@bot.message_handler(func=lambda message: message.text == "👤 Моя анкета")
+@router.text("👤 Моя анкета")
 def my_profile_handler(message):
     """Показывает анкету пользователя."""
     user_id = message.from_user.id
     update_last_active(user_id)
     profile = get_profile(user_id)
     if profile:
-        caption = format_profile(profile)
+        counters = likes.get_counters(user_id)
+        caption = (f"{render_caption(profile)}\n\n"
+                   f"❤️ Лайков: {counters['likes_received']} (ждут ответа: {counters['inbox_count']}) · 🎉 Мэтчей: {counters['matches_count']}")
         if profile.get('photo_id'):
-            bot.send_photo(user_id, profile['photo_id'], caption=caption, reply_markup=create_my_profile_keyboard())
+            outbox.send_photo(user_id, profile['photo_id'], caption=caption, reply_markup=create_my_profile_keyboard())
         else:
-            bot.send_message(user_id, caption, reply_markup=create_my_profile_keyboard())
+            outbox.send_message(user_id, caption, reply_markup=create_my_profile_keyboard())
     else:
-        bot.send_message(user_id, "Ваша анкета еще не создана.", reply_markup=create_fill_profile_keyboard())
+        outbox.send_message(user_id, "Ваша анкета еще не создана.", reply_markup=create_fill_profile_keyboard())
 
-@bot.message_handler(func=lambda message: message.text == "🗑️ Удалить анкету")
+@router.text("🗑️ Удалить анкету")
 def delete_profile_confirm(message):
     """Запрашивает подтверждение на удаление анкеты."""
-    bot.send_message(message.from_user.id, "Вы уверены, что хотите удалить свою анкету? Это действие необратимо.", reply_markup=create_confirm_delete_keyboard())
+    outbox.send_message(message.from_user.id, "Вы уверены, что хотите удалить свою анкету? Это действие необратимо.", reply_markup=create_confirm_delete_keyboard())
 
-@bot.message_handler(func=lambda message: message.text in ["Да, удалить", "Нет, отмена"])
+@router.text("Да, удалить", "Нет, отмена")
 def process_delete_confirmation(message):
     """Обрабатывает подтверждение удаления."""
     user_id = message.from_user.id
     if message.text == "Да, удалить":
         delete_profile(user_id)
-        bot.send_message(user_id, "Ваша анкета была удалена.", reply_markup=types.ReplyKeyboardRemove())
+        outbox.send_message(user_id, "Ваша анкета была удалена.", reply_markup=types.ReplyKeyboardRemove())
         send_welcome(message)
     else:
         my_profile_handler(message)
 
-@bot.message_handler(func=lambda message: message.text == "✏️ Редактировать анкету")
+@router.text("✏️ Редактировать анкету")
 def edit_profile_handler(message):
     """Начинает процесс редактирования анкеты (через перезаполнение)."""
-    bot.send_message(message.from_user.id, "Давайте обновим вашу анкету. Начнем сначала.")
+    outbox.send_message(message.from_user.id, "Давайте обновим вашу анкету. Начнем сначала.")
     handle_start_options(message)
 
 
 # --- ЛОГИКА ПОИСКА И ЛАЙКОВ ---
-search_sessions = {}  # Хранит сессии поиска: {user_id: {'profiles': [], 'current_index': 0}}
+search_sessions = SessionStore(ttl=1800, maxsize=100_000)  # {user_id: SearchSession}, брошенные вытесняются
 
-@bot.message_handler(func=lambda message: message.text == "🚀 Быстрый поиск")
+@router.text("🚀 Быстрый поиск")
 def quick_search_handler(message):
     """Начинает быстрый поиск активных игроков."""
     user_id = message.from_user.id
     update_last_active(user_id)
-    conn = sqlite3.connect('mlbb_finder.db')
-    cursor = conn.cursor()
-    time_threshold = datetime.now() - timedelta(minutes=10) # Ищем активных за последние 10 минут
-    cursor.execute("SELECT user_id FROM profiles WHERE user_id != ? AND last_active >= ?", (user_id, time_threshold))
-    profiles_found = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    active = active_players.active_except(user_id) # Активные за последние 10 минут, из памяти
+    profiles_found = seen_profiles.exclude(user_id, active) # Уже показанные отсеиваем до загрузки анкет
+    profiles_found = profile_ranker.rank(user_id, profiles_found) # Самые подходящие — первыми
+    # Впереди — активные из очереди рекомендаций по общим лайкам (считается пакетной задачей)
+    profiles_found = recommendations.merge_queue(recommendations.get_queue(user_id), profiles_found)
     if not profiles_found:
-        bot.send_message(user_id, "😔 Активных игроков поблизости не найдено. Попробуйте позже.", reply_markup=create_main_menu_keyboard())
+        if active:
+            outbox.send_message(user_id, "👀 Всех активных игроков вы уже посмотрели. Загляните чуть позже!", reply_markup=create_main_menu_keyboard())
+        else:
+            outbox.send_message(user_id, "😔 Активных игроков поблизости не найдено. Попробуйте позже.", reply_markup=create_main_menu_keyboard())
         return
-    search_sessions[user_id] = {'profiles': profiles_found, 'current_index': 0}
+    search_sessions[user_id] = SearchSession(profiles_found)
     show_next_profile_in_search(user_id)
 
-def show_next_profile_in_search(user_id, is_liked_by_flow=False):
-    """Показывает следующую анкету из списка поиска."""
+def show_next_profile_in_search(user_id, is_liked_by_flow=False, keyboard_shown=False):
+    """Показывает следующую анкету из списка поиска.
+
+    keyboard_shown=True — пользователь только что нажал кнопку клавиатуры поиска, она у него
+    на экране (обычная клавиатура без one_time остается до замены), и карточка уходит без нее.
+    """
     session = search_sessions.get(user_id)
-    if not session or session['current_index'] >= len(session['profiles']):
-        bot.send_message(user_id, "✅ Поиск завершен. Больше анкет не найдено.", reply_markup=create_main_menu_keyboard())
+    if not session or session.current() is None:
+        outbox.send_message(user_id, "✅ Поиск завершен. Больше анкет не найдено.", reply_markup=create_main_menu_keyboard())
         search_sessions.pop(user_id, None)
         return
-    next_profile_id = session['profiles'][session['current_index']]
+    next_profile_id = session.current()
+    if next_profile_id not in profile_cache:
+        # Подгружаем сразу страницу анкет, чтобы следующие свайпы шли из кэша
+        index = session.current_index
+        get_profiles(session.profiles[index:index + PREFETCH_PAGE])
     profile_data = get_profile(next_profile_id)
     if not profile_data: # Пропускаем, если анкета была удалена
-        session['current_index'] += 1
-        show_next_profile_in_search(user_id, is_liked_by_flow)
+        session.current_index += 1
+        show_next_profile_in_search(user_id, is_liked_by_flow, keyboard_shown)
         return
-    caption = format_profile(profile_data)
-    markup = create_liked_by_keyboard() if is_liked_by_flow else create_search_keyboard()
+    seen_profiles.mark(user_id, next_profile_id)
+    caption = render_caption(profile_data)
+    markup = None
+    if not keyboard_shown:
+        markup = create_liked_by_keyboard() if is_liked_by_flow else create_search_keyboard()
     if profile_data.get('photo_id'):
-        bot.send_photo(user_id, profile_data['photo_id'], caption=caption, reply_markup=markup)
+        outbox.send_photo(user_id, profile_data['photo_id'], caption=caption, reply_markup=markup, priority=PRIORITY_HIGH)
     else:
-        bot.send_message(user_id, caption, reply_markup=markup)
+        outbox.send_message(user_id, caption, reply_markup=markup, priority=PRIORITY_HIGH)
 
-@bot.message_handler(func=lambda message: message.text in ["👎 Следующий", "👎 Пропустить"])
+@router.text("👎 Следующий", "👎 Пропустить")
 def next_profile_handler(message):
     """Показывает следующую анкету в поиске."""
     user_id = message.from_user.id
     update_last_active(user_id)
-    if user_id in search_sessions:
-        search_sessions[user_id]['current_index'] += 1
+    session = search_sessions.get(user_id)
+    if session:
+        session.current_index += 1
         is_liked_by_flow = message.text == "👎 Пропустить"
-        show_next_profile_in_search(user_id, is_liked_by_flow)
+        show_next_profile_in_search(user_id, is_liked_by_flow, keyboard_shown=True)
 
-@bot.message_handler(func=lambda message: message.text in ["⏹️ Завершить поиск", "⏹️ Вернуться в меню", "⬅️ В меню"])
+@router.text("⏹️ Завершить поиск", "⏹️ Вернуться в меню", "⬅️ В меню")
 def stop_search_handler(message):
     """Завершает сессию поиска и возвращает в меню."""
     user_id = message.from_user.id
     search_sessions.pop(user_id, None)
-    bot.send_message(user_id, "Возвращаю в главное меню.", reply_markup=create_main_menu_keyboard())
+    outbox.send_message(user_id, "Возвращаю в главное меню.", reply_markup=create_main_menu_keyboard())
 
-@bot.message_handler(func=lambda message: message.text in ["❤️ Нравится", "❤️ Нравится в ответ"])
+@router.text("❤️ Нравится", "❤️ Нравится в ответ")
 def like_handler(message):
     """Обрабатывает лайк и проверяет на мэтч."""
     liker_id = message.from_user.id
     update_last_active(liker_id)
-    if liker_id not in search_sessions: return
-    session = search_sessions[liker_id]
-    if session['current_index'] >= len(session['profiles']): return
-    liked_id = session['profiles'][session['current_index']]
-    
-    conn = sqlite3.connect('mlbb_finder.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM likes WHERE liker_id = ? AND liked_id = ?", (liker_id, liked_id))
-    if cursor.fetchone() is None:
-        cursor.execute("INSERT INTO likes (liker_id, liked_id) VALUES (?, ?)", (liker_id, liked_id))
-        conn.commit()
-    bot.send_message(liker_id, "✅ Ваш лайк отправлен!")
-
-    # Проверка на взаимный лайк (мэтч)
-    cursor.execute("SELECT 1 FROM likes WHERE liker_id = ? AND liked_id = ?", (liked_id, liker_id))
-    is_match = cursor.fetchone() is not None
-    conn.close()
-
-    if is_match:
-        liker_profile = get_profile(liker_id)
-        liked_profile = get_profile(liked_id)
+    session = search_sessions.get(liker_id)
+    if not session: return
+    liked_id = session.current()
+    if liked_id is None: return
+    outbox.send_message(liker_id, "✅ Ваш лайк отправлен!", priority=PRIORITY_LOW)
+    record_like(liker_id, liked_id)
+    is_liked_by_flow = message.text == "❤️ Нравится в ответ"
+    session.current_index += 1
+    show_next_profile_in_search(liker_id, is_liked_by_flow, keyboard_shown=True)
+
+def record_like(liker_id, liked_id):
+    """Сохраняет лайк и при взаимности сообщает обоим о мэтче."""
+    # Лайк, мэтч, входящие и счетчики — одной транзакцией; повторный лайк мэтча не дает
+    if likes.record_like(liker_id, liked_id):
+        profiles = get_profiles([liker_id, liked_id])
+        liker_profile = profiles.get(liker_id)
+        liked_profile = profiles.get(liked_id)
         if liker_profile and liked_profile:
             liker_username = f"@{liker_profile['telegram_username']}" if liker_profile.get('telegram_username') else "профиль"
             liked_username = f"@{liked_profile['telegram_username']}" if liked_profile.get('telegram_username') else "профиль"
-            bot.send_message(liker_id, f"🎉 Мэтч! Вы понравились игроку {liked_profile['nickname']}. Начните общение: {liked_username}")
-            bot.send_message(liked_id, f"🎉 Мэтч! Вы понравились игроку {liker_profile['nickname']}. Начните общение: {liker_username}")
-
-    is_liked_by_flow = message.text == "❤️ Нравится в ответ"
-    search_sessions[liker_id]['current_index'] += 1
-    show_next_profile_in_search(liker_id, is_liked_by_flow)
+            outbox.send_message(liker_id, f"🎉 Мэтч! Вы понравились игроку {liked_profile['nickname']}. Начните общение: {liked_username}", priority=PRIORITY_HIGH)
+            outbox.send_message(liked_id, f"🎉 Мэтч! Вы понравились игроку {liker_profile['nickname']}. Начните общение: {liker_username}", priority=PRIORITY_HIGH)
 
-@bot.message_handler(func=lambda message: message.text == "❤️ Понравился")
+@router.text("❤️ Понравился")
 def liked_by_list_handler(message):
     """Показывает список тех, кто лайкнул пользователя."""
     user_id = message.from_user.id
     update_last_active(user_id)
-    conn = sqlite3.connect('mlbb_finder.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT l1.liker_id FROM likes l1 WHERE l1.liked_id = ? AND NOT EXISTS (SELECT 1 FROM likes l2 WHERE l2.liker_id = ? AND l2.liked_id = l1.liker_id)
-    ''', (user_id, user_id))
-    profiles_found = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    profiles_found = profile_ranker.rank(user_id, likes.liked_by(user_id)) # Входящие без ответа, по ключу
     if not profiles_found:
-        bot.send_message(user_id, "😔 Пока что ваша анкета никому не понравилась. Не переживайте, вас скоро заметят!", reply_markup=create_main_menu_keyboard())
+        outbox.send_message(user_id, "😔 Пока что ваша анкета никому не понравилась. Не переживайте, вас скоро заметят!", reply_markup=create_main_menu_keyboard())
         return
-    bot.send_message(user_id, "💌 Эти игроки проявили к вам интерес. Посмотрим?")
-    search_sessions[user_id] = {'profiles': profiles_found, 'current_index': 0}
+    outbox.send_message(user_id, "💌 Эти игроки проявили к вам интерес. Посмотрим?", priority=PRIORITY_LOW)
+    search_sessions[user_id] = SearchSession(profiles_found)
     show_next_profile_in_search(user_id, is_liked_by_flow=True)
 
-@bot.message_handler(func=lambda message: message.text == "⚙️ Поиск тиммейта")
+# --- ДЕТАЛЬНЫЙ ПОИСК ТИММЕЙТА ---
+search_filters = SessionStore(ttl=1800, maxsize=50_000)  # Фильтры детального поиска: {user_id: {'line': ..., 'rank': ..., ...}}
+
+@router.text("⚙️ Поиск тиммейта")
 def detailed_search_handler(message):
-    """Заглушка для детального поиска."""
-    update_last_active(message.from_user.id)
-    bot.send_message(message.from_user.id, "🛠 Функция детального поиска с фильтрами находится в разработке и скоро будет добавлена!", reply_markup=create_main_menu_keyboard())
+    """Начинает детальный поиск: по очереди спрашивает фильтры."""
+    user_id = message.from_user.id
+    update_last_active(user_id)
+    search_filters[user_id] = {}
+    lines = [line for line in LINES if line != ANY_LINE]  # «Везде» подходит под любую линию
+    outbox.send_message(user_id, "Какая линия нужна тиммейту?", reply_markup=create_filter_keyboard(tuple(lines)))
+    router.set_step(user_id, process_filter_line_step)
+
+def cancel_detailed_search(message):
+    """Отмена детального поиска кнопкой 'Назад'."""
+    search_filters.pop(message.from_user.id, None)
+    stop_search_handler(message)
+
+def leave_detailed_search(message):
+    """Кнопка главного меню вместо фильтра: отменяет детальный поиск и выполняет ее."""
+    search_filters.pop(message.from_user.id, None)
+    router.dispatch(message)  # Шаг уже снят, так что Router выберет обработчик кнопки
+
+def leave_filter_step(message):
+    """Общее начало шагов фильтра. True — сообщение уже обработано вне шага.
+
+    Кнопки меню и команды выполняются даже тогда, когда фильтры успели
+    истечь: иначе /start отвергался бы как неверный вариант, а кнопка
+    меню — пропадала бы за «Возвращаю в главное меню».
+    """
+    if message.text == "⬅️ Назад":
+        cancel_detailed_search(message)
+    elif router.match_text(message.text) is not None:
+        leave_detailed_search(message)
+    elif message.from_user.id not in search_filters:
+        cancel_detailed_search(message)
+    else:
+        return False
+    return True
+
+def process_filter_line_step(message):
+    """Фильтр 1: линия."""
+    user_id = message.from_user.id
+    if leave_filter_step(message): return
+    if message.text != ANY_CHOICE and message.text not in LINES:
+        outbox.send_message(user_id, "Пожалуйста, выберите линию с помощью кнопок.")
+        router.set_step(user_id, process_filter_line_step)
+        return
+    search_filters[user_id]['line'] = None if message.text == ANY_CHOICE else message.text
+    outbox.send_message(user_id, "Какой ранг вас интересует?", reply_markup=create_filter_keyboard(RANKS))
+    router.set_step(user_id, process_filter_rank_step)
+
+def process_filter_rank_step(message):
+    """Фильтр 2: ранг."""
+    user_id = message.from_user.id
+    if leave_filter_step(message): return
+    if message.text != ANY_CHOICE and message.text not in RANKS:
+        outbox.send_message(user_id, "Пожалуйста, выберите ранг с помощью кнопок.")
+        router.set_step(user_id, process_filter_rank_step)
+        return
+    search_filters[user_id]['rank'] = None if message.text == ANY_CHOICE else message.text
+    if message.text == MYTHIC:
+        outbox.send_message(user_id, "Какой уровень мифического ранга?", reply_markup=create_filter_keyboard(MYTHIC_RANKS))
+        router.set_step(user_id, process_filter_mythic_rank_step)
+    else:
+        ask_filter_goal_step(user_id)
+
+def process_filter_mythic_rank_step(message):
+    """Фильтр 2.1: уровень мифического ранга."""
+    user_id = message.from_user.id
+    if leave_filter_step(message): return
+    if message.text != ANY_CHOICE and message.text not in MYTHIC_RANKS:
+        outbox.send_message(user_id, "Пожалуйста, выберите уровень с помощью кнопок.")
+        router.set_step(user_id, process_filter_mythic_rank_step)
+        return
+    search_filters[user_id]['mythic_rank'] = None if message.text == ANY_CHOICE else message.text
+    ask_filter_goal_step(user_id)
+
+def ask_filter_goal_step(user_id):
+    """Фильтр 3: запрос цели."""
+    outbox.send_message(user_id, "С какой целью должен играть тиммейт?", reply_markup=create_filter_keyboard(GOALS))
+    router.set_step(user_id, process_filter_goal_step)
+
+def process_filter_goal_step(message):
+    """Фильтр 3: цель."""
+    user_id = message.from_user.id
+    if leave_filter_step(message): return
+    if message.text != ANY_CHOICE and message.text not in GOALS:
+        outbox.send_message(user_id, "Пожалуйста, выберите цель с помощью кнопок.")
+        router.set_step(user_id, process_filter_goal_step)
+        return
+    search_filters[user_id]['goal'] = None if message.text == ANY_CHOICE else message.text
+    outbox.send_message(user_id, "Минимальный winrate тиммейта в процентах (например, 50)?", reply_markup=create_filter_keyboard(()))
+    router.set_step(user_id, process_filter_winrate_step)
 
-@bot.message_handler(func=lambda message: True)
+def process_filter_winrate_step(message):
+    """Фильтр 4: минимальный winrate, затем запуск поиска."""
+    user_id = message.from_user.id
+    if leave_filter_step(message): return
+    if message.text == ANY_CHOICE:
+        search_filters[user_id]['winrate_min'] = None
+    else:
+        try:
+            winrate = int(message.text)
+            if not (0 <= winrate <= 100): raise ValueError()
+            search_filters[user_id]['winrate_min'] = winrate
+        except (ValueError, TypeError):
+            outbox.send_message(user_id, "Пожалуйста, введите winrate цифрами (от 0 до 100).")
+            router.set_step(user_id, process_filter_winrate_step)
+            return
+    run_detailed_search(user_id)
+
+def run_detailed_search(user_id):
+    """Подбирает анкеты по фильтрам через индекс и запускает просмотр."""
+    filters = search_filters.pop(user_id, {})
+    line = filters.get('line')
+    profiles_found = profile_filters.search(
+        exclude=user_id,
+        line=(line, ANY_LINE) if line else None,
+        rank=filters.get('rank'),
+        mythic_rank=filters.get('mythic_rank'),
+        goal=filters.get('goal'),
+        winrate_min=filters.get('winrate_min'),
+    )
+    profiles_found = profile_ranker.rank(user_id, seen_profiles.exclude(user_id, profiles_found))
+    if not profiles_found:
+        outbox.send_message(user_id, "😔 По вашим фильтрам никого не нашлось. Попробуйте смягчить условия.", reply_markup=create_main_menu_keyboard())
+        return
+    search_sessions[user_id] = SearchSession(profiles_found)
+    show_next_profile_in_search(user_id)
+
+@router.default
 def handle_all_text(message):
     """Обрабатывает любой текст, который не подошел под другие обработчики."""
     user_id = message.from_user.id
     if user_exists(user_id):
         update_last_active(user_id)
-        bot.send_message(user_id, "Используйте кнопки в меню для навигации.", reply_markup=create_main_menu_keyboard())
+        outbox.send_message(user_id, "Используйте кнопки в меню для навигации.", reply_markup=create_main_menu_keyboard())
     else:
         send_welcome(message)
 
 
 # --- ЗАПУСК БОТА ---
-if __name__ == '__main__':
+MODES = ('polling', 'async', 'webhook', 'workers')
+
+def startup():
+    """Готовит базу, индексы в памяти и фоновые задачи (общая часть всех режимов)."""
     print("Инициализация базы данных...")
     init_db()
-    print("База данных готова.")
-    print("Бот запускается...")
-    bot.polling(none_stop=True)
+    print(f"База данных готова. Активных игроков: {active_players.rebuild()}, анкет в индексе фильтров: {profile_filters.rebuild()}, в ранжировании: {profile_ranker.rebuild()}.")
+    print(f"Восстановлено сессий поиска: {load_search_sessions(search_sessions, shard=(WORKER_INDEX, WORKER_COUNT))}.")
+    activity.start()
+    seen_profiles.start()
+    outbox.start()
+    if WORKER_INDEX == 0:  # Архивация одна на все процессы
+        retention_worker.start()
+    global metrics_server
+    metrics_server = metrics.start_server_from_env(port_offset=WORKER_INDEX)
+    if metrics_server:
+        print(f"Метрики: {metrics_server.address} (замеры {'включены' if metrics.enabled else 'выключены'}, POST /enable — включить).")
+
+def shutdown():
+    """Досылает сообщения, сбрасывает буферы на диск и закрывает соединения."""
+    if metrics_server:
+        metrics_server.stop()
+    retention_worker.stop()
+    outbox.stop()
+    print(f"Исходящие: {outbox.get_metrics()}")
+    activity.stop()
+    seen_profiles.stop()
+    save_search_sessions(search_sessions, shard=(WORKER_INDEX, WORKER_COUNT))
+    print(f"Сессии поиска: {search_sessions.memory_report()}, черновики анкет: {user_data.memory_report()}, просмотренные: {seen_profiles.memory_report()}")
+    storage.close_all()
+
+if __name__ == '__main__':
+    # Режим работы: python main.py [polling|async|webhook|workers] (по умолчанию polling)
+    mode = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('BOT_MODE', 'polling')
+    if mode not in MODES:
+        print(f"Неизвестный режим '{mode}'. Доступны: {', '.join(MODES)}.")
+        exit()
+    if mode == 'workers':
+        # Процессы запускает supervisor.py; заменяем этот процесс им, чтобы бот не создавался дважды
+        supervisor_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'supervisor.py')
+        os.execv(sys.executable, [sys.executable, supervisor_path, *sys.argv[2:]])
+    if mode == 'async':
+        import async_runner
+        async_runner.run(sys.modules[__name__])
+    elif mode == 'webhook':
+        import webhook
+        webhook.run(sys.modules[__name__])
+    else:
+        startup()
+        print("Бот запускается...")
+        try:
+            bot.polling(none_stop=True)
+        finally:
+            shutdown()
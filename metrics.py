@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""Замеры горячих путей: обработчики, запросы SQLite и вызовы Bot API.
+
+Когда бот тормозит, нужно понять, кто виноват: сам обработчик, блокировки
+SQLite или Telegram. Поэтому время меряется в трех местах, через которые
+проходит вся работа:
+- Router.dispatch — каждый обработчик сообщений и шагов сценариев
+  (гистограмма handler_seconds{handler=...});
+- storage.execute / executemany / fetch* и transaction — каждый запрос
+  (sql_seconds{statement="SELECT profiles"}); запросы дольше
+  SLOW_QUERY_MS пишутся в лог вместе с текстом и параметрами;
+- Outbox — каждый вызов Bot API, включая неудачные (api_seconds{method=...}).
+
+Замеры включаются и выключаются на лету: enable() / disable() или
+POST /enable, /disable на сервере метрик. В выключенном состоянии горячий путь
+платит одну проверку флага `metrics.enabled`.
+
+GET /metrics на MetricsServer (только localhost) отдает гистограммы и
+счетчики в текстовом формате Prometheus.
+
+Переменные окружения: METRICS=1 — включить замеры при запуске,
+METRICS_PORT — порт сервера метрик (не задан — сервер не запускается),
+SLOW_QUERY_MS — порог медленного запроса.
+"""
+import os
+import re
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- НАСТРОЙКИ ---
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Секунды
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_CHARS = 500  # Сколько символов запроса писать в лог
+
+enabled = os.environ.get('METRICS', '') not in ('', '0')
+
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+(\w+)', re.IGNORECASE)
+_labels = {}  # {текст запроса: метка} — тексты запросов в коде наперечет
+
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+
+# --- ГИСТОГРАММЫ И СЧЕТЧИКИ ---
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин; ряды по значению метки."""
+
+    def __init__(self, name, help_text, label, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}  # {значение метки: [счетчики корзин..., +Inf, сумма]}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+
+    def snapshot(self):
+        """{значение метки: (накопленные счетчики по корзинам, число, сумма)}."""
+        with self._lock:
+            series = {label: list(values) for label, values in self._series.items()}
+        result = {}
+        for label, values in series.items():
+            cumulative, total = [], 0
+            for count in values[:-1]:
+                total += count
+                cumulative.append(total)
+            result[label] = (cumulative, total, values[-1])
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label, (cumulative, count, total) in sorted(self.snapshot().items(), key=lambda item: str(item[0])):
+            base = f'{self.label}="{_escape(label)}"'
+            for bound, value in zip(self.buckets + ('+Inf',), cumulative):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {value}')
+            lines.append(f'{self.name}_sum{{{base}}} {total:.6f}')
+            lines.append(f'{self.name}_count{{{base}}} {count}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+handler_seconds = Histogram('mlbb_handler_seconds', 'Время обработчика сообщения', 'handler')
+sql_seconds = Histogram('mlbb_sql_seconds', 'Время запроса SQLite (вместе с чтением строк)', 'statement')
+api_seconds = Histogram('mlbb_api_seconds', 'Время вызова Bot API', 'method')
+HISTOGRAMS = [handler_seconds, sql_seconds, api_seconds]
+
+slow_queries = {'count': 0}
+_slow_lock = threading.Lock()
+_collectors = []  # [(префикс, функция без аргументов → {имя: число})]
+
+
+def register_collector(prefix, collect):
+    """Добавляет в /metrics готовые счетчики модуля (storage.get_stats, outbox.get_metrics...)."""
+    _collectors.append((prefix, collect))
+
+
+def reset():
+    for histogram in HISTOGRAMS:
+        histogram.reset()
+    slow_queries['count'] = 0
+
+
+# --- ЗАМЕРЫ ---
+
+def statement_label(sql):
+    """Короткая метка запроса: глагол и первая таблица ('SELECT profiles'), чтобы рядов было немного."""
+    label = _labels.get(sql)
+    if label is None:
+        words = sql.split(None, 1)
+        verb = words[0].upper() if words else 'OTHER'
+        table = _TABLE.search(sql)
+        label = f"{verb} {table.group(1)}" if table else verb
+        if len(_labels) < 10_000:  # Запросы со списками IN (?, ?, ...) разной длины не раздувают словарь
+            _labels[sql] = label
+    return label
+
+def observe_sql(sql, seconds, params=None):
+    sql_seconds.observe(statement_label(sql), seconds)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        with _slow_lock:
+            slow_queries['count'] += 1
+        text = ' '.join(sql.split())[:SLOW_QUERY_CHARS]
+        print(f"Медленный запрос ({seconds * 1000:.1f} мс, поток {threading.current_thread().name}): {text} {_short(params)}")
+
+def _short(params):
+    if not params:
+        return ''
+    if isinstance(params, (list, tuple)) and len(params) > 10:
+        return f"[{len(params)} параметров]"
+    return repr(params)[:200]
+
+
+# --- ЭКСПОРТ ---
+
+def render():
+    """Все метрики в текстовом формате Prometheus."""
+    lines = ["# TYPE mlbb_metrics_enabled gauge", f"mlbb_metrics_enabled {int(enabled)}",
+             "# TYPE mlbb_sql_slow_total counter", f"mlbb_sql_slow_total {slow_queries['count']}"]
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for prefix, collect in _collectors:
+        try:
+            values = collect()
+        except Exception as e:  # Метрики не должны ронять сервер
+            lines.append(f"# {prefix}: {e}")
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"mlbb_{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', str(key))} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class MetricsServer:
+    """HTTP-сервер метрик: GET /metrics, POST /enable и /disable. Слушает только localhost."""
+
+    def __init__(self, port=9108, host='127.0.0.1'):
+        self.httpd = _HTTPServer((host, port), self._make_handler())
+
+    @property
+    def address(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def _make_handler(self):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    return self._reply(404, b'')
+                self._reply(200, render().encode(), 'text/plain; version=0.0.4; charset=utf-8')
+
+            def do_POST(self):
+                if self.path == '/enable':
+                    enable()
+                elif self.path == '/disable':
+                    disable()
+                elif self.path == '/reset':
+                    reset()
+                else:
+                    return self._reply(404, b'')
+                self._reply(200, f"enabled={int(enabled)}\n".encode(), 'text/plain')
+
+            def _reply(self, code, body, content_type='text/plain'):
+                self.send_response(code)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # Prometheus опрашивает часто
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name='metrics-http', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def start_server_from_env(port_offset=0):
+    """Запускает MetricsServer, если задан METRICS_PORT. Возвращает сервер или None.
+
+    port_offset — номер процесса в режиме workers: у каждого свой порт METRICS_PORT + номер.
+    """
+    port = os.environ.get('METRICS_PORT')
+    if not port:
+        return None
+    return MetricsServer(int(port) + port_offset, os.environ.get('METRICS_HOST', '127.0.0.1')).start()
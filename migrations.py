@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""Версионированные миграции схемы базы.
+
+Текущая версия схемы хранится в самой базе (PRAGMA user_version). При запуске
+применяются только миграции с большим номером, каждая — в своей транзакции
+вместе с обновлением версии. Благодаря WAL читатели продолжают работать, пока
+идет миграция, поэтому живую базу можно обновлять на месте.
+
+Чтобы добавить миграцию, допишите функцию и добавьте ее в конец MIGRATIONS.
+Номера уже выпущенных миграций менять нельзя.
+"""
+import storage
+
+
+def _create_base_tables():
+    """1: исходные таблицы profiles и likes."""
+    # Таблица для анкет пользователей
+    storage.execute('''
+    CREATE TABLE IF NOT EXISTS profiles (
+        user_id INTEGER PRIMARY KEY,
+        telegram_username TEXT,
+        nickname TEXT,
+        winrate INTEGER,
+        line TEXT,
+        rank TEXT,
+        mythic_rank TEXT,
+        goal TEXT,
+        about TEXT,
+        photo_id TEXT,
+        last_active TIMESTAMP
+    )''')
+    # Таблица для лайков
+    storage.execute('''
+    CREATE TABLE IF NOT EXISTS likes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        liker_id INTEGER,
+        liked_id INTEGER,
+        FOREIGN KEY (liker_id) REFERENCES profiles(user_id),
+        FOREIGN KEY (liked_id) REFERENCES profiles(user_id)
+    )''')
+
+def _add_likes_uniqueness_and_indexes():
+    """2: уникальность лайков и индексы под поиск, мэтчи и «Понравился»."""
+    # Убираем дубли, оставляя самый ранний лайк, иначе уникальный индекс не создастся
+    storage.execute('''
+    DELETE FROM likes WHERE id NOT IN (SELECT MIN(id) FROM likes GROUP BY liker_id, liked_id)
+    ''')
+    # Проверка дубля и мэтча: WHERE liker_id = ? AND liked_id = ?
+    storage.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_likes_pair ON likes (liker_id, liked_id)")
+    # «Кто меня лайкнул»: WHERE liked_id = ?, liker_id берется прямо из индекса
+    storage.execute("CREATE INDEX IF NOT EXISTS idx_likes_liked ON likes (liked_id, liker_id)")
+    # Быстрый поиск: активные за последние 10 минут
+    storage.execute("CREATE INDEX IF NOT EXISTS idx_profiles_last_active ON profiles (last_active)")
+
+def _add_search_sessions_table():
+    """3: таблица для сохранения сессий поиска между перезапусками."""
+    storage.execute('''
+    CREATE TABLE IF NOT EXISTS search_sessions (
+        user_id INTEGER PRIMARY KEY,
+        profiles BLOB,
+        current_index INTEGER
+    )''')
+
+def _add_matches_and_inbox():
+    """4: материализованные мэтчи, входящие лайки и счетчики."""
+    # Мэтч хранится одной строкой на пару: user_a < user_b
+    storage.execute('''
+    CREATE TABLE IF NOT EXISTS matches (
+        user_a INTEGER NOT NULL,
+        user_b INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_a, user_b)
+    ) WITHOUT ROWID''')
+    storage.execute("CREATE INDEX IF NOT EXISTS idx_matches_b ON matches (user_b, user_a)")
+    # Входящие лайки без ответа: liker_id лайкнул user_id, а тот его — еще нет
+    storage.execute('''
+    CREATE TABLE IF NOT EXISTS likes_inbox (
+        user_id INTEGER NOT NULL,
+        liker_id INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, liker_id)
+    ) WITHOUT ROWID''')
+    storage.execute("CREATE INDEX IF NOT EXISTS idx_likes_inbox_liker ON likes_inbox (liker_id)")
+    storage.execute('''
+    CREATE TABLE IF NOT EXISTS like_counters (
+        user_id INTEGER PRIMARY KEY,
+        likes_received INTEGER NOT NULL DEFAULT 0,
+        inbox_count INTEGER NOT NULL DEFAULT 0,
+        matches_count INTEGER NOT NULL DEFAULT 0
+    )''')
+    # Заполняем по уже накопленным лайкам
+    storage.execute('''
+    INSERT OR IGNORE INTO matches (user_a, user_b)
+    SELECT l1.liker_id, l1.liked_id FROM likes l1
+    JOIN likes l2 ON l2.liker_id = l1.liked_id AND l2.liked_id = l1.liker_id
+    WHERE l1.liker_id < l1.liked_id
+    ''')
+    storage.execute('''
+    INSERT OR IGNORE INTO likes_inbox (user_id, liker_id)
+    SELECT l1.liked_id, l1.liker_id FROM likes l1
+    WHERE NOT EXISTS (SELECT 1 FROM likes l2 WHERE l2.liker_id = l1.liked_id AND l2.liked_id = l1.liker_id)
+    ''')
+    storage.execute('''
+    INSERT OR REPLACE INTO like_counters (user_id, likes_received, inbox_count, matches_count)
+    SELECT user_id, SUM(received), SUM(inbox), SUM(matched) FROM (
+        SELECT liked_id AS user_id, 1 AS received, 0 AS inbox, 0 AS matched FROM likes
+        UNION ALL SELECT user_id, 0, 1, 0 FROM likes_inbox
+        UNION ALL SELECT user_a, 0, 0, 1 FROM matches
+        UNION ALL SELECT user_b, 0, 0, 1 FROM matches
+    ) GROUP BY user_id
+    ''')
+
+def _add_recommendations_tables():
+    """5: очереди рекомендаций и состояние фоновых задач."""
+    # Очередь кандидатов пользователя — array('q') с id анкет, лучшие первыми
+    storage.execute('''
+    CREATE TABLE IF NOT EXISTS recommendations (
+        user_id INTEGER PRIMARY KEY,
+        candidates BLOB NOT NULL,
+        computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    # Состояние пакетных задач между запусками (например, последний обработанный лайк)
+    storage.execute('''
+    CREATE TABLE IF NOT EXISTS job_state (
+        name TEXT PRIMARY KEY,
+        value INTEGER
+    )''')
+
+def _add_seen_filters_table():
+    """6: фильтры просмотренных в поиске анкет."""
+    storage.execute('''
+    CREATE TABLE IF NOT EXISTS seen_filters (
+        user_id INTEGER PRIMARY KEY,
+        data BLOB NOT NULL
+    )''')
+
+def _add_profiles_archive():
+    """7: архив анкет, давно не заходивших в бот."""
+    # Те же поля, что в profiles: /start возвращает анкету обратно как есть
+    storage.execute('''
+    CREATE TABLE IF NOT EXISTS profiles_archive (
+        user_id INTEGER PRIMARY KEY,
+        telegram_username TEXT,
+        nickname TEXT,
+        winrate INTEGER,
+        line TEXT,
+        rank TEXT,
+        mythic_rank TEXT,
+        goal TEXT,
+        about TEXT,
+        photo_id TEXT,
+        last_active TIMESTAMP,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        likes_pruned INTEGER NOT NULL DEFAULT 0
+    )''')
+    # Анкеты, чьи лайки еще не удалены (задача прервалась между архивацией и чисткой)
+    storage.execute("CREATE INDEX IF NOT EXISTS idx_profiles_archive_pending ON profiles_archive (user_id) WHERE likes_pruned = 0")
+
+
+# Порядок важен: версия схемы = номер последней примененной миграции
+MIGRATIONS = [
+    (1, _create_base_tables),
+    (2, _add_likes_uniqueness_and_indexes),
+    (3, _add_search_sessions_table),
+    (4, _add_matches_and_inbox),
+    (5, _add_recommendations_tables),
+    (6, _add_seen_filters_table),
+    (7, _add_profiles_archive),
+]
+
+
+def get_version():
+    """Текущая версия схемы в базе."""
+    return storage.fetchone("PRAGMA user_version")[0]
+
+def migrate():
+    """Применяет недостающие миграции. Возвращает итоговую версию схемы."""
+    version = get_version()
+    for number, migration in MIGRATIONS:
+        if number <= version:
+            continue
+        with storage.transaction():
+            migration()
+            storage.execute(f"PRAGMA user_version = {int(number)}")
+        print(f"Миграция {number} применена: {migration.__doc__.split(': ', 1)[-1]}")
+        version = number
+    return version
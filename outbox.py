@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""Очередь исходящих сообщений с ограничением скорости и приоритетами.
+
+Обработчики не вызывают bot.send_message напрямую, а ставят отправку в Outbox.
+Рабочие потоки отправляют сообщения с учетом лимитов Telegram: общего
+(≈30 сообщений в секунду на бота, почти без запаса на всплеск — иначе за
+секунду уйдет больше лимита) и на каждый чат (≈1 в секунду, с небольшим
+запасом на всплеск). Оба лимита — token bucket.
+
+Порядок сообщений внутри одного чата сохраняется всегда, а между чатами
+первыми идут более важные: мэтчи и следующая карточка поиска важнее
+информационных ответов. На ответ 429 очередь чата ставится на паузу
+ровно на retry_after, сетевые ошибки повторяются с экспоненциальной
+задержкой и случайным разбросом. Счетчики — в Outbox.metrics, время каждого
+вызова Bot API при включенных замерах — в metrics.api_seconds.
+
+Если Outbox не запущен (start() не вызывали), отправка выполняется сразу в
+вызывающем потоке — так ведут себя скрипты и бенчмарки без фоновых потоков.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+from telebot.apihelper import ApiTelegramException
+
+import metrics
+
+PRIORITY_HIGH = 0    # Мэтчи и следующая карточка поиска
+PRIORITY_NORMAL = 1  # Шаги сценариев и меню
+PRIORITY_LOW = 2     # Информационные ответы («лайк отправлен»)
+
+GLOBAL_RATE = 30.0   # Сообщений в секунду на бота
+CHAT_RATE = 1.0      # Сообщений в секунду в один чат
+GLOBAL_BURST = 1     # Запас общего ведра: больше — и за секунду уйдет сверх GLOBAL_RATE
+CHAT_BURST = 3       # Сколько сообщений в чат можно отправить подряд без паузы
+MAX_RETRIES = 3
+BACKOFF = 0.5        # Базовая задержка повтора после сетевой ошибки, секунды
+JITTER = 0.5         # Случайная добавка к паузе после 429, чтобы повторы не шли пачкой
+PRUNE_THRESHOLD = 10_000  # С какого числа известных чатов чистить простаивающие
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity."""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Через сколько секунд будет доступен токен (0 — уже доступен)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def reserve(self, now):
+        """Забирает токен сразу, даже в долг. Возвращает, сколько подождать до отправки."""
+        self.take(now)
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class _Job:
+    __slots__ = ('method', 'args', 'kwargs', 'priority', 'future', 'attempts', 'enqueued')
+
+    def __init__(self, method, args, kwargs, priority):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future = Future()
+        self.attempts = 0
+        self.enqueued = time.monotonic()
+
+
+class _Chat:
+    __slots__ = ('jobs', 'bucket', 'not_before', 'busy', 'queued_priority')
+
+    def __init__(self, rate, burst):
+        self.jobs = deque()
+        self.bucket = TokenBucket(rate, burst)
+        self.not_before = 0.0       # Пауза после 429 или ошибки сети
+        self.busy = False           # Сообщение этого чата уже отправляется
+        self.queued_priority = None  # Приоритет актуальной записи чата в куче
+
+
+class Outbox:
+    """Планировщик исходящих вызовов Bot API."""
+
+    def __init__(self, bot, workers=4, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE, chat_burst=CHAT_BURST,
+                 max_retries=MAX_RETRIES, global_burst=GLOBAL_BURST):
+        self.bot = bot
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats = {}   # {chat_id: _Chat}
+        self._heap = []    # (приоритет, порядковый номер, chat_id) — чаты, у которых есть что отправить
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+        self.metrics = Counter()
+        self._wait_total = Counter()  # {приоритет: суммарное ожидание в очереди, секунды}
+
+    # --- ПОСТАНОВКА В ОЧЕРЕДЬ ---
+
+    def send_message(self, chat_id, text, priority=PRIORITY_NORMAL, **kwargs):
+        return self.call('send_message', chat_id, text, priority=priority, **kwargs)
+
+    def send_photo(self, chat_id, photo, priority=PRIORITY_NORMAL, **kwargs):
+        return self.call('send_photo', chat_id, photo, priority=priority, **kwargs)
+
+    def call(self, method, chat_id, *args, priority=PRIORITY_NORMAL, **kwargs):
+        """Ставит вызов bot.<method>(chat_id, *args, **kwargs) в очередь. Возвращает Future."""
+        job = _Job(method, (chat_id,) + args, kwargs, priority)
+        self._count('enqueued')
+        if not self._running:
+            self._execute_inline(job)
+            return job.future
+        with self._cond:
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = _Chat(self.chat_rate, self.chat_burst)
+            chat.jobs.append(job)
+            if len(self._chats) > PRUNE_THRESHOLD and next(self._seq) % PRUNE_THRESHOLD == 0:
+                self._prune(time.monotonic())
+            # Приоритет чата — лучший среди его сообщений: важное сообщение «тянет» за собой
+            # более ранние сообщения того же чата, не нарушая их порядок
+            if chat.queued_priority is None or priority < chat.queued_priority:
+                chat.queued_priority = priority
+                heapq.heappush(self._heap, (priority, next(self._seq), chat_id))
+            self._cond.notify()
+        return job.future
+
+    def _prune(self, now):
+        """Забывает простаивающие чаты, у которых лимит уже полностью восстановился."""
+        idle = [chat_id for chat_id, chat in self._chats.items()
+                if not chat.jobs and not chat.busy and now >= chat.not_before
+                and now - chat.bucket.updated >= chat.bucket.capacity / chat.bucket.rate]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    def _execute_inline(self, job):
+        try:
+            job.future.set_result(self._call_api(job))
+            self._count('sent')
+        except Exception as e:
+            self._count('failed')
+            job.future.set_exception(e)
+            raise
+
+    def _call_api(self, job):
+        if not metrics.enabled:
+            return getattr(self.bot, job.method)(*job.args, **job.kwargs)
+        started = time.perf_counter()
+        try:
+            return getattr(self.bot, job.method)(*job.args, **job.kwargs)
+        finally:
+            metrics.api_seconds.observe(job.method, time.perf_counter() - started)
+
+    # --- РАБОЧИЕ ПОТОКИ ---
+
+    def start(self):
+        if self._running:
+            return self
+        self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'outbox-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=10.0):
+        """Дожидается отправки очереди (не дольше timeout) и останавливает потоки."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.pending() and time.monotonic() < deadline:
+                self._cond.wait(0.1)
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    def pending(self):
+        return sum(len(chat.jobs) for chat in list(self._chats.values()))
+
+    def _next_job(self):
+        """Берет следующее готовое к отправке сообщение (под self._cond)."""
+        while self._running:
+            now = time.monotonic()
+            deferred = []
+            found = None
+            wait = 1.0
+            while self._heap:
+                priority, seq, chat_id = heapq.heappop(self._heap)
+                chat = self._chats.get(chat_id)
+                if chat is None or not chat.jobs or chat.queued_priority != priority:
+                    continue  # Устаревшая запись
+                if chat.busy:
+                    continue  # После отправки _work сам вернет чат в кучу
+                delay = max(chat.not_before - now, chat.bucket.delay(now))
+                if delay > 0:
+                    wait = min(wait, delay)
+                    deferred.append((priority, seq, chat_id))
+                    continue
+                found = (priority, seq, chat_id, chat)
+                break
+            for entry in deferred:
+                heapq.heappush(self._heap, entry)
+            if found is None:
+                self._cond.wait(wait)
+                continue
+            priority, seq, chat_id, chat = found
+            chat.busy = True
+            chat.bucket.take(now)
+            job = chat.jobs[0]
+            return chat_id, chat, job
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                picked = self._next_job()
+            if picked is None:
+                return
+            chat_id, chat, job = picked
+            # Общий лимит бота: ждем токен вне блокировки, не мешая остальным потокам
+            with self._cond:
+                delay = self._global.reserve(time.monotonic())
+            if delay > 0:
+                time.sleep(delay)
+            done = self._send(chat, job)
+            with self._cond:
+                chat.busy = False
+                if done:
+                    chat.jobs.popleft()
+                if chat.jobs:
+                    chat.queued_priority = min(j.priority for j in chat.jobs)
+                    heapq.heappush(self._heap, (chat.queued_priority, next(self._seq), chat_id))
+                else:
+                    chat.queued_priority = None  # Чат остается в _chats ради состояния лимитов
+                self._cond.notify_all()
+
+    def _send(self, chat, job):
+        """Отправляет сообщение. True — с сообщением покончено (успех или окончательная ошибка)."""
+        job.attempts += 1
+        try:
+            result = self._call_api(job)
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 1)
+                chat.not_before = time.monotonic() + retry_after + random.uniform(0, JITTER)
+                job.attempts -= 1  # Повторяем после паузы, попытка не считается
+                self._count('rate_limited')
+                return False
+            return self._fail(job, e)
+        except Exception as e:  # Сетевые ошибки: повтор с задержкой и разбросом
+            if job.attempts > self.max_retries:
+                return self._fail(job, e)
+            chat.not_before = time.monotonic() + BACKOFF * 2 ** (job.attempts - 1) * random.uniform(0.5, 1.5)
+            self._count('retried')
+            return False
+        with self._cond:
+            self.metrics['sent'] += 1
+            self.metrics[f'sent_priority_{job.priority}'] += 1
+            self._wait_total[job.priority] += time.monotonic() - job.enqueued
+        job.future.set_result(result)
+        return True
+
+    def _count(self, key):
+        with self._cond:
+            self.metrics[key] += 1
+
+    def _fail(self, job, error):
+        self._count('failed')
+        print(f"Не удалось выполнить {job.method} для {job.args[0]}: {error}")
+        job.future.set_exception(error)
+        return True
+
+    def get_metrics(self):
+        """Счетчики, длина очереди и средняя задержка от постановки до отправки по приоритетам."""
+        with self._cond:
+            result = dict(self.metrics, pending=self.pending(), chats=len(self._chats))
+            for priority, total in self._wait_total.items():
+                sent = self.metrics[f'sent_priority_{priority}']
+                result[f'avg_wait_ms_priority_{priority}'] = round(total / sent * 1000, 1) if sent else 0.0
+        return result
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Ограниченный LRU-кэш анкет по user_id.
+
+Кэш заполняется из get_profile и пакетной подгрузки страниц поиска,
+а save_profile/delete_profile сбрасывают запись. Счетчики попаданий, промахов
+и вытеснений помогают подобрать размер кэша.
+"""
+import threading
+from collections import OrderedDict
+
+
+class ProfileCache:
+    """LRU-кэш {user_id: словарь анкеты}."""
+
+    def __init__(self, maxsize=5000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, user_id):
+        return user_id in self._data
+
+    def get(self, user_id):
+        """Анкета из кэша или None (промах)."""
+        with self._lock:
+            profile = self._data.get(user_id)
+            if profile is None:
+                self.stats['misses'] += 1
+                return None
+            self._data.move_to_end(user_id)
+            self.stats['hits'] += 1
+            return profile
+
+    def put(self, user_id, profile):
+        with self._lock:
+            self._data[user_id] = profile
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._data.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_stats(self):
+        """Счетчики и доля попаданий для логов и бенчмарков."""
+        with self._lock:
+            total = self.stats['hits'] + self.stats['misses']
+            return dict(self.stats, size=len(self._data), maxsize=self.maxsize,
+                        hit_rate=self.stats['hits'] / total if total else 0.0)
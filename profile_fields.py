@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""Допустимые значения полей анкеты (то, что предлагают кнопки регистрации)."""
+
+LINES = ("Gold Line", "Rome", "Средняя линия", "Лес", "XP Line", "Везде")
+# Ранги по возрастанию
+RANKS = ("Воин", "Элита", "Мастер", "Грандмастер", "Эпик", "Легенда", "Мифический")
+MYTHIC_RANKS = ("Миф", "Мифическая честь", "Мифическая слава", "Мифический бессмертный")
+GOALS = ("Поднять ранг", "Поиграть для удовольствия", "Найти постоянную команду")
+
+ANY_LINE = "Везде"  # Игрок с этой линией подходит под любой фильтр по линии
+MYTHIC = "Мифический"
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""Ранжирование кандидатов поиска по совместимости.
+
+Поля анкет хранятся по колонкам (ProfileColumns): уровень ранга, линия, цель,
+winrate и время активности лежат в отдельных массивах, а строка массива
+соответствует анкете. Оценка всех кандидатов считается одним векторным
+проходом NumPy. Если NumPy не установлен, используется чистый Python
+с той же формулой (он же служит эталоном для проверки паритета).
+
+Оценка — взвешенная сумма компонент от 0 до 1:
+- rank: близость рангов (с учетом уровня мифа);
+- line: линии дополняют друг друга (разные линии или кто-то играет «Везде»);
+- goal: одинаковая цель;
+- winrate: близость winrate;
+- recency: насколько недавно кандидат был в сети.
+"""
+import math
+import threading
+import time
+from array import array
+
+import storage
+from active_index import _to_epoch
+from profile_fields import LINES, RANKS, MYTHIC_RANKS, GOALS, ANY_LINE, MYTHIC
+
+try:
+    import numpy as np
+except ImportError:  # Работаем и без NumPy, только медленнее
+    np = None
+
+DEFAULT_WEIGHTS = {'rank': 3.0, 'line': 2.0, 'goal': 2.0, 'winrate': 1.0, 'recency': 1.5}
+RECENCY_SECONDS = 600.0  # За это время вклад активности падает в e раз
+
+MAX_LEVEL = len(RANKS) - 1 + len(MYTHIC_RANKS) - 1
+_LINE_INDEX = {line: i for i, line in enumerate(LINES)}
+_GOAL_INDEX = {goal: i for i, goal in enumerate(GOALS)}
+# LINE_COMPAT[a][b] = 1, если линии a и b хорошо сочетаются в одной команде
+LINE_COMPAT = [[1.0 if a != b or ANY_LINE in (LINES[a], LINES[b]) else 0.0
+                for b in range(len(LINES))] for a in range(len(LINES))]
+
+
+def rank_level(rank, mythic_rank=None):
+    """Числовой уровень ранга: 0 (Воин) .. MAX_LEVEL (Мифический бессмертный)."""
+    if rank not in RANKS:
+        return -1
+    level = RANKS.index(rank)
+    if rank == MYTHIC and mythic_rank in MYTHIC_RANKS:
+        level += MYTHIC_RANKS.index(mythic_rank)
+    return level
+
+
+class ProfileColumns:
+    """Колоночное хранилище полей анкет для векторной оценки."""
+
+    def __init__(self, capacity=1024, use_numpy=True):
+        self.use_numpy = use_numpy and np is not None
+        self._row_of = {}  # {user_id: номер строки}
+        self._free = []    # Освободившиеся строки после удаления анкет
+        self._size = 0
+        self._lock = threading.Lock()
+        self._allocate(capacity)
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def _allocate(self, capacity):
+        """Создает (или расширяет) массивы колонок до capacity строк."""
+        old = getattr(self, 'level', None)
+        specs = (('level', 'b', -1), ('line', 'b', -1), ('goal', 'b', -1),
+                 ('winrate', 'f', -1.0), ('last_active', 'd', 0.0))
+        for name, code, fill in specs:
+            if self.use_numpy:
+                column = np.full(capacity, fill, dtype={'b': np.int8, 'f': np.float32, 'd': np.float64}[code])
+                if old is not None:
+                    column[:self._size] = getattr(self, name)[:self._size]
+            else:
+                column = array(code, [fill]) * capacity
+                if old is not None:
+                    column[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, column)
+        self.capacity = capacity
+
+    def add(self, user_id, profile, last_active=None):
+        """Добавляет или обновляет анкету (profile — словарь полей)."""
+        winrate = profile.get('winrate')
+        values = (rank_level(profile.get('rank'), profile.get('mythic_rank')),
+                  _LINE_INDEX.get(profile.get('line'), -1),
+                  _GOAL_INDEX.get(profile.get('goal'), -1),
+                  float(winrate) if winrate is not None else -1.0)
+        when = last_active if last_active is not None else profile.get('last_active')
+        with self._lock:
+            row = self._row_of.get(user_id)
+            if row is None:
+                row = self._free.pop() if self._free else self._next_row()
+                self._row_of[user_id] = row
+            self.level[row], self.line[row], self.goal[row], self.winrate[row] = values
+            self.last_active[row] = _to_epoch(when) if when is not None else time.time()
+
+    def _next_row(self):
+        if self._size == self.capacity:
+            self._allocate(self.capacity * 2)
+        self._size += 1
+        return self._size - 1
+
+    def touch(self, user_id, when=None):
+        """Обновляет время активности анкеты."""
+        epoch = _to_epoch(when) if when is not None else time.time()
+        with self._lock:  # Иначе запись может уйти в старый массив, который _allocate как раз заменяет
+            row = self._row_of.get(user_id)
+            if row is not None:
+                self.last_active[row] = epoch
+
+    def remove(self, user_id):
+        with self._lock:
+            row = self._row_of.pop(user_id, None)
+            if row is not None:
+                self.level[row] = self.line[row] = self.goal[row] = -1
+                self.winrate[row] = -1.0
+                self._free.append(row)
+
+    def rows_for(self, user_ids):
+        """Номера строк для списка user_id (без неизвестных анкет)."""
+        row_of = self._row_of
+        ids = [uid for uid in user_ids if uid in row_of]
+        rows = map(row_of.__getitem__, ids)
+        if self.use_numpy:
+            return ids, np.fromiter(rows, dtype=np.int64, count=len(ids))
+        return ids, list(rows)
+
+    def rebuild(self):
+        """Заполняет колонки из таблицы profiles."""
+        rows = storage.fetchall("SELECT user_id, line, rank, mythic_rank, goal, winrate, last_active FROM profiles")
+        with self._lock:
+            self._row_of.clear()
+            self._free.clear()
+            self._size = 0
+            self._allocate(max(1024, len(rows)))
+        for user_id, line, rank, mythic_rank, goal, winrate, last_active in rows:
+            self.add(user_id, {'line': line, 'rank': rank, 'mythic_rank': mythic_rank, 'goal': goal,
+                               'winrate': winrate, 'last_active': last_active})
+        return len(rows)
+
+    # --- ОЦЕНКА ---
+
+    def score_rows(self, searcher_id, rows, weights=None, now=None):
+        """Оценки совместимости строк rows с анкетой searcher_id."""
+        weights = weights or DEFAULT_WEIGHTS
+        now = now if now is not None else time.time()
+        me = self._row_of[searcher_id]
+        if self.use_numpy:
+            return _score_numpy(self, me, rows, weights, now)
+        return _score_python(self, me, rows, weights, now)
+
+    def rank(self, searcher_id, candidate_ids, weights=None, now=None):
+        """Сортирует кандидатов по убыванию совместимости с searcher_id.
+
+        Если анкеты ищущего нет в колонках, порядок не меняется.
+        """
+        if searcher_id not in self._row_of or len(candidate_ids) < 2:
+            return list(candidate_ids)
+        unknown = [uid for uid in candidate_ids if uid not in self._row_of]
+        ids, rows = self.rows_for(candidate_ids)
+        scores = self.score_rows(searcher_id, rows, weights, now)
+        if self.use_numpy:
+            order = np.argsort(-scores, kind='stable')
+            ranked = np.asarray(ids, dtype=np.int64)[order].tolist()
+        else:
+            ranked = [uid for _, uid in sorted(zip(scores, ids), key=lambda pair: -pair[0])]
+        return ranked + unknown
+
+
+def _score_numpy(cols, me, rows, weights, now):
+    level = cols.level[rows].astype(np.float32)
+    winrate = cols.winrate[rows]
+    line = cols.line[rows]
+    goal = cols.goal[rows]
+    last_active = cols.last_active[rows]
+    my_level, my_line, my_goal, my_winrate = cols.level[me], cols.line[me], cols.goal[me], cols.winrate[me]
+
+    score = np.zeros(len(rows), dtype=np.float32)
+    if my_level >= 0:
+        part = 1.0 - np.abs(level - my_level) / MAX_LEVEL
+        score += weights['rank'] * np.where(level >= 0, part, 0.0)
+    if my_line >= 0:
+        compat = np.asarray(LINE_COMPAT[my_line] + [0.0], dtype=np.float32)  # -1 -> последний элемент (0)
+        score += weights['line'] * compat[line]
+    if my_goal >= 0:
+        score += weights['goal'] * ((goal == my_goal) & (goal >= 0))
+    if my_winrate >= 0:
+        part = 1.0 - np.abs(winrate - my_winrate) / 100.0
+        score += weights['winrate'] * np.where(winrate >= 0, part, 0.0)
+    age = np.maximum(now - last_active, 0.0)
+    score += weights['recency'] * np.exp(-age / RECENCY_SECONDS).astype(np.float32)
+    return score
+
+
+def _score_python(cols, me, rows, weights, now):
+    my_level, my_line, my_goal, my_winrate = cols.level[me], cols.line[me], cols.goal[me], cols.winrate[me]
+    w_rank, w_line, w_goal, w_winrate, w_recency = (weights['rank'], weights['line'], weights['goal'],
+                                                    weights['winrate'], weights['recency'])
+    compat = LINE_COMPAT[my_line] if my_line >= 0 else None
+    scores = []
+    for row in rows:
+        score = 0.0
+        level, line, goal, winrate = cols.level[row], cols.line[row], cols.goal[row], cols.winrate[row]
+        if my_level >= 0 and level >= 0:
+            score += w_rank * (1.0 - abs(level - my_level) / MAX_LEVEL)
+        if compat is not None and line >= 0:
+            score += w_line * compat[line]
+        if my_goal >= 0 and goal == my_goal:
+            score += w_goal
+        if my_winrate >= 0 and winrate >= 0:
+            score += w_winrate * (1.0 - abs(winrate - my_winrate) / 100.0)
+        score += w_recency * math.exp(-max(now - cols.last_active[row], 0.0) / RECENCY_SECONDS)
+        scores.append(score)
+    return scores
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""Очереди рекомендаций по графу лайков (пакетная задача).
+
+Игроки, которые лайкали одни и те же анкеты, обычно ищут похожих тиммейтов.
+Задача загружает таблицу likes в разреженную матрицу «кто кого лайкнул»
+(CSR на массивах NumPy) и для каждого пользователя:
+1. находит соседей — пользователей с общими лайками, сходство косинусное:
+   общих / sqrt(лайков у одного * лайков у другого);
+   соседей ищем среди RECENT_LIKERS последних лайкнувших каждую анкету;
+2. складывает лайки NEIGHBOURS самых похожих соседей с весами сходства;
+3. убирает уже лайкнутые анкеты и самого пользователя и берет TOP_N лучших.
+Очередь пишется в таблицу recommendations как array('q') с id анкет.
+
+Пересчет инкрементальный: в job_state хранится id последнего обработанного
+лайка, и пересчитываются только пользователи, лайкнувшие кого-то после него
+(матрица строится по всем лайкам). Запуск — отдельным процессом, например
+по cron:
+
+    python recommendations.py [--full]
+
+Быстрый поиск сначала показывает активных игроков из очереди, затем
+остальных, как раньше (merge_queue).
+"""
+import argparse
+import time
+from array import array
+
+import storage
+
+try:
+    import numpy as np
+except ImportError:  # Боту NumPy для чтения очередей не нужен, только самой задаче
+    np = None
+
+TOP_N = 100        # Длина очереди рекомендаций
+NEIGHBOURS = 50    # Сколько самых похожих пользователей учитывать
+RECENT_LIKERS = 200  # Соседей ищем только среди последних лайкнувших каждую анкету
+CHUNK = 5000       # Очередей на одну транзакцию записи
+LOAD_BATCH = 50_000
+STATE_KEY = 'recommendations_last_like_id'
+
+
+# --- ЧТЕНИЕ ОЧЕРЕДИ (используется ботом) ---
+
+def get_queue(user_id):
+    """Очередь рекомендаций пользователя (пустая, если ее еще не считали)."""
+    row = storage.fetchone("SELECT candidates FROM recommendations WHERE user_id = ?", (user_id,))
+    return array('q', row[0]) if row else array('q')
+
+def merge_queue(queue, candidates):
+    """Кандидаты из очереди (в ее порядке) первыми, затем остальные candidates в их порядке."""
+    allowed = set(candidates)
+    first = [user_id for user_id in queue if user_id in allowed]
+    if not first:
+        return list(candidates)
+    taken = set(first)
+    return first + [user_id for user_id in candidates if user_id not in taken]
+
+
+# --- МАТРИЦА ЛАЙКОВ ---
+
+def _indptr(sorted_rows, size):
+    """Границы строк CSR по отсортированным номерам строк."""
+    ptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sorted_rows, minlength=size), out=ptr[1:])
+    return ptr
+
+def _gather(ptr, values, rows, limit=None):
+    """Значения строк rows подряд (одним массивом) и длины этих строк.
+
+    limit — брать не больше limit последних значений каждой строки.
+    """
+    ends = ptr[rows + 1]
+    starts = ptr[rows] if limit is None else np.maximum(ptr[rows], ends - limit)
+    lengths = ends - starts
+    positions = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return values[positions], lengths
+
+
+class LikeMatrix:
+    """Разреженная матрица лайков в двух раскладках: по лайкающим и по анкетам."""
+
+    def __init__(self, likers, liked):
+        self.user_ids, user_index = np.unique(likers, return_inverse=True)  # Строки: кто лайкал
+        self.item_ids, item_index = np.unique(liked, return_inverse=True)   # Столбцы: кого лайкали
+        order = np.argsort(user_index, kind='stable')
+        self.user_ptr = _indptr(user_index[order], len(self.user_ids))
+        self.user_items = item_index[order].astype(np.int32)
+        order = np.argsort(item_index, kind='stable')
+        self.item_ptr = _indptr(item_index[order], len(self.item_ids))
+        self.item_users = user_index[order].astype(np.int32)
+        self.degree = np.diff(self.user_ptr)  # Лайков у каждого пользователя
+
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.user_ids, self.item_ids, self.user_ptr, self.user_items,
+                                      self.item_ptr, self.item_users, self.degree))
+
+    def recommend(self, row, top_n=TOP_N, neighbours=NEIGHBOURS):
+        """Лучшие анкеты (id) для пользователя в строке row."""
+        items = self.user_items[self.user_ptr[row]:self.user_ptr[row + 1]]
+        # У популярных анкет тысячи лайкнувших: они дорогие и почти ничего не говорят о вкусе,
+        # поэтому берем только последних (в каждой строке лайкнувшие идут в порядке лайков)
+        co_likers, _ = _gather(self.item_ptr, self.item_users, items, RECENT_LIKERS)
+        users, common = np.unique(co_likers, return_counts=True)
+        others = users != row
+        users, common = users[others], common[others]
+        if not len(users):
+            return self.item_ids[:0]
+        similarity = common / np.sqrt(self.degree[row] * self.degree[users])
+        if len(users) > neighbours:
+            best = np.argpartition(similarity, -neighbours)[-neighbours:]
+            users, similarity = users[best], similarity[best]
+        their_items, lengths = _gather(self.user_ptr, self.user_items, users)
+        candidates, inverse = np.unique(their_items, return_inverse=True)
+        scores = np.bincount(inverse, weights=np.repeat(similarity, lengths))
+        fresh = ~np.isin(candidates, items) & (self.item_ids[candidates] != self.user_ids[row])
+        candidates, scores = candidates[fresh], scores[fresh]
+        order = np.argsort(-scores, kind='stable')[:top_n]
+        return self.item_ids[candidates[order]]
+
+
+def _load_likes(max_id):
+    """Все лайки с id <= max_id двумя массивами (лайкающие, лайкнутые), без списка кортежей в памяти."""
+    likers, liked = array('q'), array('q')
+    cursor = storage.execute("SELECT liker_id, liked_id FROM likes WHERE id <= ? ORDER BY id", (max_id,))
+    while True:
+        rows = cursor.fetchmany(LOAD_BATCH)
+        if not rows:
+            break
+        likers.extend(row[0] for row in rows)
+        liked.extend(row[1] for row in rows)
+    return np.frombuffer(likers, dtype=np.int64), np.frombuffer(liked, dtype=np.int64)
+
+
+# --- ПАКЕТНЫЙ ПЕРЕСЧЕТ ---
+
+def run(full=False, top_n=TOP_N, neighbours=NEIGHBOURS):
+    """Пересчитывает очереди. full=False — только для пользователей с новыми лайками. Возвращает статистику."""
+    if np is None:
+        raise RuntimeError("Для расчета рекомендаций нужен NumPy (pip install numpy).")
+    started = time.monotonic()
+    max_id = storage.fetchone("SELECT MAX(id) FROM likes")[0] or 0
+    last_id = 0 if full else storage.get_state(STATE_KEY)
+    stats = {'likes': 0, 'users': 0, 'recomputed': 0, 'matrix_bytes': 0, 'seconds': 0.0}
+    if max_id <= last_id:
+        return stats
+
+    likers, liked = _load_likes(max_id)
+    matrix = LikeMatrix(likers, liked)
+    del likers, liked
+    if full:
+        rows = np.arange(len(matrix.user_ids))
+    else:
+        changed = storage.fetchall("SELECT DISTINCT liker_id FROM likes WHERE id > ? AND id <= ?", (last_id, max_id))
+        rows = np.searchsorted(matrix.user_ids, np.array([row[0] for row in changed], dtype=np.int64))
+    for i in range(0, len(rows), CHUNK):
+        batch = [(int(matrix.user_ids[row]), matrix.recommend(row, top_n, neighbours).astype(np.int64).tobytes())
+                 for row in rows[i:i + CHUNK]]
+        with storage.transaction():
+            storage.executemany('''
+            INSERT OR REPLACE INTO recommendations (user_id, candidates, computed_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+            ''', batch)
+    storage.set_state(STATE_KEY, max_id)
+    stats.update(likes=int(matrix.user_ptr[-1]), users=len(matrix.user_ids), recomputed=len(rows),
+                 matrix_bytes=matrix.nbytes(), seconds=round(time.monotonic() - started, 2))
+    return stats
+
+
+if __name__ == '__main__':
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Пересчет очередей рекомендаций по графу лайков.")
+    parser.add_argument('--full', action='store_true', help='пересчитать всех, а не только пользователей с новыми лайками')
+    args = parser.parse_args()
+    migrations.migrate()
+    print(f"Рекомендации: {run(full=args.full)}")
+    storage.close_all()
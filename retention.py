@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""Архивация анкет, давно не заходивших в бот (фоновая задача).
+
+Анкеты удаляются только кнопкой «🗑️ Удалить анкету», поэтому profiles и likes
+растут за счет игроков, ушедших месяцы назад: каждый просмотр таблиц и кэш
+страниц тратятся на них. Задача раз в INTERVAL секунд:
+1. переносит анкеты, неактивные дольше MAX_AGE_DAYS, из profiles в
+   profiles_archive — порциями по BATCH анкет, каждая в короткой транзакции;
+2. удаляет их лайки, мэтчи и входящие через likes.prune_user, тоже порциями,
+   чтобы обработчики не ждали блокировку записи;
+3. возвращает освободившиеся страницы файлу базы (PRAGMA incremental_vacuum).
+
+Когда игрок возвращается, /start переносит анкету обратно (restore) — лайки
+при этом не восстанавливаются.
+
+incremental_vacuum работает только в режиме auto_vacuum=INCREMENTAL. Новые
+базы создаются в нем (storage.PRAGMAS), старую нужно один раз перевести
+полным VACUUM, когда бот остановлен:
+
+    python retention.py --vacuum
+
+Разовый запуск архивации: python retention.py [--days 90]
+Настройки (переменные окружения): RETENTION_DAYS, RETENTION_INTERVAL
+(0 — не запускать фоновый поток).
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import likes
+import storage
+
+MAX_AGE_DAYS = float(os.environ.get('RETENTION_DAYS', '90'))
+INTERVAL = float(os.environ.get('RETENTION_INTERVAL', str(6 * 3600)))  # Секунды между запусками
+BATCH = 200          # Анкет на одну транзакцию архивации
+VACUUM_PAGES = 1000  # Страниц на один шаг incremental_vacuum (~4 МБ при странице 4 КБ)
+PAUSE = 0.05         # Пауза между порциями: обработчики успевают взять блокировку записи
+STATE_KEY = 'retention_last_run'
+
+_KEYS = ('user_id', 'telegram_username', 'nickname', 'winrate', 'line', 'rank', 'mythic_rank', 'goal', 'about',
+         'photo_id', 'last_active')
+_COLUMNS = ", ".join(_KEYS)
+
+
+# --- АРХИВ ---
+
+def archive_batch(cutoff, limit=BATCH, skip=None):
+    """Переносит в архив до limit анкет, неактивных с cutoff.
+
+    skip(user_id) → True оставляет анкету на месте (например, активность еще в
+    буфере и не записана в базу). Возвращает (сколько анкет выбрано, id перенесенных).
+    """
+    selected = [row[0] for row in storage.fetchall(
+        "SELECT user_id FROM profiles WHERE last_active < ? ORDER BY last_active LIMIT ?", (cutoff, limit))]
+    user_ids = [user_id for user_id in selected if not (skip and skip(user_id))]
+    if not user_ids:
+        return len(selected), []
+    placeholders = ", ".join("?" * len(user_ids))
+    with storage.transaction():
+        # Условие по last_active повторяем: игрок мог зайти, пока шел SELECT
+        archived = [row[0] for row in storage.fetchall(f'''
+        INSERT OR REPLACE INTO profiles_archive ({_COLUMNS})
+        SELECT {_COLUMNS} FROM profiles WHERE user_id IN ({placeholders}) AND last_active < ?
+        RETURNING user_id
+        ''', (*user_ids, cutoff))]
+        if archived:
+            placeholders = ", ".join("?" * len(archived))
+            for table in ('profiles', 'recommendations', 'search_sessions'):
+                storage.execute(f"DELETE FROM {table} WHERE user_id IN ({placeholders})", archived)
+    return len(selected), archived
+
+def prune_archived(stop=None, pause=PAUSE):
+    """Удаляет лайки архивных анкет, которые еще не чистились. Возвращает (анкет, строк)."""
+    users = rows = since_pause = 0
+    for (user_id,) in storage.fetchall("SELECT user_id FROM profiles_archive WHERE likes_pruned = 0"):
+        if stop is not None and stop.is_set():
+            break
+        # Список выбран до прохода: игрок мог вернуться (restore), тогда строки в архиве уже нет.
+        # Проверяем ее в каждой транзакции чистки, иначе удалятся его новые лайки
+        removed = likes.prune_user(user_id, still=lambda: _archived(user_id))
+        storage.execute("UPDATE profiles_archive SET likes_pruned = 1 WHERE user_id = ?", (user_id,))
+        users += 1
+        rows += removed
+        since_pause += removed + 1
+        if since_pause >= likes.PRUNE_CHUNK:  # Пауза пропорционально удаленному, а не на каждую анкету
+            time.sleep(pause)
+            since_pause = 0
+    return users, rows
+
+def _archived(user_id):
+    return storage.fetchone("SELECT 1 FROM profiles_archive WHERE user_id = ?", (user_id,)) is not None
+
+def restore(user_id):
+    """Возвращает анкету из архива в profiles. Возвращает анкету (dict) или None, если ее там нет."""
+    # /start новичка заходит сюда на каждом сообщении: без анкеты в архиве блокировку записи не берем
+    if not _archived(user_id):
+        return None
+    with storage.transaction():
+        rows = storage.fetchall(f"DELETE FROM profiles_archive WHERE user_id = ? RETURNING {_COLUMNS}", (user_id,))
+        if not rows:
+            return None
+        profile = dict(zip(_KEYS, rows[0]))
+        profile['last_active'] = datetime.now()
+        storage.execute(f"INSERT OR REPLACE INTO profiles ({_COLUMNS}) VALUES ({', '.join('?' * len(_KEYS))})",
+                        [profile[key] for key in _KEYS])
+    return profile
+
+
+# --- ФАЙЛ БАЗЫ ---
+
+def incremental_vacuum(pages=VACUUM_PAGES, pause=PAUSE):
+    """Отдает файлу свободные страницы шагами по pages. Возвращает число освобожденных страниц."""
+    if storage.fetchone("PRAGMA auto_vacuum")[0] != 2:  # Не INCREMENTAL: нужен разовый retention.py --vacuum
+        return 0
+    freed = 0
+    free = storage.fetchone("PRAGMA freelist_count")[0]
+    while free:
+        storage.executescript(f"PRAGMA incremental_vacuum({int(min(pages, free))})")
+        remaining = storage.fetchone("PRAGMA freelist_count")[0]
+        if remaining >= free:  # Страницы освобождают параллельные удаления — не гоняемся за ними
+            break
+        freed += free - remaining
+        free = remaining
+        time.sleep(pause)
+    return freed
+
+def vacuum_full():
+    """Переводит базу в auto_vacuum=INCREMENTAL и сжимает ее (долго; бот должен быть остановлен)."""
+    storage.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    storage.execute("VACUUM")
+    return storage.fetchone("PRAGMA page_count")[0]
+
+
+# --- ЗАПУСК ---
+
+def run(max_age_days=MAX_AGE_DAYS, batch=BATCH, skip=None, on_archived=None, stop=None):
+    """Один проход: архивация, чистка лайков, incremental_vacuum. Возвращает статистику.
+
+    on_archived(user_ids) вызывается после каждой порции — бот убирает анкеты
+    из индексов и кэшей в памяти.
+    """
+    started = time.monotonic()
+    cutoff = datetime.now() - timedelta(days=max_age_days)
+    archived = 0
+    while stop is None or not stop.is_set():
+        selected, user_ids = archive_batch(cutoff, batch, skip)
+        if user_ids and on_archived is not None:
+            on_archived(user_ids)
+        archived += len(user_ids)
+        if selected < batch or not user_ids:
+            break
+        time.sleep(PAUSE)
+    pruned_users, pruned_rows = prune_archived(stop)
+    pages = incremental_vacuum()
+    storage.set_state(STATE_KEY, int(time.time()))
+    return {'archived': archived, 'pruned_users': pruned_users, 'pruned_rows': pruned_rows, 'pages_freed': pages,
+            'seconds': round(time.monotonic() - started, 2)}
+
+
+class RetentionWorker:
+    """Фоновый поток, запускающий run() раз в interval секунд.
+
+    Время последнего запуска хранится в job_state, поэтому частые перезапуски
+    бота не откладывают архивацию бесконечно.
+    """
+
+    def __init__(self, interval=INTERVAL, max_age_days=MAX_AGE_DAYS, skip=None, on_archived=None):
+        self.interval = interval
+        self.max_age_days = max_age_days
+        self.skip = skip
+        self.on_archived = on_archived
+        self._stopped = threading.Event()
+        self._thread = None
+        self.last_stats = None
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return self
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Прерывает проход после текущей порции и останавливает поток."""
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            last_run = storage.get_state(STATE_KEY)
+            if self._stopped.wait(max(0.0, last_run + self.interval - time.time())):
+                return
+            try:
+                self.last_stats = run(self.max_age_days, skip=self.skip, on_archived=self.on_archived,
+                                      stop=self._stopped)
+                print(f"Архивация анкет: {self.last_stats}")
+            except Exception as e:
+                print(f"Не удалось выполнить архивацию анкет: {e}")
+                self._stopped.wait(60)  # Не повторяем ошибку в цикле без паузы
+
+
+if __name__ == '__main__':
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Архивация неактивных анкет и сжатие базы.")
+    parser.add_argument('--days', type=float, default=MAX_AGE_DAYS, help='через сколько дней без активности архивировать')
+    parser.add_argument('--vacuum', action='store_true', help='перевести базу в auto_vacuum=INCREMENTAL полным VACUUM')
+    args = parser.parse_args()
+    migrations.migrate()
+    if args.vacuum:
+        print(f"VACUUM выполнен, страниц в базе: {vacuum_full()}")
+    else:
+        print(f"Архивация анкет: {run(args.days)}")
+    storage.close_all()
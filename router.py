@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Маршрутизация входящих сообщений одним поиском по словарю.
+
+Вместо цепочки @bot.message_handler(func=lambda ...), которую telebot
+проверяет по порядку для каждого сообщения, в боте регистрируется один
+обработчик, а Router выбирает функцию так:
+1. шаг сценария (регистрация, фильтры), если он ждет ответа пользователя;
+2. команда (/start);
+3. точный текст кнопки — словарь {текст: обработчик};
+4. обработчик по типу содержимого (фото);
+5. обработчик по умолчанию.
+Стоимость не растет с числом кнопок в меню. Шаги сценариев хранятся в таблице
+{user_id: обработчик} вместо register_next_step_handler.
+
+Все обработчики вызываются через _call, поэтому при включенных замерах
+(metrics.enabled) время каждого, включая шаги сценариев, попадает в гистограмму
+metrics.handler_seconds.
+"""
+import threading
+import time
+from collections import Counter
+
+import metrics
+
+
+class Router:
+    """Таблицы маршрутов и шагов сценариев."""
+
+    def __init__(self):
+        self.routes = {}     # {текст кнопки: обработчик}
+        self.commands = {}   # {команда без '/': обработчик}
+        self.content = {}    # {content_type: обработчик}
+        self.fallback = None
+        self.steps = {}      # {user_id: обработчик следующего сообщения}
+        self.stats = Counter()  # {имя обработчика: число вызовов}
+        self._lock = threading.Lock()
+
+    # --- РЕГИСТРАЦИЯ ---
+
+    def text(self, *texts):
+        """Декоратор: обработчик для точного текста одной или нескольких кнопок."""
+        def decorator(handler):
+            for text in texts:
+                self.routes[text] = handler
+            return handler
+        return decorator
+
+    def command(self, *names):
+        def decorator(handler):
+            for name in names:
+                self.commands[name] = handler
+            return handler
+        return decorator
+
+    def content_type(self, *content_types):
+        def decorator(handler):
+            for content_type in content_types:
+                self.content[content_type] = handler
+            return handler
+        return decorator
+
+    def default(self, handler):
+        self.fallback = handler
+        return handler
+
+    # --- ШАГИ СЦЕНАРИЕВ ---
+
+    def set_step(self, user_id, handler):
+        """Следующее сообщение пользователя получит handler (замена register_next_step_handler)."""
+        self.steps[user_id] = handler
+
+    def clear_step(self, user_id):
+        self.steps.pop(user_id, None)
+
+    # --- ДИСПЕТЧЕРИЗАЦИЯ ---
+
+    def resolve(self, message):
+        """Выбирает обработчик для сообщения (шаг сценария при этом снимается)."""
+        step = self.steps.pop(message.from_user.id, None)
+        if step is not None:
+            return step
+        handler = self.match_text(message.text)
+        if handler is not None:
+            return handler
+        return self.content.get(message.content_type, self.fallback)
+
+    def match_text(self, text):
+        """Обработчик команды или кнопки для текста; None, если текст не из таблиц."""
+        if text is None:
+            return None
+        if text.startswith('/'):
+            words = text[1:].split(maxsplit=1)  # «/ » без имени команды — не команда
+            handler = self.commands.get(words[0].split('@', 1)[0]) if words else None
+            if handler is not None:
+                return handler
+        return self.routes.get(text)
+
+    def dispatch(self, message):
+        handler = self.resolve(message)
+        if handler is None:
+            return None
+        return self._call(handler, message)
+
+    def _call(self, handler, update):
+        name = handler.__name__
+        with self._lock:
+            self.stats[name] += 1
+        if not metrics.enabled:
+            return handler(update)
+        started = time.perf_counter()
+        try:
+            return handler(update)
+        finally:
+            metrics.handler_seconds.observe(name, time.perf_counter() - started)
+
+    def attach(self, bot, content_types=('text', 'photo')):
+        """Регистрирует в боте единственный обработчик, который вызывает dispatch."""
+        bot.register_message_handler(self.dispatch, content_types=list(content_types))
+        return self
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""Какие анкеты пользователь уже видел в поиске.
+
+Для каждого пользователя хранится фильтр Блума по user_id показанных анкет:
+около 1.2 КБ на поколение при CAPACITY = 1000 анкет и доле ложных
+срабатываний ~1%. Ложное срабатывание лишь скрывает анкету, которую
+пользователь еще не видел, а пропусков у фильтра не бывает.
+
+Поколений два. Когда в текущее записано CAPACITY анкет или прошло
+DECAY_SECONDS, оно становится предыдущим, а прежнее предыдущее
+отбрасывается. Так давно просмотренные анкеты снова попадают в поиск, а доля
+ложных срабатываний не растет.
+
+Фильтры хранятся в таблице seen_filters (BLOB) и в памяти для недавно
+активных пользователей; изменения пишутся в базу пачками: по таймеру, при
+переполнении и при остановке бота.
+"""
+import math
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import storage
+
+CAPACITY = 1000            # Анкет в одном поколении
+ERROR_RATE = 0.01          # Доля ложных срабатываний при заполненном поколении
+DECAY_SECONDS = 7 * 86400  # Поколение живет не дольше недели
+BITS = int(math.ceil(-CAPACITY * math.log(ERROR_RATE) / math.log(2) ** 2 / 8)) * 8
+HASHES = max(1, round(BITS / CAPACITY * math.log(2)))
+
+_MASK = (1 << 64) - 1
+_HEADER = struct.Struct('<IId')  # Число записей в текущем поколении, размер поколения в байтах, время начала
+
+
+def _positions(user_id, bits=BITS, hashes=HASHES):
+    """Номера битов для user_id: двойное хеширование от перемешанного 64-битного значения (splitmix64)."""
+    x = (user_id + 0x9E3779B97F4A7C15) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    x ^= x >> 31
+    h1, h2 = x & 0xFFFFFFFF, (x >> 32) | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+def _contains(bitmap, positions):
+    for position in positions:
+        if not bitmap[position >> 3] & (1 << (position & 7)):
+            return False
+    return True
+
+
+class SeenFilter:
+    """Фильтр Блума из двух поколений."""
+    __slots__ = ('current', 'previous', 'count', 'started')
+
+    def __init__(self, current=None, previous=None, count=0, started=None):
+        self.current = current if current is not None else bytearray(BITS // 8)
+        self.previous = previous  # None — предыдущего поколения нет
+        self.count = count
+        self.started = started if started is not None else time.time()
+
+    def __contains__(self, user_id):
+        positions = _positions(user_id)
+        return _contains(self.current, positions) or (self.previous is not None and _contains(self.previous, positions))
+
+    def add(self, user_id, now=None):
+        """Отмечает анкету просмотренной. True — фильтр изменился."""
+        self.decay(now)
+        positions = _positions(user_id)
+        if _contains(self.current, positions):
+            return False
+        for position in positions:
+            self.current[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+        if self.count >= CAPACITY:
+            self._rotate(now)
+        return True
+
+    def decay(self, now=None):
+        """Сменяет поколения, если текущее прожило DECAY_SECONDS. True — что-то забыто."""
+        now = now or time.time()
+        age = now - self.started
+        if age < DECAY_SECONDS:
+            return False
+        if age >= 2 * DECAY_SECONDS:  # Давно не заходил: забываем все
+            self.previous = None
+            self.current = bytearray(BITS // 8)
+            self.count = 0
+            self.started = now
+        else:
+            self._rotate(now)
+        return True
+
+    def _rotate(self, now=None):
+        self.previous = self.current
+        self.current = bytearray(BITS // 8)
+        self.count = 0
+        self.started = now or time.time()
+
+    def nbytes(self):
+        return len(self.current) + (len(self.previous) if self.previous is not None else 0)
+
+    def to_bytes(self):
+        return _HEADER.pack(self.count, len(self.current), self.started) + bytes(self.current) + bytes(self.previous or b'')
+
+    @classmethod
+    def from_bytes(cls, data):
+        count, size, started = _HEADER.unpack_from(data)
+        if size != BITS // 8:  # Поменялись CAPACITY/ERROR_RATE: старый фильтр не прочитать, начинаем заново
+            return cls()
+        body = data[_HEADER.size:]
+        previous = bytearray(body[size:2 * size]) if len(body) >= 2 * size else None
+        return cls(bytearray(body[:size]), previous, count, started)
+
+
+class SeenStore:
+    """Фильтры просмотренного: LRU в памяти + таблица seen_filters."""
+
+    def __init__(self, maxsize=20_000, max_dirty=500, flush_interval=30.0):
+        self.maxsize = maxsize      # Сколько фильтров держать в памяти
+        self.max_dirty = max_dirty  # Сколько измененных фильтров копить до записи в базу
+        self.flush_interval = flush_interval  # Секунды между сбросами (при запущенном фоновом потоке)
+        self._filters = OrderedDict()  # {user_id: SeenFilter}
+        self._dirty = {}               # {user_id: SeenFilter} — еще не записаны в базу
+        self._lock = threading.Lock()
+        # Запись в базу: иначе flush мог бы вернуть в seen_filters строку, которую forget только что удалил
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.stats = {'loaded': 0, 'marked': 0, 'excluded': 0, 'flushes': 0, 'rows_flushed': 0}
+
+    def _get(self, user_id):
+        """Фильтр пользователя (под self._lock)."""
+        seen = self._filters.get(user_id)
+        if seen is not None:
+            self._filters.move_to_end(user_id)
+            return seen
+        seen = self._dirty.get(user_id)
+        if seen is None:
+            row = storage.fetchone("SELECT data FROM seen_filters WHERE user_id = ?", (user_id,))
+            seen = SeenFilter.from_bytes(row[0]) if row else SeenFilter()
+            self.stats['loaded'] += 1
+        self._filters[user_id] = seen
+        while len(self._filters) > self.maxsize:
+            self._filters.popitem(last=False)  # Измененные остаются в _dirty до записи
+        return seen
+
+    def mark(self, user_id, profile_id):
+        """Отмечает, что пользователю показали анкету profile_id."""
+        with self._lock:
+            seen = self._get(user_id)
+            if seen.add(profile_id):
+                self._dirty[user_id] = seen
+            self.stats['marked'] += 1
+            overflow = len(self._dirty) >= self.max_dirty
+        if overflow:
+            if self._thread is not None:
+                self._wakeup.set()  # Сбросит фоновый поток
+            else:
+                self.flush()
+
+    def exclude(self, user_id, candidates):
+        """Кандидаты, которых пользователь еще не видел (порядок сохраняется)."""
+        with self._lock:
+            seen = self._get(user_id)
+            if seen.decay():
+                self._dirty[user_id] = seen
+            fresh = [candidate for candidate in candidates if candidate not in seen]
+            self.stats['excluded'] += len(candidates) - len(fresh)
+        return fresh
+
+    def forget(self, user_id):
+        """Удаляет фильтр пользователя (при удалении или архивации анкеты)."""
+        with self._write_lock:
+            with self._lock:
+                self._filters.pop(user_id, None)
+                self._dirty.pop(user_id, None)
+            storage.execute("DELETE FROM seen_filters WHERE user_id = ?", (user_id,))
+
+    def flush(self):
+        """Записывает измененные фильтры одной транзакцией. Возвращает их число."""
+        with self._write_lock:
+            with self._lock:
+                batch, self._dirty = self._dirty, {}
+                rows = [(user_id, seen.to_bytes()) for user_id, seen in batch.items()]
+            if not rows:
+                return 0
+            try:
+                with storage.transaction():
+                    storage.executemany("INSERT OR REPLACE INTO seen_filters (user_id, data) VALUES (?, ?)", rows)
+            except Exception:
+                with self._lock:
+                    for user_id, seen in batch.items():
+                        self._dirty.setdefault(user_id, seen)
+                raise
+        with self._lock:
+            self.stats['flushes'] += 1
+            self.stats['rows_flushed'] += len(rows)
+        return len(rows)
+
+    # --- ФОНОВЫЙ ПОТОК ---
+
+    def start(self):
+        """Запускает периодический сброс в фоновом потоке."""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='seen-flush', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает фоновый поток и делает финальный сброс."""
+        if self._thread is not None:
+            self._stopped.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Не удалось сохранить просмотренные анкеты: {e}")
+
+    def memory_report(self):
+        """Сколько фильтров в памяти и сколько байт они занимают."""
+        with self._lock:
+            filters = list(self._filters.values())
+        size = sum(seen.nbytes() for seen in filters)
+        return dict(self.stats, entries=len(filters), dirty=len(self._dirty), bytes=size,
+                    bytes_per_entry=round(size / len(filters)) if filters else 0)
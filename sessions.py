@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""Компактное хранение сессий поиска и черновиков регистрации.
+
+Раньше search_sessions держал полный list id для каждого, кто когда-либо
+начинал поиск, а user_data — брошенные на полпути анкеты, и все это жило
+до перезапуска. Теперь:
+- список кандидатов хранится в array('q') (8 байт на id вместо ~36);
+- черновик анкеты — объект с __slots__ вместо словаря;
+- SessionStore вытесняет записи, к которым давно не обращались (idle TTL),
+  и самые старые при превышении maxsize;
+- сессии поиска можно сохранить в SQLite при остановке и поднять при запуске.
+"""
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+import storage
+
+
+class SearchSession:
+    """Сессия просмотра анкет: кандидаты и позиция в списке."""
+    __slots__ = ('profiles', 'current_index')
+
+    def __init__(self, profiles, current_index=0):
+        self.profiles = profiles if isinstance(profiles, array) else array('q', profiles)
+        self.current_index = current_index
+
+    def current(self):
+        """user_id текущей анкеты или None, если список закончился."""
+        if self.current_index < len(self.profiles):
+            return self.profiles[self.current_index]
+        return None
+
+    def nbytes(self):
+        return sys.getsizeof(self) + sys.getsizeof(self.profiles)
+
+
+class RegistrationDraft:
+    """Незаконченная анкета. get() повторяет dict.get для save_profile."""
+    __slots__ = ('nickname', 'winrate', 'line', 'rank', 'mythic_rank', 'goal', 'about', 'photo_id', 'telegram_username')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def nbytes(self):
+        return sys.getsizeof(self) + sum(sys.getsizeof(getattr(self, name)) for name in self.__slots__
+                                         if getattr(self, name) is not None)
+
+
+class SessionStore:
+    """{user_id: запись} с вытеснением по простою (ttl) и размеру (maxsize)."""
+
+    def __init__(self, ttl=3600, maxsize=100_000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # {user_id: (запись, время последнего обращения)}, старые — в начале
+        self._lock = threading.Lock()
+        self.stats = {'evicted_ttl': 0, 'evicted_size': 0}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __getitem__(self, user_id):
+        record = self.get(user_id)
+        if record is None:
+            raise KeyError(user_id)
+        return record
+
+    def __setitem__(self, user_id, record):
+        now = time.monotonic()
+        with self._lock:
+            self._data[user_id] = (record, now)
+            self._data.move_to_end(user_id)
+            self._evict(now)
+
+    def get(self, user_id, default=None):
+        """Запись пользователя; обращение продлевает ее жизнь."""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(user_id)
+            if item is None:
+                return default
+            record, touched = item
+            if now - touched > self.ttl:
+                del self._data[user_id]
+                self.stats['evicted_ttl'] += 1
+                return default
+            self._data[user_id] = (record, now)
+            self._data.move_to_end(user_id)
+            return record
+
+    def pop(self, user_id, default=None):
+        with self._lock:
+            item = self._data.pop(user_id, None)
+        return default if item is None else item[0]
+
+    def items(self):
+        with self._lock:
+            return [(user_id, record) for user_id, (record, _) in self._data.items()]
+
+    def expire(self):
+        """Принудительно вытесняет устаревшие записи. Возвращает их число."""
+        with self._lock:
+            before = len(self._data)
+            self._evict(time.monotonic())
+            return before - len(self._data)
+
+    def _evict(self, now):
+        # Записи упорядочены по времени обращения, поэтому смотрим только начало
+        while self._data:
+            user_id, (_, touched) = next(iter(self._data.items()))
+            if now - touched > self.ttl:
+                self.stats['evicted_ttl'] += 1
+            elif len(self._data) > self.maxsize:
+                self.stats['evicted_size'] += 1
+            else:
+                break
+            del self._data[user_id]
+
+    def memory_report(self):
+        """Сколько записей и примерно сколько байт они занимают."""
+        with self._lock:
+            records = [record for record, _ in self._data.values()]
+            overhead = sys.getsizeof(self._data)
+        size = sum(record.nbytes() if hasattr(record, 'nbytes') else sys.getsizeof(record) for record in records)
+        return dict(self.stats, entries=len(records), bytes=size + overhead,
+                    bytes_per_entry=round(size / len(records)) if records else 0)
+
+
+# --- СОХРАНЕНИЕ СЕССИЙ ПОИСКА В SQLite ---
+
+def save_search_sessions(store, shard=(0, 1)):
+    """Сохраняет сессии поиска в таблицу search_sessions (при остановке бота).
+
+    shard = (номер процесса, число процессов): в режиме workers каждый процесс
+    перезаписывает только строки своих пользователей (user_id % число = номер).
+    """
+    index, count = shard
+    rows = [(user_id, session.profiles.tobytes(), session.current_index)
+            for user_id, session in store.items()]
+    with storage.transaction():
+        storage.execute("DELETE FROM search_sessions WHERE user_id % ? = ?", (count, index))
+        storage.executemany("INSERT OR REPLACE INTO search_sessions (user_id, profiles, current_index) VALUES (?, ?, ?)", rows)
+    return len(rows)
+
+def load_search_sessions(store, shard=(0, 1)):
+    """Поднимает сохраненные сессии поиска (при запуске бота) — только пользователей своего процесса."""
+    index, count = shard
+    rows = storage.fetchall("SELECT user_id, profiles, current_index FROM search_sessions WHERE user_id % ? = ?",
+                            (count, index))
+    for user_id, blob, current_index in rows:
+        profiles = array('q')
+        profiles.frombytes(blob)
+        store[user_id] = SearchSession(profiles, current_index)
+    return len(rows)
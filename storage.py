@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""Слой доступа к базе.
+
+Весь код бота ходит в базу только через функции этого модуля (execute,
+fetchone, fetchall, executemany, transaction), а они — через выбранный
+бэкенд хранения:
+- SQLiteBackend (по умолчанию) — файл DB_PATH в режиме WAL. Вместо
+  sqlite3.connect() на каждый запрос каждый поток держит одно долгоживущее
+  соединение, подготовленные запросы кэшируются самим sqlite3
+  (cached_statements). Файл могут одновременно открывать несколько процессов
+  (режим workers, см. supervisor.py).
+- MemoryBackend — база в памяти процесса для тестов и бенчмарков: одно
+  соединение на все потоки, запросы и транзакции выполняются по очереди.
+
+Бэкенд выбирается переменной окружения STORAGE_BACKEND (sqlite|memory) или
+вызовом use(). Счетчики в `stats` показывают, сколько соединений открыто и
+сколько запросов выполнено. Если включены замеры (metrics.enabled), время
+каждого запроса попадает в гистограмму, а медленные запросы — в лог.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import metrics
+
+# --- НАСТРОЙКИ ---
+DB_PATH = os.environ.get('DB_PATH', 'mlbb_finder.db')
+CACHED_STATEMENTS = 256  # Размер кэша подготовленных запросов на соединение
+
+PRAGMAS = (
+    "PRAGMA auto_vacuum=INCREMENTAL",  # Для новой базы; старую переводит retention.py --vacuum
+    "PRAGMA journal_mode=WAL",       # Читатели не блокируют писателя
+    "PRAGMA synchronous=NORMAL",     # В WAL fsync только на checkpoint
+    "PRAGMA cache_size=-16000",      # ~16 МБ кэша страниц на соединение
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",      # Ждем блокировку, а не падаем сразу
+)
+
+MEMORY_PRAGMAS = (
+    "PRAGMA journal_mode=MEMORY",    # WAL для базы в памяти не нужен
+    "PRAGMA temp_store=MEMORY",
+)
+
+_lock = threading.Lock()
+stats = {'connections_opened': 0, 'statements_executed': 0}
+
+
+# --- БЭКЕНДЫ ---
+
+class SQLiteBackend:
+    """Файл SQLite: у каждого потока свое постоянное соединение."""
+    name = 'sqlite'
+
+    def __init__(self, path=None, pragmas=PRAGMAS):
+        self.path = path  # None — storage.DB_PATH на момент открытия соединения
+        self.pragmas = pragmas
+        self.guard = nullcontext()  # Соединения у потоков свои, запросы не нужно выстраивать в очередь
+        self._local = threading.local()
+        self._connections = []  # Все открытые соединения, чтобы закрыть их при выключении
+        self._generation = 0    # Растет при close_all(), чтобы потоки переоткрыли соединения
+
+    def _open_connection(self):
+        """Открывает новое соединение и применяет PRAGMA."""
+        # isolation_level=None: чтения не держат транзакцию, запись идет через transaction()
+        conn = sqlite3.connect(self.path or DB_PATH, isolation_level=None, check_same_thread=False,
+                               cached_statements=CACHED_STATEMENTS)
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        with _lock:
+            self._connections.append(conn)
+            stats['connections_opened'] += 1
+        return conn
+
+    def get_connection(self):
+        """Возвращает постоянное соединение текущего потока."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.generation != self._generation:
+            conn = self._local.conn = self._open_connection()
+            self._local.generation = self._generation
+        return conn
+
+    def close_all(self):
+        with _lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+            self._generation += 1
+
+    def connections_alive(self):
+        return len(self._connections)
+
+
+class MemoryBackend(SQLiteBackend):
+    """База в памяти процесса: одно соединение, запросы и транзакции по очереди.
+
+    Данные живут до close_all(). Для тестов и бенчмарков, где файл на диске
+    не нужен; между процессами такая база не разделяется.
+    """
+    name = 'memory'
+
+    def __init__(self, pragmas=MEMORY_PRAGMAS):
+        super().__init__(':memory:', pragmas)
+        # Держим все время транзакции: иначе запрос другого потока попал бы в чужую транзакцию
+        self.guard = threading.RLock()
+        self._conn = None
+
+    def get_connection(self):
+        if self._conn is None:
+            with self.guard:
+                if self._conn is None:
+                    self._conn = self._open_connection()
+        return self._conn
+
+    def close_all(self):
+        with self.guard:
+            super().close_all()
+            self._conn = None
+
+
+BACKENDS = {'sqlite': SQLiteBackend, 'memory': MemoryBackend}
+_backend = BACKENDS[os.environ.get('STORAGE_BACKEND', 'sqlite')]()
+
+
+def use(backend):
+    """Переключает модуль на другой бэкенд (соединения прежнего закрываются). Возвращает backend."""
+    global _backend
+    _backend.close_all()
+    _backend = backend
+    return backend
+
+def get_backend():
+    return _backend
+
+
+# --- СОЕДИНЕНИЯ ---
+
+def get_connection():
+    """Возвращает соединение текущего потока."""
+    return _backend.get_connection()
+
+def close_all():
+    """Закрывает все соединения (вызывается при остановке бота)."""
+    _backend.close_all()
+
+
+# --- ВЫПОЛНЕНИЕ ЗАПРОСОВ ---
+
+def _count(n=1):
+    with _lock:
+        stats['statements_executed'] += n
+
+def _run(run, sql, params):
+    """Выполняет run() в очереди бэкенда; при включенных замерах записывает время запроса."""
+    with _backend.guard:
+        if not metrics.enabled:
+            return run()
+        started = time.perf_counter()
+        try:
+            return run()
+        finally:
+            metrics.observe_sql(sql, time.perf_counter() - started, params)
+
+def execute(sql, params=()):
+    """Выполняет запрос и возвращает курсор."""
+    _count()
+    return _run(lambda: get_connection().execute(sql, params), sql, params)
+
+def executemany(sql, seq_of_params):
+    """Выполняет один запрос для набора параметров."""
+    _count()
+    return _run(lambda: get_connection().executemany(sql, seq_of_params), sql, None)
+
+def executescript(sql):
+    """Выполняет запросы без параметров до конца.
+
+    Нужно для PRAGMA вроде incremental_vacuum: execute() делает у запроса без
+    колонок результата один шаг, и освобождается одна страница вместо N.
+    """
+    _count()
+    return _run(lambda: get_connection().executescript(sql), sql, None)
+
+def fetchone(sql, params=()):
+    # Строки читаются в fetch, поэтому меряем (и держим очередь бэкенда) вместе с ним
+    _count()
+    return _run(lambda: get_connection().execute(sql, params).fetchone(), sql, params)
+
+def fetchall(sql, params=()):
+    _count()
+    return _run(lambda: get_connection().execute(sql, params).fetchall(), sql, params)
+
+@contextmanager
+def transaction():
+    """Группирует запросы в одну транзакцию (один commit вместо нескольких)."""
+    with _backend.guard:
+        conn = get_connection()
+        if conn.in_transaction:  # Вложенный вызов — работаем во внешней транзакции
+            yield conn
+            return
+        # Ожидание блокировки записи и commit — частая причина задержек, поэтому тоже меряются
+        _run(lambda: conn.execute("BEGIN IMMEDIATE"), "BEGIN IMMEDIATE", None)
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            _run(lambda: conn.execute("COMMIT"), "COMMIT", None)
+
+# --- СОСТОЯНИЕ ФОНОВЫХ ЗАДАЧ ---
+
+def get_state(name, default=0):
+    """Значение из job_state (прогресс и время запуска фоновых задач: рекомендации, архивация)."""
+    row = fetchone("SELECT value FROM job_state WHERE name = ?", (name,))
+    return row[0] if row else default
+
+def set_state(name, value):
+    execute("INSERT INTO job_state (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+            (name, value))
+
+def get_stats():
+    """Снимок счетчиков для логов и бенчмарков."""
+    with _lock:
+        return dict(stats, connections_alive=_backend.connections_alive(), backend=_backend.name)
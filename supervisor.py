@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""Режим workers: несколько процессов бота, обновления распределены по user_id.
+
+    python supervisor.py [N]      (или python main.py workers [N])
+
+Один процесс Python упирается в одно ядро: обработчики, индексы и
+ранжирование держат GIL. Supervisor запускает N рабочих процессов, в каждом —
+полный бот из main.py со своими глобальными объектами (bot, user_data,
+search_sessions, индексы), и отправляет каждое обновление процессу
+user_id % N. Все обновления пользователя попадают в один процесс и
+обрабатываются там по порядку, поэтому шаги регистрации и сессии поиска
+остаются локальными, как в однопроцессном режиме.
+
+Общие данные — в базе (SQLite в режиме WAL открывают все процессы). Индексы
+в памяти (активные игроки, фильтры, ранжирование, кэши анкет) у каждого
+процесса свои; чтобы они не расходились, процесс сообщает об изменениях
+(активность, сохранение, удаление анкеты) через Replicator, а supervisor
+пересылает их остальным процессам. Активность отправляется пачками раз в
+REPLICATE_INTERVAL, так что чужие процессы видят ее с задержкой до долей
+секунды — окно быстрого поиска 10 минут.
+
+Прочее в режиме workers:
+- общий лимит Telegram (outbox.GLOBAL_RATE) делится между процессами поровну;
+- архивация анкет (retention.py) работает только в процессе 0;
+- сервер метрик каждого процесса слушает METRICS_PORT + номер процесса;
+- упавший процесс перезапускается (не больше MAX_RESTARTS раз), обновления
+  из его очереди пропадают; индексы новый процесс строит заново из базы.
+
+Источник обновлений: long polling (по умолчанию) или webhook
+(WORKERS_SOURCE=webhook, настройки как у webhook.py).
+"""
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+
+import storage
+from webhook import update_user_id
+
+WORKERS = int(os.environ.get('BOT_WORKERS', str(os.cpu_count() or 1)))
+QUEUE_SIZE = 1000          # Обновлений в очереди одного процесса; дальше прием ждет (обратное давление)
+REPLICATE_INTERVAL = 0.2   # Секунды между отправками накопленных изменений индексов
+READY_TIMEOUT = 120        # Сколько ждать запуска процессов (перестройка индексов на большой базе)
+POLL_TIMEOUT = 20
+PUT_TIMEOUT = 1.0          # Как часто ждущий места в очереди проверяет, жив ли процесс
+MAX_RESTARTS = 3           # Перезапусков одного процесса; дальше route() выдает ошибку
+
+
+def shard(user_id, workers):
+    """Номер процесса для пользователя. Та же формула — в sessions.save/load_search_sessions."""
+    return user_id % workers
+
+
+# --- РАБОЧИЙ ПРОЦЕСС ---
+
+class Replicator:
+    """Копит изменения индексов процесса и пачками отправляет их supervisor."""
+
+    def __init__(self, index, events, interval=REPLICATE_INTERVAL):
+        self.index = index
+        self.events = events
+        self.interval = interval
+        self._touches = {}  # {user_id: время} — от активности нужна только последняя отметка
+        self._changes = []  # [(вид, user_id, данные)] — сохранения и удаления анкет, по порядку
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __call__(self, kind, user_id, payload):
+        with self._lock:
+            if kind == 'touch':
+                self._touches[user_id] = payload
+            else:
+                self._changes.append((kind, user_id, payload))
+
+    def flush(self):
+        with self._lock:
+            touches, self._touches = self._touches, {}
+            changes, self._changes = self._changes, []
+        batch = [('touch', user_id, when) for user_id, when in touches.items()] + changes
+        if batch:
+            self.events.put(('events', self.index, batch))
+        return len(batch)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='replicator', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+
+def _worker_main(index, count, inbox, events, app_name, initializer, initargs):
+    """Точка входа рабочего процесса."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Остановкой управляет supervisor
+    os.environ['BOT_WORKER_INDEX'] = str(index)
+    os.environ['BOT_WORKER_COUNT'] = str(count)
+    import importlib
+    from telebot import types
+
+    app = importlib.import_module(app_name)
+    if initializer is not None:
+        initializer(app, *initargs)
+    app.bot.threaded = False  # Обработчики выполняются прямо в этом потоке, по порядку
+    replicator = None
+    if count > 1:  # Одному процессу рассылать изменения некому
+        replicator = app.replicate = Replicator(index, events).start()
+    app.startup()
+    events.put(('ready', index, None))
+    stats = {'handled': 0, 'errors': 0, 'replicated_in': 0, 'replicated_errors': 0}
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        kind, payload = item
+        if kind == 'update':
+            try:
+                app.bot.process_new_updates([types.Update.de_json(payload)])
+            except Exception as e:
+                stats['errors'] += 1
+                print(f"[worker {index}] Ошибка обработки обновления {payload.get('update_id')}: {e}")
+            stats['handled'] += 1
+        elif kind == 'events':
+            try:
+                app.apply_replicated(payload)
+            except Exception as e:
+                stats['replicated_errors'] += 1
+                print(f"[worker {index}] Ошибка применения изменений индексов ({len(payload)} шт.): {e}")
+            stats['replicated_in'] += len(payload)
+    if replicator is not None:
+        replicator.stop()
+    app.shutdown()
+    events.put(('stopped', index, stats))
+
+
+# --- SUPERVISOR ---
+
+class Supervisor:
+    """Запускает рабочие процессы, раздает им обновления и пересылает изменения индексов."""
+
+    def __init__(self, workers=WORKERS, app='main', initializer=None, initargs=(), queue_size=QUEUE_SIZE):
+        self.workers = workers
+        self.app = app                  # Модуль с ботом: импортируется в каждом процессе
+        self.initializer = initializer  # initializer(app, *initargs) в процессе до startup()
+        self.initargs = initargs
+        ctx = multiprocessing.get_context('spawn')  # Без fork: в процессе уже могут быть потоки
+        self._ctx = ctx
+        self._queue_size = queue_size
+        self._inboxes = [ctx.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._events = ctx.Queue()
+        self._processes = []
+        self._forwarder = None
+        self._ready = threading.Event()
+        self._ready_count = 0
+        self._lock = threading.Lock()  # Перезапуск процесса (из route и из пересылки изменений)
+        self._stopping = False
+        self.restarts = [0] * workers
+        self.worker_stats = {}  # {номер процесса: счетчики, присланные при остановке}
+        self.stats = {'routed': 0, 'replicated_batches': 0, 'replicated_events': 0, 'restarts': 0}
+
+    def start(self):
+        """Применяет миграции, запускает процессы и ждет, пока все будут готовы."""
+        import migrations
+
+        migrations.migrate()  # Один раз здесь, а не наперегонки в N процессах
+        storage.close_all()
+        self._processes = [self._start_worker(index) for index in range(self.workers)]
+        self._forwarder = threading.Thread(target=self._forward, name='supervisor-events', daemon=True)
+        self._forwarder.start()
+        if not self._ready.wait(READY_TIMEOUT):
+            self.stop()
+            raise RuntimeError(f"Рабочие процессы не запустились за {READY_TIMEOUT} с")
+        return self
+
+    def _start_worker(self, index):
+        process = self._ctx.Process(target=_worker_main, name=f'bot-worker-{index}',
+                                    args=(index, self.workers, self._inboxes[index], self._events, self.app,
+                                          self.initializer, self.initargs))
+        process.start()
+        return process
+
+    def _restart(self, index):
+        """Перезапускает упавший процесс с новой очередью. False — идет остановка."""
+        with self._lock:
+            process = self._processes[index]
+            if process.is_alive():
+                return True  # Уже перезапущен другим потоком
+            if self._stopping:
+                return False
+            if self.restarts[index] >= MAX_RESTARTS:
+                raise RuntimeError(f"{process.name} завершился с кодом {process.exitcode}, "
+                                   f"перезапусков уже {MAX_RESTARTS}")
+            print(f"{process.name} завершился с кодом {process.exitcode}, перезапускаем")
+            # Старую очередь не читаем: процесс мог упасть, держа ее блокировку.
+            # С общей очередью событий так не выйти — процесс, убитый посреди
+            # записи в нее, останавливает репликацию до перезапуска supervisor.
+            self._inboxes[index] = self._ctx.Queue(maxsize=self._queue_size)
+            self._processes[index] = self._start_worker(index)
+            self.restarts[index] += 1
+            self.stats['restarts'] += 1
+            return True
+
+    def _put(self, index, item, restart=True):
+        """Кладет item в очередь процесса index. False — процесс не работает и не перезапущен.
+
+        Ждет места кусками по PUT_TIMEOUT и перед каждой попыткой проверяет
+        процесс: иначе put() в заполненную очередь упавшего процесса ждал бы
+        вечно, а в незаполненную — копил бы обновления, которые никто не прочтет.
+        """
+        while True:
+            if not self._processes[index].is_alive() and (not restart or not self._restart(index)):
+                return False
+            try:
+                self._inboxes[index].put(item, timeout=PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+
+    def route(self, data):
+        """Отправляет обновление (dict из JSON) процессу его пользователя.
+
+        Если процесс упал больше MAX_RESTARTS раз, выдает RuntimeError.
+        """
+        routed = self._put(shard(update_user_id(data), self.workers), ('update', data))
+        if routed:
+            self.stats['routed'] += 1
+        return routed
+
+    def _forward(self):
+        """Пересылает пачки изменений индексов всем процессам, кроме отправителя."""
+        while True:
+            item = self._events.get()
+            if item is None:  # Из stop(): упавший процесс 'stopped' уже не пришлет
+                return
+            kind, index, payload = item
+            if kind == 'events':
+                for other in range(self.workers):
+                    if other != index and other not in self.worker_stats:  # Остановленным не шлем
+                        try:
+                            self._put(other, ('events', payload))
+                        except RuntimeError:
+                            pass  # Процесс не поднимается — об этом сообщит route()
+                self.stats['replicated_batches'] += 1
+                self.stats['replicated_events'] += len(payload)
+            elif kind == 'ready':
+                self._ready_count += 1
+                if self._ready_count == self.workers:
+                    self._ready.set()
+            elif kind == 'stopped':
+                self.worker_stats[index] = payload
+
+    def stop(self, timeout=60):
+        """Досылает очереди, останавливает процессы (каждый выполняет shutdown) и ждет их."""
+        self._stopping = True
+        for index in range(len(self._processes)):
+            self._put(index, None, restart=False)
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                print(f"{process.name} не остановился за {timeout} с, завершаем принудительно")
+                process.terminate()
+                process.join()
+        if self._forwarder is not None:
+            self._events.put(None)  # После 'stopped' от всех завершившихся процессов
+            self._forwarder.join(5.0)
+        for inbox in self._inboxes:
+            inbox.cancel_join_thread()  # Непрочитанные остатки не должны держать выход supervisor
+        self._processes.clear()
+        return dict(self.stats, workers=self.worker_stats)
+
+
+# --- ЗАПУСК ---
+
+def _poll(supervisor, token):
+    """Long polling: получает обновления и раздает их процессам."""
+    from telebot import apihelper
+
+    offset = None
+    while True:
+        try:
+            updates = apihelper.get_updates(token, offset=offset, timeout=POLL_TIMEOUT + 5,
+                                            long_polling_timeout=POLL_TIMEOUT)
+        except Exception as e:
+            print(f"Ошибка получения обновлений: {e}")
+            time.sleep(3)
+            continue
+        for data in updates:
+            supervisor.route(data)
+            offset = data['update_id'] + 1
+
+
+def run(workers=WORKERS):
+    token = os.environ.get('TOKEN')
+    if not token:
+        print("Токен не найден: задайте переменную окружения TOKEN.")
+        return
+    supervisor = Supervisor(workers).start()
+    source = os.environ.get('WORKERS_SOURCE', 'polling')
+    server = None
+    print(f"Бот запускается (workers: {workers} процессов, {source})...")
+    try:
+        if source == 'webhook':
+            import webhook
+            from telebot import apihelper
+
+            server = webhook.WebhookServer(
+                supervisor.route,
+                host=os.environ.get('WEBHOOK_HOST', '127.0.0.1'),
+                port=int(os.environ.get('WEBHOOK_PORT', '8443')),
+                path=os.environ.get('WEBHOOK_PATH', '/webhook'),
+                secret=webhook.secret_from_env(),
+            ).start()
+            if os.environ.get('WEBHOOK_URL'):
+                apihelper.set_webhook(token, url=os.environ['WEBHOOK_URL'], secret_token=server.secret)
+            while True:
+                time.sleep(60)
+        else:
+            _poll(supervisor, token)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.stop()
+        print(f"Workers: {supervisor.stop()}")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else WORKERS)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""Общие настройки тестов: база в памяти вместо файла, без фоновой архивации.
+
+Запуск из корня репозитория: python -m pytest -q
+"""
+import os
+import sys
+
+os.environ['STORAGE_BACKEND'] = 'memory'
+os.environ.setdefault('TOKEN', '1:test')
+os.environ['RETENTION_INTERVAL'] = '0'
+os.environ.pop('METRICS_PORT', None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+import migrations  # noqa: E402
+import storage  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """Пустая база в памяти с актуальной схемой; закрывается после теста."""
+    backend = storage.use(storage.MemoryBackend())
+    migrations.migrate()
+    yield backend
+    backend.close_all()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Лайки, входящие и мэтчи: инварианты материализованных таблиц и счетчиков."""
+import pytest
+
+import likes
+import migrations
+import storage
+
+pytestmark = pytest.mark.usefixtures('db')
+
+
+def check_invariants(pruning=None):
+    """likes_inbox, matches и like_counters совпадают с тем, что следует из likes.
+
+    pruning — пользователь, чья чистка прервана: тогда таблицы уже не следуют
+    из likes, а сходиться обязаны только счетчики остальных пользователей.
+    """
+    pairs = set(storage.fetchall("SELECT liker_id, liked_id FROM likes"))
+    inbox = set(storage.fetchall("SELECT user_id, liker_id FROM likes_inbox"))
+    matches = set(storage.fetchall("SELECT user_a, user_b FROM matches"))
+    if pruning is None:
+        assert inbox == {(liked, liker) for liker, liked in pairs if (liked, liker) not in pairs}
+        assert matches == {(a, b) for a, b in pairs if a < b and (b, a) in pairs}
+    users = {user for pair in pairs for user in pair}
+    for user_id in users | {row[0] for row in storage.fetchall("SELECT user_id FROM like_counters")}:
+        if user_id == pruning:
+            continue
+        assert likes.get_counters(user_id) == {
+            'likes_received': sum(1 for _, liked in pairs if liked == user_id),
+            'inbox_count': sum(1 for owner, _ in inbox if owner == user_id),
+            'matches_count': sum(1 for a, b in matches if user_id in (a, b)),
+        }
+
+
+def test_like_then_answer_makes_match():
+    assert likes.record_like(1, 2) is False
+    assert likes.liked_by(2) == [1]
+    assert likes.record_like(2, 1) is True
+    assert likes.liked_by(2) == [] and likes.liked_by(1) == []
+    assert likes.get_counters(1) == {'likes_received': 1, 'inbox_count': 0, 'matches_count': 1}
+    check_invariants()
+
+
+def test_repeated_like_changes_nothing():
+    likes.record_like(1, 2)
+    assert likes.record_like(1, 2) is False
+    assert likes.get_counters(2) == {'likes_received': 1, 'inbox_count': 1, 'matches_count': 0}
+    check_invariants()
+
+
+def seed_graph():
+    for liker, liked in ((1, 2), (2, 1), (1, 3), (3, 4), (4, 1), (5, 1), (1, 5), (2, 3), (6, 1)):
+        likes.record_like(liker, liked)
+    check_invariants()
+
+
+def test_delete_user_keeps_invariants():
+    seed_graph()
+    likes.delete_user(1)
+    assert not storage.fetchall("SELECT 1 FROM likes WHERE liker_id = 1 OR liked_id = 1")
+    check_invariants()
+
+
+STATE_QUERIES = (
+    "SELECT liker_id, liked_id FROM likes ORDER BY 1, 2",
+    "SELECT user_id, liker_id FROM likes_inbox ORDER BY 1, 2",
+    "SELECT user_a, user_b FROM matches ORDER BY 1, 2",
+    "SELECT * FROM like_counters ORDER BY 1",
+)
+
+
+@pytest.mark.parametrize('chunk', [1, 2, 1000])
+def test_prune_user_matches_delete_user(chunk):
+    seed_graph()
+    assert likes.prune_user(1, chunk=chunk) > 0
+    check_invariants()
+    pruned = [storage.fetchall(sql) for sql in STATE_QUERIES]
+    storage.use(storage.MemoryBackend())  # Та же история лайков с нуля, но через delete_user
+    migrations.migrate()
+    seed_graph()
+    likes.delete_user(1)
+    assert [storage.fetchall(sql) for sql in STATE_QUERIES] == pruned
+
+
+def test_prune_user_stops_when_still_is_false():
+    seed_graph()
+    calls = []
+
+    def still():
+        calls.append(1)
+        return len(calls) < 2  # Первая порция удаляется, дальше — анкету «вернули»
+
+    removed = likes.prune_user(1, chunk=1, still=still)
+    assert removed == 1
+    assert storage.fetchone("SELECT 1 FROM like_counters WHERE user_id = 1")
+    check_invariants(pruning=1)
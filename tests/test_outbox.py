@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Outbox: пауза чата ровно на retry_after после 429 и повтор без потери сообщения."""
+import threading
+import time
+
+import pytest
+from telebot.apihelper import ApiTelegramException
+
+import outbox
+
+
+class FakeBot:
+    """Отвечает 429 на первые rate_limited вызовов в чат, остальные записывает."""
+
+    def __init__(self, rate_limited=None, retry_after=1):
+        self.rate_limited = dict(rate_limited or {})  # {chat_id: сколько раз ответить 429}
+        self.retry_after = retry_after
+        self.calls = []  # (время, chat_id, текст, успех)
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self._lock:
+            limited = self.rate_limited.get(chat_id, 0) > 0
+            if limited:
+                self.rate_limited[chat_id] -= 1
+            self.calls.append((time.monotonic(), chat_id, text, not limited))
+        if limited:
+            raise ApiTelegramException('sendMessage', None, {
+                'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                'parameters': {'retry_after': self.retry_after}})
+        return text
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(outbox, 'JITTER', 0.0)
+
+
+def test_retry_after_pauses_only_that_chat():
+    bot = FakeBot(rate_limited={1: 1})
+    box = outbox.Outbox(bot, workers=2, global_rate=1000.0, chat_rate=1000.0).start()
+    try:
+        first = box.send_message(1, 'a')
+        second = box.send_message(1, 'b')
+        other = box.send_message(2, 'c')
+        assert other.result(timeout=5) == 'c'
+        assert first.result(timeout=5) == 'a' and second.result(timeout=5) == 'b'
+    finally:
+        box.stop()
+    limited_at = bot.calls[0][0]
+    retried_at = next(when for when, chat_id, text, ok in bot.calls if chat_id == 1 and ok)
+    other_at = next(when for when, chat_id, text, ok in bot.calls if chat_id == 2)
+    assert retried_at - limited_at >= bot.retry_after
+    assert other_at < limited_at + bot.retry_after  # Другой чат паузу не ждет
+    assert [text for _, chat_id, text, ok in bot.calls if chat_id == 1 and ok] == ['a', 'b']  # Порядок сохранен
+    metrics = box.get_metrics()
+    assert metrics['rate_limited'] == 1 and metrics['sent'] == 3 and metrics.get('failed', 0) == 0
+
+
+def test_retry_after_does_not_use_up_retries():
+    bot = FakeBot(rate_limited={1: outbox.MAX_RETRIES + 1}, retry_after=0)
+    box = outbox.Outbox(bot, workers=1, global_rate=1000.0, chat_rate=1000.0).start()
+    try:
+        assert box.send_message(1, 'a').result(timeout=5) == 'a'
+    finally:
+        box.stop()
+    assert box.get_metrics()['rate_limited'] == outbox.MAX_RETRIES + 1
+
+
+def test_other_api_errors_fail_without_retry():
+    class BrokenBot(FakeBot):
+        def send_message(self, chat_id, text, **kwargs):
+            self.calls.append((time.monotonic(), chat_id, text, False))
+            raise ApiTelegramException('sendMessage', None, {'ok': False, 'error_code': 403,
+                                                             'description': 'Forbidden: bot was blocked by the user'})
+
+    bot = BrokenBot()
+    box = outbox.Outbox(bot, workers=1, global_rate=1000.0, chat_rate=1000.0).start()
+    try:
+        with pytest.raises(ApiTelegramException):
+            box.send_message(1, 'a').result(timeout=5)
+    finally:
+        box.stop()
+    assert len(bot.calls) == 1 and box.get_metrics()['failed'] == 1
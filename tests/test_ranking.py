@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Паритет ранжирования: NumPy и чистый Python дают одни оценки и порядок."""
+import random
+import time
+
+import pytest
+
+import ranking
+from profile_fields import LINES, RANKS, MYTHIC_RANKS, GOALS, MYTHIC
+
+pytestmark = pytest.mark.skipif(ranking.np is None, reason="NumPy не установлен")
+
+
+def random_profile(rng, now):
+    rank = rng.choice(list(RANKS) + [None])  # None — анкета без ранга (уровень -1)
+    return {
+        'line': rng.choice(LINES), 'rank': rank,
+        'mythic_rank': rng.choice(MYTHIC_RANKS) if rank == MYTHIC else None,
+        'goal': rng.choice(GOALS), 'winrate': rng.choice([None, rng.randint(30, 80)]),
+        'last_active': now - rng.expovariate(1 / 3600),
+    }
+
+
+@pytest.fixture
+def columns():
+    rng = random.Random(7)
+    now = time.time()
+    profiles = [random_profile(rng, now) for _ in range(3000)]
+    fast = ranking.ProfileColumns(use_numpy=True)
+    slow = ranking.ProfileColumns(use_numpy=False)
+    for user_id, profile in enumerate(profiles, start=1):
+        fast.add(user_id, profile)
+        slow.add(user_id, profile)
+    return fast, slow, list(range(2, len(profiles) + 1)), now
+
+
+def test_scores_match(columns):
+    fast, slow, ids, now = columns
+    _, fast_rows = fast.rows_for(ids)
+    _, slow_rows = slow.rows_for(ids)
+    fast_scores = fast.score_rows(1, fast_rows, now=now)
+    slow_scores = slow.score_rows(1, slow_rows, now=now)
+    assert max(abs(float(a) - b) for a, b in zip(fast_scores, slow_scores)) < 1e-4
+
+
+def test_order_matches_up_to_ties(columns):
+    fast, slow, ids, now = columns
+    _, rows = slow.rows_for(ids)
+    by_id = dict(zip(ids, slow.score_rows(1, rows, now=now)))
+    top_fast = fast.rank(1, ids, now=now)
+    top_slow = slow.rank(1, ids, now=now)
+    assert sorted(top_fast) == sorted(top_slow) == sorted(ids)
+    # Порядок может отличаться только у кандидатов с (почти) равной оценкой
+    assert all(abs(by_id[a] - by_id[b]) < 1e-4 for a, b in zip(top_fast, top_slow))
+
+
+def test_unknown_candidates_go_last(columns):
+    fast, slow, ids, now = columns
+    for cols in (fast, slow):
+        assert cols.rank(1, [10**9] + ids[:50], now=now)[-1] == 10**9
+
+
+def test_removed_profile_matches_after_reuse(columns):
+    fast, slow, ids, now = columns
+    for cols in (fast, slow):
+        cols.remove(ids[0])
+        cols.add(10**9, {'line': LINES[0], 'rank': RANKS[0], 'goal': GOALS[0], 'winrate': 50}, last_active=now)
+    candidates = ids[1:200] + [10**9]
+    _, fast_rows = fast.rows_for(candidates)
+    _, slow_rows = slow.rows_for(candidates)
+    fast_scores = fast.score_rows(1, fast_rows, now=now)
+    slow_scores = slow.score_rows(1, slow_rows, now=now)
+    assert max(abs(float(a) - b) for a, b in zip(fast_scores, slow_scores)) < 1e-4
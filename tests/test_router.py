@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Выбор обработчика в Router: шаги, команды, кнопки, тип содержимого."""
+from types import SimpleNamespace
+
+import pytest
+
+from router import Router
+
+
+def message(text=None, user_id=1, content_type='text'):
+    return SimpleNamespace(text=text, content_type=content_type, from_user=SimpleNamespace(id=user_id))
+
+
+@pytest.fixture
+def router():
+    router = Router()
+    calls = []
+    router.calls = calls
+
+    @router.command('start')
+    def start(m):
+        calls.append('start')
+
+    @router.text("👤 Моя анкета")
+    def profile(m):
+        calls.append('profile')
+
+    @router.content_type('photo')
+    def photo(m):
+        calls.append('photo')
+
+    @router.default
+    def fallback(m):
+        calls.append('fallback')
+
+    return router
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('/start', 'start'),
+    ('/start@mlbb_bot', 'start'),
+    ('/start ref123', 'start'),
+    ("👤 Моя анкета", 'profile'),
+    ('/unknown', 'fallback'),
+    ('/', 'fallback'),
+    ('/ ', 'fallback'),
+    ('/  start', 'start'),
+    ('просто текст', 'fallback'),
+])
+def test_dispatch_text(router, text, expected):
+    router.dispatch(message(text))
+    assert router.calls == [expected]
+
+
+def test_dispatch_content_type(router):
+    router.dispatch(message(None, content_type='photo'))
+    assert router.calls == ['photo']
+
+
+def test_step_takes_priority_and_is_cleared(router):
+    router.set_step(1, lambda m: router.calls.append('step'))
+    router.dispatch(message("👤 Моя анкета"))
+    router.dispatch(message("👤 Моя анкета"))
+    assert router.calls == ['step', 'profile']
+
+
+def test_step_is_per_user(router):
+    router.set_step(2, lambda m: router.calls.append('step'))
+    router.dispatch(message('/start', user_id=1))
+    assert router.calls == ['start']
+    assert 2 in router.steps
+
+
+def test_match_text(router):
+    assert router.match_text('/start@bot').__name__ == 'start'
+    assert router.match_text("👤 Моя анкета").__name__ == 'profile'
+    for text in (None, '/ ', '/', 'просто текст'):
+        assert router.match_text(text) is None
+
+
+def test_stats_count_calls(router):
+    router.dispatch(message('/start'))
+    router.dispatch(message('/start'))
+    assert router.stats['start'] == 2
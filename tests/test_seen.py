@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Фильтры просмотренного: сброс по таймеру и удаление, которое не откатывает flush."""
+import time
+
+import pytest
+
+import storage
+from seen import SeenStore
+
+pytestmark = pytest.mark.usefixtures('db')
+
+
+def stored(user_id):
+    return storage.fetchone("SELECT 1 FROM seen_filters WHERE user_id = ?", (user_id,)) is not None
+
+
+def test_timer_flushes_dirty_filters():
+    store = SeenStore(flush_interval=0.05)
+    store.start()
+    try:
+        store.mark(1, 100)
+        deadline = time.monotonic() + 5
+        while not stored(1) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert stored(1)
+    finally:
+        store.stop()
+    assert store.stats['flushes'] >= 1
+
+
+def test_stop_flushes_the_rest():
+    store = SeenStore(flush_interval=60)
+    store.start()
+    store.mark(1, 100)
+    store.stop()
+    assert stored(1)
+    assert SeenStore().exclude(1, [100, 101]) == [101]  # Новый объект читает фильтр из базы
+
+
+def test_forget_is_not_undone_by_flush():
+    store = SeenStore()
+    store.mark(1, 100)
+    store.flush()
+    store.mark(1, 101)  # Снова «грязный» фильтр
+    store.forget(1)
+    store.flush()
+    assert not stored(1)
+    assert store.exclude(1, [100, 101]) == [100, 101]
+
+
+def test_replicated_forget_drops_filter_on_owning_shard(monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, 'WORKER_COUNT', 2)
+    monkeypatch.setattr(main, 'WORKER_INDEX', 1)
+    store = SeenStore()
+    monkeypatch.setattr(main, 'seen_profiles', store)
+    for user_id in (3, 4):  # 3 — пользователь этого процесса, 4 — соседнего
+        store.mark(user_id, 100)
+    store.flush()
+    store.mark(3, 101)
+    main.apply_replicated([('forget', 3, None), ('forget', 4, None)])
+    store.flush()
+    assert not stored(3)
+    assert store.exclude(3, [100, 101]) == [100, 101]
+    assert stored(4)  # Чужой фильтр удаляет его собственный процесс
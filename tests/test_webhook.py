@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Прием обновлений webhook: секрет, разбор запроса, 503 при заполненной очереди."""
+import http.client
+import json
+import threading
+
+import pytest
+
+import webhook
+
+SECRET = 's3cret'
+UPDATE = {'update_id': 1, 'message': {'message_id': 1, 'from': {'id': 42}, 'text': 'hi'}}
+
+
+@pytest.fixture
+def server():
+    handled = []
+    server = webhook.WebhookServer(handled.append, port=0, secret=SECRET, workers=1, queue_size=1)
+    server.handled = handled
+    yield server.start()
+    server.stop()
+
+
+def post(server, body, headers):
+    host, port = server.httpd.server_address[:2]
+    conn = http.client.HTTPConnection(host, port, timeout=5)
+    try:
+        conn.request('POST', server.path, body=body, headers=headers)
+        return conn.getresponse().status
+    finally:
+        conn.close()
+
+
+def post_update(server, secret=SECRET, update=UPDATE):
+    return post(server, json.dumps(update).encode(), {webhook.SECRET_HEADER: secret} if secret is not None else {})
+
+
+def test_accepts_update_with_secret(server):
+    assert post_update(server) == 200
+    server.stop()  # Дожидается обработки очереди; повторный stop() в фикстуре ничего не делает
+    assert server.handled == [UPDATE]
+
+
+@pytest.mark.parametrize('secret', [None, '', 'wrong', 'sécret', 's3creté'])
+def test_rejects_wrong_secret(server, secret):
+    assert post_update(server, secret) == 403
+    assert server.get_stats()['rejected_secret'] == 1
+
+
+@pytest.mark.parametrize('length', ['abc', '-5', '0', str(webhook.MAX_BODY + 1)])
+def test_rejects_bad_content_length(server, length):
+    host, port = server.httpd.server_address[:2]
+    conn = http.client.HTTPConnection(host, port, timeout=5)
+    conn.putrequest('POST', server.path)
+    conn.putheader(webhook.SECRET_HEADER, SECRET)
+    conn.putheader('Content-Length', length)
+    conn.endheaders()
+    assert conn.getresponse().status == 400
+    conn.close()
+
+
+def test_rejects_broken_json(server):
+    assert post(server, b'{not json', {webhook.SECRET_HEADER: SECRET}) == 400
+
+
+def test_full_queue_answers_503(monkeypatch):
+    monkeypatch.setattr(webhook, 'PUT_TIMEOUT', 0.05)
+    started, release = threading.Event(), threading.Event()
+
+    def process(data):
+        started.set()
+        release.wait(5)
+
+    server = webhook.WebhookServer(process, port=0, secret=SECRET, workers=1, queue_size=1).start()
+    try:
+        assert post_update(server) == 200   # Обрабатывается (и висит) в рабочем потоке
+        assert started.wait(5)
+        assert post_update(server) == 200   # Ждет в очереди — единственное место
+        assert post_update(server) == 503   # Места нет: Telegram повторит позже
+        assert server.get_stats()['rejected_full'] == 1
+    finally:
+        release.set()
+        server.stop()
+    assert server.get_stats()['handled'] == 2
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""Режим webhook: python main.py webhook
+
+Встроенный HTTP-сервер принимает POST-запросы Telegram с обновлениями,
+проверяет заголовок X-Telegram-Bot-Api-Secret-Token, кладет обновление в
+ограниченную очередь и сразу отвечает 200. Обновления обрабатывает пул
+рабочих потоков вне потока запроса. Очередь выбирается по user_id, поэтому
+сообщения одного пользователя обрабатываются строго по порядку.
+
+Если очередь заполнена, сервер ждет недолго и отвечает 503 — Telegram
+повторит доставку позже (обратное давление вместо неограниченного роста).
+GET /stats отдает глубину очередей и задержку от приема до обработки.
+
+Настройки (переменные окружения): WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH,
+WEBHOOK_SECRET, WEBHOOK_URL (публичный адрес; если задан, webhook
+регистрируется в Telegram при запуске). С публичным адресом секрет
+обязателен: если WEBHOOK_SECRET не задан, при каждом запуске генерируется
+случайный и передается Telegram вместе с адресом.
+
+Сервер не зависит от telebot, поэтому его можно проверить без сети: запустить
+с любой функцией обработки и отправить записанные обновления на localhost
+(см. benchmarks/replay_webhook.py).
+"""
+import hmac
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUEUE_SIZE = 1000      # Всего мест в очередях на все рабочие потоки
+WORKERS = 8
+PUT_TIMEOUT = 0.5      # Сколько ждать места в очереди, прежде чем ответить 503
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+MAX_BODY = 1 << 20     # Обновления Telegram заметно меньше мегабайта
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Стандартных 5 мало для пиков входящих запросов
+
+
+def update_user_id(data):
+    """user_id отправителя из JSON обновления (для выбора очереди)."""
+    for key in ('message', 'edited_message', 'callback_query'):
+        sender = (data.get(key) or {}).get('from')
+        if sender:
+            return sender.get('id', 0)
+    return data.get('update_id', 0)
+
+
+def secret_from_env():
+    """WEBHOOK_SECRET, а при заданном WEBHOOK_URL без него — случайный секрет.
+
+    Без секрета сервер принимает любой POST как обновление Telegram; для
+    адреса, доступного из интернета, так нельзя.
+    """
+    secret = os.environ.get('WEBHOOK_SECRET')
+    if not secret and os.environ.get('WEBHOOK_URL'):
+        secret = secrets.token_urlsafe(32)  # Символы A-Z, a-z, 0-9, _ и - — допустимы в secret_token
+    return secret
+
+
+class WebhookServer:
+    """HTTP-прием обновлений + пул обработчиков с очередями по user_id."""
+
+    def __init__(self, process, host='127.0.0.1', port=8443, path='/webhook', secret=None,
+                 queue_size=QUEUE_SIZE, workers=WORKERS):
+        self.process = process  # Функция обработки одного обновления (dict из JSON)
+        self.path = path
+        self.secret = secret
+        self._queues = [queue.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)]
+        self._threads = []
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=10_000)  # Последние задержки прием→обработка, секунды
+        self.stats = {'received': 0, 'rejected_secret': 0, 'rejected_full': 0, 'bad_request': 0,
+                      'handled': 0, 'errors': 0}
+        self.httpd = _HTTPServer((host, port), self._make_handler())
+
+    @property
+    def address(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{self.path}"
+
+    # --- ПРИЕМ ---
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != server.path:
+                    return self._reply(404)
+                # Байты, а не str: compare_digest не принимает строки с не-ASCII символами
+                if server.secret and not hmac.compare_digest(self.headers.get(SECRET_HEADER, '').encode(),
+                                                             server.secret.encode()):
+                    server._count('rejected_secret')
+                    return self._reply(403)
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                except ValueError:
+                    length = -1
+                if not 0 < length <= MAX_BODY:
+                    server._count('bad_request')
+                    return self._reply(400)
+                try:
+                    data = json.loads(self.rfile.read(length))
+                except ValueError:
+                    server._count('bad_request')
+                    return self._reply(400)
+                self._reply(200 if server.enqueue(data) else 503)
+
+            def do_GET(self):
+                if self.path != '/stats':
+                    return self._reply(404)
+                body = json.dumps(server.get_stats()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _reply(self, code):
+                self.send_response(code)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass  # Не пишем строку в лог на каждое обновление
+
+        return Handler
+
+    def enqueue(self, data):
+        """Кладет обновление в очередь его пользователя. False — очередь полна."""
+        target = self._queues[hash(update_user_id(data)) % len(self._queues)]
+        try:
+            target.put((time.monotonic(), data), timeout=PUT_TIMEOUT)
+        except queue.Full:
+            self._count('rejected_full')
+            return False
+        self._count('received')
+        return True
+
+    # --- ОБРАБОТКА ---
+
+    def _work(self, own_queue):
+        while True:
+            item = own_queue.get()
+            if item is None:
+                own_queue.task_done()
+                return
+            received, data = item
+            try:
+                self.process(data)
+            except Exception as e:
+                self._count('errors')
+                print(f"Ошибка обработки обновления {data.get('update_id')}: {e}")
+            finally:
+                with self._lock:
+                    self.stats['handled'] += 1
+                    self._latencies.append(time.monotonic() - received)
+                own_queue.task_done()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def get_stats(self):
+        """Счетчики, глубина очередей и перцентили задержки прием→обработка (мс)."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            result = dict(self.stats)
+        result['queue_depth'] = sum(q.qsize() for q in self._queues)
+        for name, share in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+            result[f'latency_{name}_ms'] = round(latencies[int(share * (len(latencies) - 1))] * 1000, 2) if latencies else 0.0
+        return result
+
+    # --- ЗАПУСК И ОСТАНОВКА ---
+
+    def start(self):
+        """Запускает рабочие потоки и HTTP-сервер в фоне."""
+        for i, own_queue in enumerate(self._queues):
+            thread = threading.Thread(target=self._work, args=(own_queue,), name=f'webhook-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self.httpd.serve_forever, name='webhook-http', daemon=True).start()
+        return self
+
+    def stop(self):
+        """Перестает принимать запросы и дожидается обработки очередей."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for own_queue in self._queues:
+            own_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+
+def run(app):
+    """Запускает бота в режиме webhook. app — модуль main с обработчиками."""
+    from telebot import types
+
+    app.startup()
+    app.bot.threaded = False  # Обработчики выполняются прямо в рабочих потоках сервера
+    server = WebhookServer(
+        lambda data: app.bot.process_new_updates([types.Update.de_json(data)]),
+        host=os.environ.get('WEBHOOK_HOST', '127.0.0.1'),
+        port=int(os.environ.get('WEBHOOK_PORT', '8443')),
+        path=os.environ.get('WEBHOOK_PATH', '/webhook'),
+        secret=secret_from_env(),
+    ).start()
+    public_url = os.environ.get('WEBHOOK_URL')
+    if public_url:
+        app.bot.set_webhook(url=public_url, secret_token=server.secret)
+    print(f"Бот запускается (webhook, {server.address})...")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if public_url:
+            app.bot.remove_webhook()
+        server.stop()
+        print(f"Webhook: {server.get_stats()}")
+        app.shutdown()